@@ -0,0 +1,230 @@
+"""
+    Throughput benchmark of the generator on a synthetic corpus.
+
+    python -m benchmarks.run_benchmark --sizes 100,10000 --output benchmark.json --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.sp_corpus import write_corpus_dump, write_corpus_folder
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.dapper_handler_generator import DapperHandlerGenerator
+from dapper.dapper_request_generator import DapperRequestGenerator
+from dapper.dapper_return_type_generator import DapperReturnTypeGenerator
+from dapper.generation_manifest import generator_fingerprint
+from dapper.output_writer import OutputWriter
+from dapper.sql_file_reader import decode_sql_bytes
+from dapper.stored_procedure import StoredProcedure
+from dapper.template_engine import load_templates
+
+DEFAULT_SIZES = [100, 10_000, 100_000]
+
+# runs of each measure, the fastest is kept so one slow run from a noisy machine isn't reported as a regression
+DEFAULT_REPEAT = 3
+
+STAGES = ["decode", "parse", "type_inference", "render", "write"]
+
+ROOT_NAMESPACE = "Benchmark.Site"
+
+
+def measure_stages(sp_folder_path: str, output_folder_path: str) -> dict:
+    """
+        Runs every file of the folder through the generation stages one after the other in this process
+        and returns the total seconds spent in each stage.
+    """
+    templates = load_templates()
+    totals = dict.fromkeys(STAGES, 0.0)
+    clock = time.perf_counter
+
+    with OutputWriter(output_folder_path) as writer:
+        for file in sorted(os.listdir(sp_folder_path)):
+            started = clock()
+            with open(os.path.join(sp_folder_path, file), 'rb') as sp_file:
+                sp_text, _ = decode_sql_bytes(sp_file.read())
+            decoded = clock()
+
+            # the analysis is lazy, touch everything the emitters read so it is timed here
+            sp = StoredProcedure(sp_text)
+            for fact in ("sp_params_dict", "sp_type", "result_selects", "dynamic_params_section"):
+                getattr(sp, fact)
+            parsed = clock()
+
+            return_type_generator = DapperReturnTypeGenerator(sp, templates)
+            return_type_generator.generate_return_type()
+            inferred = clock()
+
+            request_class, return_class = DapperRequestGenerator(sp, return_type_generator, templates).generate()
+            handler_class = DapperHandlerGenerator(sp, return_type_generator, templates).generate()
+            outputs = [(f"{sp.sp_name}/{sp.sp_name}Request.cs", templates.render("file", namespace=ROOT_NAMESPACE, body=request_class)),
+                       (f"{sp.sp_name}/{sp.sp_name}Handler.cs", templates.render("file", namespace=ROOT_NAMESPACE, body=handler_class))]
+            if return_class:
+                outputs.append((f"{sp.sp_name}/{sp.sp_name}Result.cs", templates.render("file", namespace=ROOT_NAMESPACE, body=return_class)))
+            rendered = clock()
+
+            for relative_path, content in outputs:
+                writer.write(relative_path, content)
+            written = clock()
+
+            totals["decode"] += decoded - started
+            totals["parse"] += parsed - decoded
+            totals["type_inference"] += inferred - parsed
+            totals["render"] += rendered - inferred
+            totals["write"] += written - rendered
+
+    return totals
+
+
+def measure_best_stages(sp_folder_path: str, output_folder_path: str, repeat: int) -> dict:
+    """
+        Returns the fastest seconds of each stage over repeat runs of measure_stages.
+    """
+    best = None
+    for _ in range(repeat):
+        totals = measure_stages(sp_folder_path, output_folder_path)
+        shutil.rmtree(output_folder_path)
+        best = best and {stage: min(best[stage], seconds) for stage, seconds in totals.items()} or totals
+    return best
+
+
+def measure_run(run, repeat: int, trace_memory: bool) -> tuple[float, int | None]:
+    """
+        Returns the seconds of the fastest of repeat runs and the peak of the memory python allocated during
+        another, traced run. Tracing slows the run down, so the two are measured separately.
+
+        tracemalloc only sees the current process, the memory of worker processes isn't traced:
+        without trace_memory the peak is None.
+    """
+    seconds = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        seconds = seconds is None and elapsed or min(seconds, elapsed)
+
+    if not trace_memory:
+        return seconds, None
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark_size(count: int, work_folder_path: str, seed: int, workers: int, repeat: int = DEFAULT_REPEAT) -> dict:
+    sp_folder_path = os.path.join(work_folder_path, "sp")
+    dump_file_path = os.path.join(work_folder_path, "database.sql")
+    write_corpus_folder(sp_folder_path, count, seed)
+    write_corpus_dump(dump_file_path, count, seed)
+
+    stage_seconds = measure_best_stages(sp_folder_path, os.path.join(work_folder_path, "stages"), repeat)
+
+    # full runs, not incremental, so every run does the same work
+    file_generator = DapperFileGenerator(workers=workers, incremental=False)
+    folder_output_path = os.path.join(work_folder_path, "folder_output")
+    dump_output_path = os.path.join(work_folder_path, "dump_output")
+    # the renders of worker processes can't be traced, a peak of this process only would look like a gain
+    trace_memory = workers <= 1
+    folder_seconds, folder_peak = measure_run(
+        lambda: file_generator.generate(sp_folder_path, folder_output_path, ROOT_NAMESPACE), repeat, trace_memory)
+    dump_seconds, dump_peak = measure_run(
+        lambda: file_generator.generate_from_dump(dump_file_path, dump_output_path, ROOT_NAMESPACE), repeat, trace_memory)
+
+    return {
+        "procedures": count,
+        "corpus_bytes": os.path.getsize(dump_file_path),
+        "stages": {stage: {"seconds": seconds, "us_per_procedure": seconds / count * 1_000_000}
+                   for stage, seconds in stage_seconds.items()},
+        "folder": {"seconds": folder_seconds, "procedures_per_second": count / folder_seconds,
+                   "peak_memory_bytes": folder_peak},
+        "dump": {"seconds": dump_seconds, "procedures_per_second": count / dump_seconds,
+                 "peak_memory_bytes": dump_peak},
+    }
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    """
+        Prints the ratio of every timing to the baseline, for the sizes both have.
+        Returns the timings slower than the baseline by more than max_regression.
+        A peak memory missing from either side, a run with worker processes, isn't compared.
+    """
+    regressions = []
+    for size, result in results["sizes"].items():
+        base = baseline["sizes"].get(size)
+        if base is None:
+            continue
+        timings = [(stage, result["stages"][stage]["seconds"], base["stages"][stage]["seconds"]) for stage in STAGES]
+        timings += [(mode, result[mode]["seconds"], base[mode]["seconds"]) for mode in ("folder", "dump")]
+        timings += [(f"{mode} peak memory", result[mode]["peak_memory_bytes"], base[mode]["peak_memory_bytes"])
+                    for mode in ("folder", "dump")
+                    if result[mode]["peak_memory_bytes"] is not None and base[mode]["peak_memory_bytes"] is not None]
+
+        print(f"\n{size} procedures, current / baseline:")
+        for name, current, previous in timings:
+            ratio = previous and current / previous or 1.0
+            flag = ratio > max_regression and "  REGRESSION" or ""
+            print(f"  {name:<20} {ratio:6.2f}x{flag}")
+            if flag:
+                regressions.append(f"{size} {name}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the generator on a synthetic stored procedure corpus.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated procedure counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes of the folder and dump runs, the peak memory is only measured with 1")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="runs of each measure, the fastest one is kept")
+    parser.add_argument("--output", default="benchmark.json", help="json file the results are saved to")
+    parser.add_argument("--baseline", help="json results of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=1.2,
+                        help="ratio to the baseline above which the benchmark fails")
+    args = parser.parse_args(argv)
+
+    results = {
+        "generator_version": generator_fingerprint(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "workers": args.workers,
+        "repeat": args.repeat,
+        "sizes": {}
+    }
+
+    for count in map(int, args.sizes.split(",")):
+        with tempfile.TemporaryDirectory(prefix="dapper_benchmark_") as work_folder_path:
+            result = benchmark_size(count, work_folder_path, args.seed, args.workers, max(1, args.repeat))
+        results["sizes"][str(count)] = result
+
+        stages = ", ".join(f'{stage} {result["stages"][stage]["us_per_procedure"]:.0f}us' for stage in STAGES)
+        runs = "; ".join(f'{mode} {result[mode]["procedures_per_second"]:.0f}/s' + (
+            result[mode]["peak_memory_bytes"] is not None and f', peak {result[mode]["peak_memory_bytes"] // 1024} KB' or '')
+            for mode in ("folder", "dump"))
+        print(f'{count} procedures: {stages} per procedure; {runs}')
+
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Saved the results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} timings regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
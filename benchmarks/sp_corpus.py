@@ -0,0 +1,166 @@
+import os
+import random
+
+# the shapes of the procedures in main.py and get_sp_definition.py, and how often each is generated
+PROCEDURE_KINDS = [
+    ("wide_query", 35),
+    ("single_row_query", 15),
+    ("star_query", 10),
+    ("out_command", 20),
+    ("tvp_command", 10),
+    ("update_command", 10),
+]
+
+TABLES = ["tblAlert", "tblAlertTrigger", "tblLocation", "tblUser", "tblTenant", "tblDevice", "tblReading",
+          "vwUserWithBranding", "tblAlertNotificationUserMapping", "tblAlertSeverityImageUrl"]
+
+# the suffixes and prefixes the return type generator guesses the C# type from
+COLUMN_STEMS = ["alert", "trigger", "location", "user", "tenant", "device", "reading", "severity", "branding",
+                "notification", "permission", "login", "email", "mobile", "first", "last", "full", "sender"]
+COLUMN_SUFFIXES = ["id", "name", "date", "time", "url", "count", "value", "email", "description", "state_id"]
+COLUMN_PREFIXES = ["", "", "", "is_", "has_"]
+
+PARAM_TYPES = ["INT", "BIGINT", "BIT", "DATETIME", "VARCHAR(50)", "NVARCHAR(255)", "DECIMAL(18, 2)",
+               "UNIQUEIDENTIFIER"]
+TVP_TYPES = ["tpIntTable", "tpBigIntTable", "tpStringTable"]
+
+AUTHORS = ["Ramy El Sersy", "Justin Wilkinson"]
+
+
+def column_name(rng: random.Random) -> str:
+    return f"{rng.choice(COLUMN_PREFIXES)}{rng.choice(COLUMN_STEMS)}_{rng.choice(COLUMN_SUFFIXES)}"
+
+
+def params_section(rng: random.Random, count: int, out_count: int = 0, tvp: bool = False) -> tuple[list[str], list[str]]:
+    """
+        Returns the parameter declarations and their names.
+    """
+    names = [f"@{rng.choice(COLUMN_STEMS)}_{rng.choice(COLUMN_SUFFIXES)}_{index}" for index in range(count)]
+    declarations = []
+    for index, name in enumerate(names):
+        direction = index < out_count and " OUT" or ""
+        declarations.append(f"{name} {rng.choice(PARAM_TYPES)}{direction}")
+    if tvp:
+        names.append(f"@tbl{rng.choice(COLUMN_STEMS).capitalize()}Ids")
+        declarations.append(f"{names[-1]} {rng.choice(TVP_TYPES)} READONLY")
+    return declarations, names
+
+
+def procedure_body(kind: str, rng: random.Random, param_names: list[str], out_count: int) -> str:
+    table = rng.choice(TABLES)
+    alias = "t"
+    filter_param = param_names and param_names[-1] or "1"
+
+    if kind == "wide_query":
+        columns = [f"{alias}.{column_name(rng)}" for _ in range(rng.randint(10, 60))]
+        column_list = ",\n\t\t".join(columns)
+        return (f"\tSELECT {column_list}\n"
+                f"\tFROM {table} {alias}\n"
+                f"\tRIGHT JOIN (\n"
+                f"\t\tSELECT DISTINCT user_id\n"
+                f"\t\tFROM tblAlertNotificationUserMapping\n"
+                f"\t\tWHERE alert_trigger_id = {filter_param}\n"
+                f"\t) tMapped\n"
+                f"\t\tON tMapped.user_id = {alias}.user_id\n"
+                f"\tWHERE {alias}.user_id IS NOT NULL\n"
+                f"\tORDER BY {alias}.{columns[0].split('.')[-1]};\n")
+
+    if kind == "single_row_query":
+        columns = [f"{column_name(rng)} = {alias}.{column_name(rng)}" for _ in range(rng.randint(3, 12))]
+        column_list = ",\n\t\t".join(columns)
+        return (f"\tSELECT TOP 1 {column_list}\n"
+                f"\tFROM {table} {alias}\n"
+                f"\tWHERE {alias}.alert_id = {filter_param};\n")
+
+    if kind == "star_query":
+        return (f"\tSELECT *\n"
+                f"\tFROM {table}\n"
+                f"\tORDER BY {column_name(rng)};\n")
+
+    if kind == "tvp_command":
+        return (f"\tINSERT INTO {table}\n"
+                f"\t(trigger_id, location_id)\n"
+                f"\tSELECT {param_names[0]}, id\n"
+                f"\tFROM {param_names[-1]}\n"
+                f"\tWHERE NOT EXISTS (SELECT * FROM {table} WHERE trigger_id = {param_names[0]} AND location_id = id);\n\n"
+                f"\tEXEC usp_system_update_parameter @name = 'refreshalerts', @value = '1';\n")
+
+    assignments = ",\n\t\t".join(f"{column_name(rng)} = {name}" for name in param_names[out_count:] or ["1"])
+    body = (f"\tSET NOCOUNT ON\n\n"
+            f"\tUPDATE {table}\n"
+            f"\tSET {assignments},\n"
+            f"\t\ttime_acknowledged = SYSUTCDATETIME()\n"
+            f"\tWHERE alert_id = {filter_param}\n"
+            f"\t\tAND alert_state_id < 254\n")
+    for name in param_names[:out_count]:
+        body += f"\n\tSELECT {name} = @@ROWCOUNT\n"
+    return body
+
+
+def generate_procedure(index: int, rng: random.Random) -> tuple[str, str]:
+    """
+        Returns the name and the scripted text of one procedure, with the SET, DROP and header comment batches
+        SSMS scripts around it.
+    """
+    kind = rng.choices([kind for kind, _ in PROCEDURE_KINDS], [weight for _, weight in PROCEDURE_KINDS])[0]
+    out_count = kind == "out_command" and rng.randint(1, 3) or 0
+    declarations, param_names = params_section(rng, rng.randint(1, 8) + out_count, out_count, kind == "tvp_command")
+
+    # the generator tells queries from commands by the name, like the procedures of the samples
+    name = kind.endswith("_query") and f"usp_get_bench_{kind}_{index}" or f"usp_bench_{kind}_{index}"
+    params = ",\n\t".join(declarations)
+    body = procedure_body(kind, rng, param_names, out_count)
+
+    text = (f"SET ANSI_NULLS ON\n"
+            f"GO\n"
+            f"SET QUOTED_IDENTIFIER ON\n"
+            f"GO\n"
+            f"IF EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[{name}]') AND type in (N'P', N'PC'))\n"
+            f"DROP PROC [dbo].[{name}]\n"
+            f"GO\n"
+            f"-- =============================================\n"
+            f"-- Author:\t\t{rng.choice(AUTHORS)}\n"
+            f"-- Create date: {rng.randint(1, 28):02}/{rng.randint(1, 12):02}/{rng.randint(2012, 2023)}\n"
+            f"-- Description:\tBenchmark procedure {index}\n"
+            f"-- =============================================\n"
+            f"CREATE PROCEDURE [dbo].[{name}]\n"
+            f"\t{params}\n"
+            f"AS\n"
+            f"BEGIN\n"
+            f"{body}"
+            f"END\n"
+            f"GO\n")
+    return name, text
+
+
+def iter_procedures(count: int, seed: int = 0):
+    """
+        Yields count (name, text) procedures. The same seed always gives the same corpus.
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        yield generate_procedure(index, rng)
+
+
+def write_corpus_folder(folder_path: str, count: int, seed: int = 0) -> int:
+    """
+        Writes one .sql file per procedure, like a folder scripted from SSMS. Returns the characters written.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    size = 0
+    for name, text in iter_procedures(count, seed):
+        with open(os.path.join(folder_path, f"{name}.sql"), 'w', encoding='utf-8', newline='\r\n') as file:
+            size += file.write(text)
+    return size
+
+
+def write_corpus_dump(file_path: str, count: int, seed: int = 0) -> int:
+    """
+        Writes every procedure to a single GO separated script, like a database scripted to one file.
+        Returns the characters written.
+    """
+    size = 0
+    with open(file_path, 'w', encoding='utf-8', newline='\r\n') as file:
+        for _, text in iter_procedures(count, seed):
+            size += file.write(text)
+    return size
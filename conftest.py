@@ -0,0 +1 @@
+# the dapper and diretory_props_helper folders are imported from the repository root, as main.py does
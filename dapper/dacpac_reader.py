@@ -0,0 +1,208 @@
+import zipfile
+from xml.etree.ElementTree import iterparse
+from dapper.sp_utils import SIZED_SQL_TYPES, DECIMAL_SQL_TYPES, TIME_SQL_TYPES
+from dapper.stored_procedure import StoredProcedure
+
+# the model of a dacpac, a zip file
+MODEL_FILE_NAME = "model.xml"
+
+# the element of the model describing a stored procedure and the one describing each of its params
+PROCEDURE_ELEMENT_TYPE = "SqlProcedure"
+PARAM_ELEMENT_TYPE = "SqlSubroutineParameter"
+
+# the elements of the user defined types: CREATE TYPE dbo.Email FROM NVARCHAR(256) and CREATE TYPE ... AS TABLE
+ALIAS_TYPE_ELEMENT_TYPE = "SqlUserDefinedDataType"
+TABLE_TYPE_ELEMENT_TYPE = "SqlTableType"
+
+
+def local_name(tag: str) -> str:
+    # {http://schemas.microsoft.com/sqlserver/dac/Serialization/2012/02}Element -> Element
+    return tag.rpartition('}')[2]
+
+
+def children(element, name: str):
+    return (child for child in element if local_name(child.tag) == name)
+
+
+def properties(element) -> dict[str, str]:
+    """
+        Returns the <Property Name="..." Value="..."/> of an element. Scripts are in a <Value> child instead.
+    """
+    values = {}
+    for child in children(element, "Property"):
+        value = child.get("Value")
+        if value is None:
+            value = "".join(value_element.text or "" for value_element in children(child, "Value"))
+        values[child.get("Name")] = value
+    return values
+
+
+def relationship(element, name: str):
+    """
+        Returns the elements and references of the entries of a relationship of an element.
+    """
+    for child in children(element, "Relationship"):
+        if child.get("Name") == name:
+            return [item for entry in children(child, "Entry") for item in entry]
+    return []
+
+
+def last_name_part(name: str) -> str:
+    # [dbo].[usp_get_alerts].[@alert_id] -> @alert_id
+    return name.rpartition('.')[2].strip('[]')
+
+
+def type_reference(element):
+    """
+        Returns the reference to the type of a param or an alias type, and the properties holding its length,
+        precision and scale. The type is either a reference, with the facets on the element itself,
+        or a SqlTypeSpecifier with its facets and a reference to the type.
+    """
+    for item in relationship(element, "Type"):
+        if local_name(item.tag) == "References":
+            return item, properties(element)
+        reference = next((reference for reference in relationship(item, "Type")
+                          if local_name(reference.tag) == "References"), None)
+        if reference is not None:
+            return reference, properties(item)
+    return None, {}
+
+
+def builtin_type(name: str, type_properties: dict[str, str]) -> str:
+    """
+        Returns a built-in type as it is declared in a script, [nvarchar] with Length 60 -> NVARCHAR(60).
+    """
+    sql_type = name.strip('[]').upper()
+    if sql_type in SIZED_SQL_TYPES:
+        size = type_properties.get("IsMax") == "True" and "MAX" or type_properties.get("Length")
+        return size and f"{sql_type}({size})" or sql_type
+    if sql_type in DECIMAL_SQL_TYPES:
+        precision, scale = DECIMAL_SQL_TYPES[sql_type]
+        return f"{sql_type}({type_properties.get('Precision', precision)}, {type_properties.get('Scale', scale)})"
+    if sql_type in TIME_SQL_TYPES and "Scale" in type_properties:
+        return f"{sql_type}({type_properties['Scale']})"
+    return sql_type
+
+
+def param_type(param_element, user_types: dict[str, tuple[str, bool]] | None = None) -> tuple[str, bool]:
+    """
+        Returns the type of a param as it is declared in a script, NVARCHAR(60), and whether it is a table type.
+
+        A user defined type is looked up in user_types, see read_user_types: an alias type is declared as
+        its built-in type and a table type by its name. A type the model doesn't define is declared by its name
+        and isn't taken for a table type, a table type param is READONLY in the model anyway.
+    """
+    reference, type_properties = type_reference(param_element)
+    if reference is None:
+        # a param without a type in the model, the generators fall back to a string
+        return "SQL_VARIANT", False
+    if reference.get("ExternalSource") == "BuiltIns":
+        return builtin_type(reference.get("Name"), type_properties), False
+    name = reference.get("Name")
+    return (user_types or {}).get(name, (name, False))
+
+
+def param_declaration(param_element, user_types: dict[str, tuple[str, bool]] | None = None) -> str:
+    """
+        @alert_id INT = NULL OUTPUT, from the metadata of a param.
+    """
+    param_properties = properties(param_element)
+    sql_type, table_type = param_type(param_element, user_types)
+    declaration = f"{last_name_part(param_element.get('Name'))} {sql_type}"
+    if param_properties.get("DefaultExpressionScript"):
+        declaration += f" = {param_properties['DefaultExpressionScript'].strip()}"
+    if param_properties.get("IsOutput") == "True":
+        declaration += " OUTPUT"
+    if table_type or param_properties.get("IsReadOnly") == "True":
+        declaration += " READONLY"
+    return declaration
+
+
+def procedure_script(procedure_element, user_types: dict[str, tuple[str, bool]] | None = None) -> str:
+    """
+        Returns the CREATE PROCEDURE script of a procedure of the model, built from its params and its body.
+
+        The model keeps the body of a procedure without its header, the header is declared again from the
+        metadata of the params so the script goes through the same parsing as a scripted .sql file.
+        The comments before CREATE PROCEDURE are not in the model, annotations must be in the body.
+    """
+    declarations = [param_declaration(param, user_types) for param in relationship(procedure_element, "Parameters")
+                    if param.get("Type") == PARAM_ELEMENT_TYPE]
+    body = properties(procedure_element).get("BodyScript", "")
+    params = declarations and "\n\t" + ",\n\t".join(declarations) or ""
+    return f"CREATE PROCEDURE {procedure_element.get('Name')}{params}\nAS\n{body.strip()}\n"
+
+
+def iter_model_elements(model_file):
+    """
+        Yields the top level elements of a model.xml file object.
+
+        The model is read with an incremental parser and every top level element is dropped once yielded,
+        so only one element is in memory at a time whatever the size of the model.
+    """
+    depth = 0
+    model = None
+    for event, element in iterparse(model_file, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            # DataSchemaModel > Model > Element
+            if depth == 2:
+                model = element
+            continue
+
+        depth -= 1
+        if depth != 2:
+            continue
+        if local_name(element.tag) == "Element":
+            yield element
+        model.clear()
+
+
+def read_user_types(model_file) -> dict[str, tuple[str, bool]]:
+    """
+        Returns the user defined types of a model.xml file object by name, as param_type returns them:
+        {"[dbo].[Email]": ("NVARCHAR(256)", False), "[dbo].[tpIntTable]": ("[dbo].[tpIntTable]", True)}
+    """
+    user_types = {}
+    for element in iter_model_elements(model_file):
+        name = element.get("Name")
+        if element.get("Type") == TABLE_TYPE_ELEMENT_TYPE:
+            user_types[name] = name, True
+        elif element.get("Type") == ALIAS_TYPE_ELEMENT_TYPE:
+            reference, type_properties = type_reference(element)
+            if reference is not None and reference.get("ExternalSource") == "BuiltIns":
+                user_types[name] = builtin_type(reference.get("Name"), type_properties), False
+    return user_types
+
+
+def iter_model_procedures(model_file, user_types: dict[str, tuple[str, bool]] | None = None):
+    """
+        Yields the (name, CREATE PROCEDURE script) of the procedures of a model.xml file object.
+        Only one procedure is in memory at a time, see iter_model_elements.
+    """
+    for element in iter_model_elements(model_file):
+        if element.get("Type") == PROCEDURE_ELEMENT_TYPE:
+            yield element.get("Name"), procedure_script(element, user_types)
+
+
+def iter_procedures(dacpac_path: str):
+    """
+        Yields the procedures of a .dacpac, or of a model.xml extracted from one, as (name, StoredProcedure).
+
+        model.xml is decompressed from the zip file as it is parsed, nothing is written to disk. It is read twice,
+        the user defined types first, they can be anywhere in the model and the params are declared with them.
+    """
+    if not zipfile.is_zipfile(dacpac_path):
+        with open(dacpac_path, 'rb') as model_file:
+            user_types = read_user_types(model_file)
+            model_file.seek(0)
+            yield from ((name, StoredProcedure(script))
+                        for name, script in iter_model_procedures(model_file, user_types))
+        return
+
+    with zipfile.ZipFile(dacpac_path) as dacpac:
+        with dacpac.open(MODEL_FILE_NAME) as model_file:
+            user_types = read_user_types(model_file)
+        with dacpac.open(MODEL_FILE_NAME) as model_file:
+            yield from ((name, StoredProcedure(script))
+                        for name, script in iter_model_procedures(model_file, user_types))
@@ -1,81 +1,644 @@
-import os
-import chardet
-from dapper.dapper_generator import DapperGenerator
-from dapper.sp_utils import SPUtils
-from dapper.dapper_handler_generator import DapperHandlerGenerator
-from dapper.dapper_request_generator import DapperRequestGenerator
-
-
-class DapperFileGenerator:
-    def generate(self, sp_folder_path: str, output_folder_path: str, root_namespace: str):
-        """
-            Read all the sql file in the given folder and generate the request and handler classes for them.
-        """
-        files = os.listdir(sp_folder_path)
-        files_sql = filter(lambda file: file.endswith('.sql'), files)
-
-        for file in files_sql:
-            # read the contents of the file
-            file_path = os.path.join(sp_folder_path, file)
-
-            # Detect the encoding of the file
-            with open(file_path, 'rb') as file:
-                result = chardet.detect(file.read())
-
-            with open(file_path, 'r', encoding=result['encoding']) as file:
-                sp_text = file.read()
-                dapper_generator = DapperGenerator(sp_text)
-
-                namespace = f"{root_namespace}.{sp_folder_path}"
-                request_class, return_class = dapper_generator.generate_request_class()
-                handler_class = dapper_generator.generate_handler_class()
-
-                # queries will be in a folder called queries and commands will be in a folder called commands
-                # the namespace will be root_namespace + SP_TYPE (query or command) + SP_NAME
-                sp_type_folder_path = dapper_generator.sp_is_query and 'Queries' or 'Commands'
-                sp_name = dapper_generator.sp_name
-                namespace = f"{namespace}.{sp_type_folder_path}.{sp_name}"
-                # split the namespace by dot and
-                # convert the namespace to pascal case
-                namespace = '.'.join(
-                    map(lambda x: SPUtils.to_pascal_case(x), namespace.split('.')))
-                sp_name_pascal_case = SPUtils.to_pascal_case(sp_name)
-
-                # add the namespace to the classes. use file scope namespace
-                request_class = f"namespace {namespace};\n\n{request_class}"
-                if return_class:
-                    return_class = f"namespace {namespace};\n\n{return_class}"
-                handler_class = f"namespace {namespace};\n\n{handler_class}"
-
-                request_file_name = SPUtils.to_pascal_case(
-                    f"{sp_name}_{dapper_generator.sp_type}.cs")
-                return_file_name = SPUtils.to_pascal_case(
-                    f"{sp_name}_Result.cs")
-                handler_file_name = SPUtils.to_pascal_case(
-                    f"{sp_name}_Handler.cs")
-                # PascalCase the file names
-                request_folder_path = os.path.join(
-                    output_folder_path, sp_type_folder_path, sp_name_pascal_case, request_file_name)
-                return_folder_path = os.path.join(
-                    output_folder_path, sp_type_folder_path, sp_name_pascal_case, return_file_name)
-                handler_folder_path = os.path.join(
-                    output_folder_path, sp_type_folder_path, sp_name_pascal_case, handler_file_name)
-
-                os.makedirs(os.path.dirname(
-                    request_folder_path), exist_ok=True)
-                if return_class:
-                    os.makedirs(os.path.dirname(
-                        return_folder_path), exist_ok=True)
-                os.makedirs(os.path.dirname(
-                    handler_folder_path), exist_ok=True)
-
-                # write the classes to files
-                with open(request_folder_path, 'w') as request_file:
-                    request_file.write(request_class)
-
-                if return_class:
-                    with open(return_folder_path, 'w') as return_file:
-                        return_file.write(return_class)
-
-                with open(handler_folder_path, 'w') as handler_file:
-                    handler_file.write(handler_class)
+import fnmatch
+import os
+import posixpath
+import sys
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from dapper.dacpac_reader import iter_procedures as iter_dacpac_procedures
+from dapper.dapper_generator import DapperGenerator
+from dapper.generation_manifest import GenerationManifest, cached_queries, hash_bytes, hash_text, unresolved_invalidations
+from dapper.generation_pipeline import DEFAULT_STAGE_BUFFER, bounded_stage
+from dapper.generation_profiler import GenerationProfiler, StageTimings
+from dapper.output_bundler import OutputBundler
+from dapper.output_writer import DEFAULT_MAX_PENDING_WRITES, OutputWriter
+from dapper.schema_index import load_schema_index
+from dapper.sp_utils import SPUtils
+from dapper.sql_discovery import iter_sql_files
+from dapper.sql_dump_reader import iter_procedures
+from dapper.sql_file_reader import decode_sql_bytes
+from dapper.template_engine import Templates, load_templates
+from dapper.dapper_handler_generator import DapperHandlerGenerator
+from dapper.dapper_request_generator import DapperRequestGenerator
+
+# chunk size used when the number of tasks isn't known up front
+DEFAULT_CHUNK_SIZE = 16
+
+# chunks sent to each worker of the pool ahead of the results written
+DEFAULT_CHUNKS_IN_FLIGHT = 2
+
+# bundle modes, see DapperFileGenerator. A dict of procedure name patterns -> group name is a bundle mode too
+BUNDLE_PER_PROCEDURE = "procedure"
+BUNDLE_PER_FOLDER = "folder"
+
+
+def render_sp_file(task: tuple[str, str, str, str | None, str | None, str | None, dict | None, str | dict | None, tuple | None]) -> dict:
+    """
+        Reads, parses and renders a single SQL file. Runs in a worker process when generating in parallel,
+        so it must be a module level function and it must never raise.
+        The file is not read again when the task carries it, read ahead by DapperFileGenerator.read_file.
+
+        Returns a dict with the source, the rendered output files as (relative path, content) tuples,
+        the error message if the file could not be generated, the stage timings and counters
+        and the cache links of the procedure, see DapperFileGenerator.render_outputs.
+    """
+    file_path, sp_folder_path, root_namespace, encoding_hint, template_folder, schema_index_path, annotation_patterns, bundle, sp_file = task
+    timings = sp_file and sp_file[2] or StageTimings()
+    cache_links = {}
+    # the manifest key, the path relative to the sp folder with / separators
+    source = os.path.relpath(file_path, sp_folder_path).replace(os.sep, '/')
+    try:
+        source_stat, outputs = DapperFileGenerator.render_file(
+            file_path, sp_folder_path, root_namespace, encoding_hint, template_folder, timings, schema_index_path,
+            annotation_patterns, sp_file and sp_file[:2] or None, bundle, posixpath.dirname(source), cache_links)
+        return {
+            "file": file_path,
+            "source": source,
+            "source_stat": source_stat,
+            "outputs": outputs,
+            "error": None,
+            "timings": timings.stages,
+            "counters": timings.counters,
+            "cache_links": cache_links
+        }
+    except Exception:
+        return {
+            "file": file_path,
+            "source": source,
+            "source_stat": None,
+            "outputs": [],
+            "error": traceback.format_exc(),
+            "timings": timings.stages,
+            "counters": timings.counters,
+            "cache_links": {}
+        }
+
+
+def render_sp_text(task: tuple[str, str, str, str, str, str | None, str | None, dict | None, str | dict | None]) -> dict:
+    """
+        Parses and renders one procedure of a dump file. Same contract as render_sp_file.
+    """
+    file_path, source, sp_text, namespace_folder, root_namespace, template_folder, schema_index_path, annotation_patterns, bundle = task
+    timings = StageTimings()
+    cache_links = {}
+    try:
+        return {
+            "file": file_path,
+            "source": source,
+            "source_stat": {"hash": hash_text(sp_text)},
+            "outputs": DapperFileGenerator.render_text(
+                sp_text, namespace_folder, root_namespace, template_folder, timings, schema_index_path, annotation_patterns,
+                bundle, cache_links=cache_links),
+            "error": None,
+            "timings": timings.stages,
+            "counters": timings.counters,
+            "cache_links": cache_links
+        }
+    except Exception:
+        return {
+            "file": file_path,
+            "source": source,
+            "source_stat": None,
+            "outputs": [],
+            "error": traceback.format_exc(),
+            "timings": timings.stages,
+            "counters": timings.counters,
+            "cache_links": {}
+        }
+
+
+def render_chunk(render, tasks: list) -> list[dict]:
+    return [render(task) for task in tasks]
+
+
+class DapperFileGenerator:
+    def __init__(self, workers: int | None = 1, chunk_size: int | None = None, incremental: bool = True,
+                 template_folder: str | None = None, write_threads: int = 0, profiler: GenerationProfiler | None = None,
+                 schema_index_path: str | None = None, annotation_patterns: dict[str, str] | None = None,
+                 read_ahead: int = DEFAULT_STAGE_BUFFER, chunks_in_flight: int = DEFAULT_CHUNKS_IN_FLIGHT,
+                 max_pending_writes: int = DEFAULT_MAX_PENDING_WRITES,
+                 include: list[str] | None = None, exclude: list[str] | None = None, shard: tuple[int, int] | None = None,
+                 bundle: str | dict[str, str] | None = None, verbose: bool = False):
+        """
+            workers: number of worker processes. 1 generates in the current process, None uses every core.
+            chunk_size: number of files sent to a worker at a time. None picks a size from the file count.
+            incremental: skip the sql files that did not change since the last run, using the manifest in the output folder.
+            template_folder: folder with *.cs.template files overriding the default templates in dapper/templates.
+            write_threads: number of threads flushing the output files, for slow or network file systems. 0 writes inline.
+            profiler: collects the stage timings and counters of every run, see GenerationProfiler.
+            schema_index_path: index file built by dapper.schema_index, types the result columns from the database schema.
+            annotation_patterns: annotations applied to the procedures by name, e.g. {"usp_report_*": "stream"}.
+                An annotation written in the script wins.
+            include, exclude: globs matched against the path of a sql file relative to the sp folder, with / separators.
+                The default includes *.sql, which matches the files of every sub folder.
+            shard: (index, count) generates only the files whose path hashes to that shard, see dapper.sql_discovery.
+                Each CI agent generates one shard to its own output folder and dapper.shard_merge combines them.
+            bundle: writes the classes of many procedures to the same file instead of three files per procedure.
+                "procedure" writes one file per procedure, Queries/GetAlerts.cs, "folder" one file per folder,
+                Queries.cs and Commands.cs. A dict of procedure name patterns -> group name, {"usp_alert_*": "Alerts"},
+                writes a file per group, Alerts.cs, the procedures no pattern matches go to their folder file.
+            verbose: prints the traceback of a file that failed to generate, not only its error message.
+                Errors are printed to stderr, the summary of the run to stdout.
+
+            The backpressure settings bound what each stage of the pipeline holds ahead of the next one:
+            read_ahead: sources discovered, checked against the manifest and, in the current process, read
+                by a thread ahead of the parser. 0 does it inline.
+            chunks_in_flight: chunks of tasks sent to each worker process ahead of the writes.
+            max_pending_writes: rendered files waiting for a write thread.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.template_folder = template_folder
+        self.write_threads = write_threads
+        self.profiler = profiler
+        self.schema_index_path = schema_index_path
+        self.annotation_patterns = annotation_patterns
+        self.read_ahead = read_ahead
+        self.chunks_in_flight = max(1, chunks_in_flight)
+        self.max_pending_writes = max_pending_writes
+        self.include = include
+        self.exclude = exclude
+        self.shard = shard
+        if isinstance(bundle, str) and bundle not in (BUNDLE_PER_PROCEDURE, BUNDLE_PER_FOLDER):
+            raise ValueError(f"unknown bundle mode {bundle!r}, use {BUNDLE_PER_PROCEDURE!r}, {BUNDLE_PER_FOLDER!r} or a dict of patterns")
+        if bundle and shard:
+            raise ValueError("bundled outputs are shared by the files of every shard, a sharded run can't bundle them")
+        self.bundle = bundle
+        self.verbose = verbose
+        # files and bytes written by the last run
+        self.write_stats = {}
+
+    def generate(self, sp_folder_path: str, output_folder_path: str, root_namespace: str) -> list[dict]:
+        """
+            Read all the sql file in the given folder and its sub folders and generate the request and handler
+            classes for them.
+
+            Files are processed in name order and written in that same order, whatever the worker count.
+            A file that fails to generate does not stop the run, it is reported and returned in the error list.
+
+            The files stream through the pipeline one at a time, a file is discovered, read, parsed, rendered
+            and written and only its name and manifest entry are kept, so memory use doesn't grow with the folder.
+
+            In incremental mode the sql files recorded unchanged in the manifest are skipped, outputs with the
+            same content are not rewritten and the outputs of deleted sql files are removed.
+        """
+        manifest = self.open_manifest(output_folder_path, root_namespace, sp_folder_path)
+        sources = set()
+
+        def files():
+            for file in iter_sql_files(sp_folder_path, self.include, self.exclude, self.shard):
+                sources.add(file)
+                yield file
+
+        return self.generate_files(sp_folder_path, output_folder_path, root_namespace, files(), manifest, sources)
+
+    def open_manifest(self, output_folder_path: str, root_namespace: str, sp_folder_path: str) -> GenerationManifest:
+        """
+            Returns the manifest of a folder run, loaded from the output folder in incremental mode.
+        """
+        manifest = GenerationManifest(
+            output_folder_path, f"{root_namespace}\n{sp_folder_path}\n{self.templates_hash()}\n{self.schema_index_hash()}\n{self.annotation_patterns}\n{self.bundle}")
+        if self.incremental:
+            manifest.load()
+        return manifest
+
+    def generate_files(self, sp_folder_path: str, output_folder_path: str, root_namespace: str, files: list[str],
+                       manifest: GenerationManifest, sources: set[str]) -> list[dict]:
+        """
+            Generates the given sql files of the folder. sources is every sql file of the folder,
+            the outputs of the files the manifest knows that are not in sources are removed.
+
+            files can be a lazy iterable filling sources as it goes, it is only complete once every file is written.
+        """
+        # a worker process reads its own files, reading them here would only add their pickling to the pool
+        read_files = self.workers <= 1 and self.read_ahead > 0
+
+        def tasks():
+            for file in files:
+                file_path = os.path.join(sp_folder_path, file)
+                if self.incremental and manifest.is_unchanged(file, file_path, output_folder_path):
+                    self.count('sources_unchanged')
+                    continue
+                # the encoding detected by the last run is tried before falling back to chardet
+                yield (file_path, sp_folder_path, root_namespace, manifest.encoding(file), self.template_folder,
+                       self.schema_index_path, self.annotation_patterns, self.bundle,
+                       read_files and self.read_file(file_path) or None)
+
+        task_count = isinstance(files, (list, set)) and len(files) or None
+        results = self.render_tasks(render_sp_file, bounded_stage(tasks(), self.read_ahead), task_count)
+        return self.write_results(results, output_folder_path, manifest, sources)
+
+    @staticmethod
+    def read_file(file_path: str) -> tuple[os.stat_result, bytes, StageTimings] | None:
+        """
+            Reads a sql file ahead of its task, with the timings of the read.
+            A file that can't be read is left to the task, which reads it again and reports the error.
+        """
+        timings = StageTimings()
+        try:
+            with timings.stage('read'), open(file_path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                sp_bytes = file.read()
+        except OSError:
+            return None
+        timings.count('bytes_read', len(sp_bytes))
+        return stat, sp_bytes, timings
+
+    def generate_from_dump(self, dump_file_path: str, output_folder_path: str, root_namespace: str,
+                           namespace_folder: str | None = None) -> list[dict]:
+        """
+            Generate the request and handler classes for every CREATE PROCEDURE batch of a scripted database file.
+
+            The file is memory mapped and split on its GO batches one procedure at a time, so memory use stays flat
+            whatever the size of the file. The procedures go through the same pipeline as the files of a folder.
+            namespace_folder plays the part of the sp folder in the namespace, it defaults to the dump file name.
+        """
+        return self.generate_procedures(iter_procedures(dump_file_path), dump_file_path, output_folder_path,
+                                        root_namespace, namespace_folder)
+
+    def generate_from_dacpac(self, dacpac_path: str, output_folder_path: str, root_namespace: str,
+                             namespace_folder: str | None = None) -> list[dict]:
+        """
+            Generate the request and handler classes for every procedure of a .dacpac, or of its model.xml.
+
+            The model is streamed out of the zip file by an incremental XML parser, the script of each procedure
+            is built from its params and body in the model and goes through the same pipeline as a dump file,
+            without scripting the database or writing any file but the outputs.
+        """
+        return self.generate_procedures(iter_dacpac_procedures(dacpac_path), dacpac_path, output_folder_path,
+                                        root_namespace, namespace_folder)
+
+    def generate_procedures(self, procedures, input_path: str, output_folder_path: str, root_namespace: str,
+                            namespace_folder: str | None = None) -> list[dict]:
+        """
+            Generates the (position in the input, StoredProcedure) of a file holding several procedures.
+        """
+        input_file_name = os.path.basename(input_path)
+        namespace_folder = namespace_folder or os.path.splitext(input_file_name)[0]
+
+        manifest = GenerationManifest(
+            output_folder_path,
+            f"{root_namespace}\n{namespace_folder}\n{input_file_name}\n{self.templates_hash()}\n{self.schema_index_hash()}\n{self.annotation_patterns}\n{self.bundle}")
+        if self.incremental:
+            manifest.load()
+
+        sources = set()
+
+        def tasks():
+            for position, sp in procedures:
+                # the manifest key of a procedure is its name, its position in the input can change
+                source = f"{input_file_name}:{sp.sp_name or position}"
+                sources.add(source)
+                if self.incremental and manifest.is_unchanged_hash(source, hash_text(sp.sp_text), output_folder_path):
+                    self.count('sources_unchanged')
+                    continue
+                yield (f"{input_path}:{position}", source, sp.sp_text, namespace_folder, root_namespace,
+                       self.template_folder, self.schema_index_path, self.annotation_patterns, self.bundle)
+
+        # the input is split in a thread while the procedures before are rendered
+        results = self.render_tasks(render_sp_text, bounded_stage(tasks(), self.read_ahead))
+        return self.write_results(results, output_folder_path, manifest, sources)
+
+    def count(self, name: str, amount: int = 1):
+        if self.profiler:
+            self.profiler.count(name, amount)
+
+    def templates_hash(self) -> str:
+        return load_templates(self.template_folder).source_hash
+
+    def schema_index_hash(self) -> str:
+        # a new schema changes the result types, every file is regenerated
+        return self.schema_index_path and load_schema_index(self.schema_index_path).source_hash or ""
+
+    def write_results(self, results, output_folder_path: str, manifest: GenerationManifest, sources: set[str]) -> list[dict]:
+        """
+            Writes the rendered outputs in the order of the results and updates the manifest.
+
+            Outputs with the same content as the last run are not rewritten. The outputs of sources that are gone
+            and the outputs a source doesn't generate anymore are removed once every result is written,
+            sources is only complete then when the tasks are streamed.
+
+            With a bundle the outputs are the sections of the sources in their bundles, a stale output
+            is a section removed from its bundle, see OutputBundler.
+
+            A command clearing the cache of queries with @dapper:invalidates is written last, once every query
+            is recorded. When one of them isn't a query generated with @dapper:cache in the same folder the command
+            fails to generate, and its outputs of an earlier run are removed, instead of calling a class
+            that doesn't exist. A sharded run only knows the queries of its shard, shard_merge checks them.
+        """
+        errors = []
+        stale_outputs = []
+        task_count = 0
+        with OutputWriter(output_folder_path, self.write_threads, self.max_pending_writes) as writer:
+            bundler = self.bundle and OutputBundler(writer, manifest.outputs()) or None
+
+            def write_result(result: dict):
+                source = result["source"]
+                output_hashes = {}
+                started = time.perf_counter()
+                for relative_path, content in result["outputs"]:
+                    content_hash = hash_text(content)
+                    output_hashes[relative_path] = content_hash
+
+                    # same content as the last run, keep the file and its mtime so MSBuild doesn't recompile it
+                    if manifest.output_hash(source, relative_path) == content_hash \
+                            and os.path.exists(os.path.join(output_folder_path, relative_path)):
+                        self.count('outputs_unchanged')
+                        continue
+
+                    if bundler:
+                        bundler.write(relative_path, source, content)
+                    else:
+                        writer.write(relative_path, content)
+
+                if bundler:
+                    for output in manifest.stale_outputs(source, output_hashes):
+                        bundler.remove(output, source)
+                else:
+                    stale_outputs.extend(manifest.stale_outputs(source, output_hashes))
+                manifest.record(source, result["source_stat"], output_hashes, result["cache_links"])
+
+                if self.profiler:
+                    # with write threads only the hand off to the pool is timed here
+                    result["timings"]["write"] = time.perf_counter() - started
+                    self.profiler.add_result(result)
+
+            def report_error(file: str, error: str):
+                print(error, file=sys.stderr)
+                errors.append({"file": file, "error": error})
+
+            deferred = []
+            for result in results:
+                task_count += 1
+                if result["error"]:
+                    # the last line of the traceback is the exception and its message
+                    error = self.verbose and f'\n{result["error"]}' or f' {result["error"].rstrip().splitlines()[-1]}'
+                    print(f'Failed to generate {result["file"]}:{error}', file=sys.stderr)
+                    errors.append({"file": result["file"], "error": result["error"]})
+                    if self.profiler:
+                        self.profiler.add_result(result)
+                    continue
+
+                if "invalidates" in result["cache_links"] and not self.shard:
+                    deferred.append(result)
+                    continue
+                write_result(result)
+
+            if not self.shard:
+                # the sources of the folder, the ones a streamed run skipped as unchanged included
+                current_sources = {source: entry for source, entry in manifest.sources.items() if source in sources}
+                cached = cached_queries(current_sources)
+                reported = set()
+                for result in deferred:
+                    unresolved = unresolved_invalidations(result["cache_links"]["invalidates"], cached)
+                    if not unresolved:
+                        write_result(result)
+                        continue
+                    reported.add(result["source"])
+                    report_error(result["file"], f'Failed to generate {result["file"]}: {", ".join(unresolved)} '
+                                                 f'of @dapper:invalidates is not a query generated with @dapper:cache '
+                                                 f'in the same folder')
+                    if self.profiler:
+                        self.profiler.add_result(result)
+
+                # a command generated by an earlier run can clear a query that changed or was deleted since,
+                # or it failed above. Its outputs are removed and it is generated again by the next run.
+                # The entries of the commands written above were replaced, they are checked already
+                for source, entry in current_sources.items():
+                    unresolved = unresolved_invalidations(entry.get("invalidates", {}), cached)
+                    if not unresolved or manifest.sources.get(source) is not entry:
+                        continue
+                    if source not in reported:
+                        report_error(source, f'{source}: {", ".join(unresolved)} of @dapper:invalidates is not a query '
+                                             f'generated with @dapper:cache in the same folder anymore')
+                    for output in manifest.sources.pop(source)["outputs"]:
+                        if bundler:
+                            bundler.remove(output, source)
+                        else:
+                            stale_outputs.append(output)
+
+            if bundler:
+                for source in manifest.deleted_sources(sources):
+                    for output in manifest.sources[source]["outputs"]:
+                        bundler.remove(output, source)
+                bundler.flush()
+            stale_outputs.extend(manifest.remove_deleted_sources(sources))
+            # an output can move from one source to another, only remove the ones no source claims
+            claimed_outputs = manifest.outputs()
+            for output in stale_outputs:
+                if output not in claimed_outputs:
+                    writer.remove(output)
+
+            # two files creating the same procedure write the same files, only the last one written is kept.
+            # Bundles are shared by design, each source has its own section in them
+            failed = len(errors)
+            if not bundler:
+                duplicates = {}
+                for output, duplicate_sources in manifest.duplicate_outputs().items():
+                    duplicates.setdefault(tuple(duplicate_sources), []).append(output)
+                for duplicate_sources, outputs in duplicates.items():
+                    error = (f'{" and ".join(duplicate_sources)} generate the same files, only one of them is kept: '
+                             f'{", ".join(outputs)}')
+                    print(error, file=sys.stderr)
+                    errors.append({"file": duplicate_sources[-1], "error": error})
+
+        manifest.save()
+        self.write_stats = writer.stats
+        for name, amount in writer.stats.items():
+            self.count(name, amount)
+
+        print(f'Wrote {writer.stats["files_written"]} files ({writer.stats["bytes_written"]} bytes), '
+              f'removed {writer.stats["files_removed"]} files')
+        if failed:
+            print(f'{failed} of {task_count} stored procedures failed to generate')
+
+        return errors
+
+    def render_tasks(self, render, tasks, task_count: int | None = None):
+        """
+            Renders the tasks in the current process or in a process pool. Results are yielded in task order.
+
+            tasks can be a lazy iterable, only chunks_in_flight chunks per worker are in flight at a time
+            so a stream of tasks is never read ahead of the writes.
+        """
+        if self.workers <= 1 or task_count is not None and task_count <= 1:
+            yield from map(render, tasks)
+            return
+
+        workers = task_count and min(self.workers, task_count) or self.workers
+        # a few chunks per worker keeps the pool busy without paying the pickling cost per file
+        chunk_size = self.chunk_size or (task_count and max(1, task_count // (workers * 4))) or DEFAULT_CHUNK_SIZE
+        tasks = iter(tasks)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            while chunk := list(islice(tasks, chunk_size)):
+                in_flight.append(executor.submit(render_chunk, render, chunk))
+                if len(in_flight) >= workers * self.chunks_in_flight:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+    @staticmethod
+    def render_file(file_path: str, sp_folder_path: str, root_namespace: str,
+                    encoding_hint: str | None = None, template_folder: str | None = None,
+                    timings: StageTimings | None = None, schema_index_path: str | None = None,
+                    annotation_patterns: dict[str, str] | None = None,
+                    sp_file: tuple[os.stat_result, bytes] | None = None,
+                    bundle: str | dict[str, str] | None = None,
+                    sub_folder: str = "", cache_links: dict | None = None) -> tuple[dict, list[tuple[str, str]]]:
+        """
+            Generates the request, result and handler classes for one sql file.
+            Returns the hash, size, mtime and encoding of the sql file
+            and the (path relative to the output folder, content) of every file to write.
+            sp_file is the stat and the bytes of the file when they were read ahead.
+            sub_folder is the folder of the file relative to the sp folder, reports/daily.
+            cache_links is filled with the cache links of the procedure, see render_outputs.
+        """
+        timings = timings or StageTimings()
+
+        # read the file once, the text is decoded from the same bytes that are hashed
+        if sp_file:
+            stat, sp_bytes = sp_file
+        else:
+            with timings.stage('read'), open(file_path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                sp_bytes = file.read()
+            timings.count('bytes_read', len(sp_bytes))
+
+        with timings.stage('decode'):
+            sp_text, encoding = decode_sql_bytes(sp_bytes, encoding_hint)
+        if encoding_hint and encoding == encoding_hint:
+            timings.count('encoding_hint_hits')
+
+        source_stat = {
+            "hash": hash_bytes(sp_bytes),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "encoding": encoding
+        }
+
+        return source_stat, DapperFileGenerator.render_text(
+            sp_text, sp_folder_path, root_namespace, template_folder, timings, schema_index_path, annotation_patterns,
+            bundle, sub_folder, cache_links)
+
+    @staticmethod
+    def render_text(sp_text: str, sp_folder_path: str, root_namespace: str,
+                    template_folder: str | None = None, timings: StageTimings | None = None,
+                    schema_index_path: str | None = None, annotation_patterns: dict[str, str] | None = None,
+                    bundle: str | dict[str, str] | None = None, sub_folder: str = "",
+                    cache_links: dict | None = None) -> list[tuple[str, str]]:
+        """
+            Generates the request, result and handler classes for the text of one stored procedure.
+            Returns the (path relative to the output folder, content) of every file to write.
+        """
+        timings = timings or StageTimings()
+        # compiled and loaded once per process, a worker renders all its tasks with the same templates and schema
+        templates = load_templates(template_folder)
+        schema_index = schema_index_path and load_schema_index(schema_index_path) or None
+
+        # the analysis is lazy, the header and the body are lexed here so each stage is timed on its own
+        with timings.stage('parse'):
+            dapper_generator = DapperGenerator(sp_text, templates, schema_index, annotation_patterns)
+            sp = dapper_generator.sp
+            timings.count('tokens_lexed', len(sp.header_tokens) + len(sp.body))
+
+        with timings.stage('return_type'):
+            dapper_generator.return_type_generator.generate_return_type()
+        with timings.stage('request'):
+            request_class, return_class = dapper_generator.generate_request_class()
+        with timings.stage('handler'):
+            handler_class = dapper_generator.generate_handler_class()
+
+        with timings.stage('render'):
+            return DapperFileGenerator.render_outputs(dapper_generator, templates, sp_folder_path, root_namespace,
+                                                      request_class, return_class, handler_class, bundle, sub_folder,
+                                                      cache_links)
+
+    @staticmethod
+    def render_outputs(dapper_generator: DapperGenerator, templates: Templates, sp_folder_path: str, root_namespace: str,
+                       request_class: str, return_class: str | None, handler_class: str,
+                       bundle: str | dict[str, str] | None = None, sub_folder: str = "",
+                       cache_links: dict | None = None) -> list[tuple[str, str]]:
+        """
+            Wraps the classes in their namespace and returns them with the paths they are written to.
+            With a bundle the classes share one block scoped namespace, the section of the procedure in its bundle.
+
+            The sub folder of the sql file is in the output path and in the namespace, so procedures with the same name
+            in two folders don't overwrite each other: reports/daily/usp_get_totals.sql -> Reports/Daily/Queries/GetTotals
+
+            cache_links is filled with the full names of the caching handler of a cached query and of the caching
+            handlers a command clears, so write_results can check each of them is generated:
+            {"cached_query": "App.Sp.Queries.GetAlerts.GetAlertsQueryCachingHandler"}
+            {"invalidates": {"usp_get_alerts": "App.Sp.Queries.GetAlerts.GetAlertsQueryCachingHandler"}}
+        """
+        # queries will be in a folder called queries and commands will be in a folder called commands
+        # the namespace will be root_namespace + SP_FOLDER + SUB_FOLDER + SP_TYPE (query or command) + SP_NAME
+        sp_type_folder_path = dapper_generator.sp_is_query and 'Queries' or 'Commands'
+        sp_name = dapper_generator.sp_name
+        sub_folder_parts = SPUtils.to_namespace_parts(sub_folder)
+        # split the names and the folder paths into pascal case identifiers
+        folder_namespace_parts = SPUtils.to_namespace_parts(f"{root_namespace}.{sp_folder_path}") + sub_folder_parts
+        namespace = '.'.join(folder_namespace_parts + SPUtils.to_namespace_parts(f"{sp_type_folder_path}.{sp_name}"))
+        sp_name_pascal_case = SPUtils.to_pascal_case(sp_name)
+        sp_type_folder_path = os.path.join(*sub_folder_parts, sp_type_folder_path)
+
+        if cache_links is not None:
+            if dapper_generator.return_type_generator.is_cached:
+                cache_links["cached_query"] = f"{namespace}.{dapper_generator.sp.caching_handler_class_name()}"
+            # the Queries namespace of the references is the one of the folder, next to the Commands one
+            folder_namespace = '.'.join(folder_namespace_parts)
+            caching_handlers = dapper_generator.handler_generator.get_invalidated_caching_handlers()
+            if caching_handlers:
+                cache_links["invalidates"] = {procedure_name: f"{folder_namespace}.{caching_handler}"
+                                              for procedure_name, caching_handler in caching_handlers.items()}
+
+        if bundle:
+            classes = [request_class, return_class, handler_class]
+            section = templates.render("bundle_namespace", namespace=namespace,
+                                       body="\n\n".join(map(str.strip, filter(None, classes))))
+            bundle_path = DapperFileGenerator.bundle_path(bundle, dapper_generator.sp.procedure_name or sp_name,
+                                                          sp_type_folder_path, sp_name_pascal_case)
+            return [(bundle_path, section)]
+
+        # add the namespace to the classes. use file scope namespace
+        request_class = templates.render("file", namespace=namespace, body=request_class)
+        if return_class:
+            return_class = templates.render("file", namespace=namespace, body=return_class)
+        handler_class = templates.render("file", namespace=namespace, body=handler_class)
+
+        # PascalCase the file names
+        request_file_name = SPUtils.to_pascal_case(
+            f"{sp_name}_{dapper_generator.sp_type}.cs")
+        return_file_name = SPUtils.to_pascal_case(
+            f"{sp_name}_Result.cs")
+        handler_file_name = SPUtils.to_pascal_case(
+            f"{sp_name}_Handler.cs")
+
+        sp_folder = os.path.join(sp_type_folder_path, sp_name_pascal_case)
+
+        outputs = [(os.path.join(sp_folder, request_file_name), request_class)]
+        if return_class:
+            outputs.append((os.path.join(sp_folder, return_file_name), return_class))
+        outputs.append((os.path.join(sp_folder, handler_file_name), handler_class))
+
+        return outputs
+
+    @staticmethod
+    def bundle_path(bundle: str | dict[str, str], procedure_name: str, sp_type_folder_path: str,
+                    sp_name_pascal_case: str) -> str:
+        """
+            Returns the bundle file of a procedure, relative to the output folder.
+        """
+        if bundle == BUNDLE_PER_PROCEDURE:
+            return os.path.join(sp_type_folder_path, f"{sp_name_pascal_case}.cs")
+        if isinstance(bundle, dict):
+            # matched like the annotation patterns, the first matching pattern wins
+            procedure_name = procedure_name.lower()
+            for pattern, group in bundle.items():
+                if fnmatch.fnmatchcase(procedure_name, pattern.lower()):
+                    return f"{group}.cs"
+        return f"{sp_type_folder_path}.cs"
@@ -2,26 +2,35 @@ import os
 from dapper.sp_utils import SPUtils
 from dapper.dapper_handler_generator import DapperHandlerGenerator
 from dapper.dapper_request_generator import DapperRequestGenerator
+from dapper.dapper_return_type_generator import DapperReturnTypeGenerator
+from dapper.procedure_ir import ProcedureIR
+from dapper.schema_index import SchemaIndex
 from typing import Dict
 
 from dapper.stored_procedure import StoredProcedure
+from dapper.template_engine import Templates, load_templates
 
 
 class DapperGenerator:
-    def __init__(self, sp_text: str):
+    def __init__(self, sp_text: str, templates: Templates | None = None, schema_index: SchemaIndex | None = None,
+                 annotation_patterns: dict[str, str] | None = None):
         self.sp_text = sp_text
+        self.templates = templates or load_templates()
 
         sp = StoredProcedure(sp_text)
+        sp.apply_annotation_patterns(annotation_patterns)
 
         self.sp = sp
         self.sp_definition = sp.sp_definition
-        self.sp_type = sp.get_sp_type()
+        self.sp_type = sp.sp_type
         self.sp_name = sp.sp_name
         self.sp_params_dict = sp.sp_params_dict
-        self.sp_is_query = sp.get_sp_type() == 'query'
+        self.sp_is_query = sp.sp_type == 'query'
 
-        self.request_generator = DapperRequestGenerator(sp)
-        self.handler_generator = DapperHandlerGenerator(sp)
+        # the request, result and handler share the SP analysis and its return type
+        self.return_type_generator = DapperReturnTypeGenerator(sp, self.templates, schema_index)
+        self.request_generator = DapperRequestGenerator(sp, self.return_type_generator, self.templates)
+        self.handler_generator = DapperHandlerGenerator(sp, self.return_type_generator, self.templates)
 
     def generate(self, folder_path: str, root_namespace: str):
         """
@@ -38,24 +47,29 @@ class DapperGenerator:
         os.makedirs(sp_folder_path, exist_ok=True)
 
         # Generate the request and handler classes
-        request_class = self.generate_request_class()
+        request_class, return_class = self.generate_request_class()
         handler_class = self.generate_handler_class()
 
-        # add the namespace to the classes. use file scope namespace
-        request_class = f"namespace {namespace};\n\n{request_class}"
-        handler_class = f"namespace {namespace};\n\n{handler_class}"
-
         # Write the classes to files in the appropriate folders
         request_file_path = os.path.join(
             sp_folder_path, f"{self.sp_name}_Request.cs")
         handler_file_path = os.path.join(
             sp_folder_path, f"{self.sp_name}_Handler.cs")
 
+        # add the namespace to the classes. use file scope namespace
         with open(request_file_path, 'w') as request_file:
-            request_file.write(request_class)
+            self.templates.render_to(request_file, "file", namespace=namespace, body=request_class)
 
         with open(handler_file_path, 'w') as handler_file:
-            handler_file.write(handler_class)
+            self.templates.render_to(handler_file, "file", namespace=namespace, body=handler_class)
+
+    def procedure_ir(self) -> ProcedureIR:
+        """
+            Returns what the generators know about the SP, to save it with dapper.procedure_ir.save_procedures.
+        """
+        sp = self.sp
+        return ProcedureIR(sp.procedure_name, sp.sp_name, sp.sp_type, tuple(sp.sp_params_dict.values()),
+                           self.return_type_generator.get_result_sets_ir(), sp.annotations)
 
     def generate_request_class(self):
         return self.request_generator.generate()
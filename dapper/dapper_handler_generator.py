@@ -1,24 +1,38 @@
+import re
 from typing import Dict, Any
 from dapper.dapper_return_type_generator import DapperReturnTypeGenerator
 
+from dapper.procedure_ir import ParamIR
 from dapper.sp_utils import SPUtils
 from dapper.stored_procedure import StoredProcedure
+from dapper.table_valued_param import TableValuedParam
+from dapper.template_engine import Templates, load_templates
+
+# @dapper:cache defaults, seconds an entry lives and entries the cache of a query holds
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CACHE_SIZE = 1024
+
+# @dapper:batch default, requests sent per round-trip
+DEFAULT_BATCH_SIZE = 100
+# parameters a batch can use, SQL Server takes 2100 per call
+MAX_BATCH_PARAMS = 2000
 
 
 class DapperHandlerGenerator:
-    def __init__(self, sp: StoredProcedure):
+    def __init__(self, sp: StoredProcedure, return_type_generator: DapperReturnTypeGenerator | None = None,
+                 templates: Templates | None = None):
         self.sp = sp
-        self.return_type_generator = DapperReturnTypeGenerator(sp)
+        self.templates = templates or load_templates()
+        self.return_type_generator = return_type_generator or DapperReturnTypeGenerator(sp, self.templates)
 
         # IQueryHandler or ICommandHandler
-        self.handler_name_type_name = sp.get_sp_type(
-        ) == 'query' and 'IQueryHandler' or 'ICommandHandler'
+        self.handler_name_type_name = sp.sp_type == 'query' and 'IQueryHandler' or 'ICommandHandler'
 
     # strongly type the params_dict
 
     def generate(self) -> str:
 
-        is_query = self.sp.get_sp_type() == 'query'
+        is_query = self.sp.sp_type == 'query'
 
         if is_query:
             return self.generate_query_handler()
@@ -29,141 +43,201 @@ class DapperHandlerGenerator:
         """
             Generates the Dapper Command Handler from the SP params dictionary.
         """
-
-        is_query = self.sp.get_sp_type() == 'query'
-        handler_name = self.sp.handler_class_name()
-        dynamic_params_section = self.sp.retrive_dynamic_params_section()
         request_return_type_name, request_return_type_class = self.return_type_generator.generate_return_type()
 
-        handler = f"""internal sealed class {handler_name}(ISqlConnectionFactory sqlConnectionFactory)
-    : {self.handler_name_type_name}<{self.sp.request_class_name()}, Result<{request_return_type_name}>>
-{{
-
-    public async Task<Result<{request_return_type_name}>> Handle({self.sp.request_class_name()} request, CancellationToken cancellationToken)
-    {{
-        using var connection = sqlConnectionFactory.Create();
-
-        {dynamic_params_section}
-     
-        """
-
         # if the return type is a Unit, then use dapper ExecuteAsync and return Unit.Value
         if request_return_type_name == "Unit":
-            handler = handler + f"""
-        var command = new CommandDefinition(
-            "[dbo].[{self.sp.sp_name}]",
-            parameters,
-            commandType: CommandType.StoredProcedure,
-            cancellationToken: cancellationToken
-        );
-
-        await connection.ExecuteAsync(command);
-
-        return Unit.Value;
-    }}
-}}
-        """
-
+            handler = self.render_handler(request_return_type_name, "handler_execute_unit",
+                                          invalidations=self.get_cache_invalidations())
+            if self.return_type_generator.is_batch:
+                handler += self.render_batch_handler()
             return handler
 
         # if the return type is not a Unit and it's a command, meaning it has out parameters,
         # then use dapper ExecuteAsync and grab the out parameters
-        if not is_query:
-            handler = handler + f"""
-            var command = new CommandDefinition(
-            "[dbo].[{self.sp.sp_name}]",
-            parameters,
-            commandType: CommandType.StoredProcedure,
-            cancellationToken: cancellationToken
-        );
+        out_params = [param_value for param_key, param_value in self.sp.sp_params_dict.items()
+                      if param_value.is_output]
 
-        await connection.ExecuteAsync(command);
-        """
-
-            # retrive the out parameters from dynamic_params
-            out_params = []
-            for param_key, param_value in self.sp.sp_params_dict.items():
-                if param_value["direction"] == "OUT" or param_value["direction"] == "INOUT":
-                    out_params.append(
-                        f"var {param_value['camel_case_name']} = parameters.Get<{param_value['csharp_type']}>(\"@{param_value['name']}\");")
-
-            out_params_str = "\n".join(out_params)
+        # retrive the out parameters from dynamic_params
+        output_params = self.templates.render_each("output_param", [
+            {"camel_case_name": param_value.camel_case_name, "csharp_type": param_value.csharp_type, "name": param_value.name}
+            for param_value in out_params])
 
-            handler = handler + f"""
-        {out_params_str}
+        # Populate the return type class
+        # return new AlertAdded(AlertId: alertId, AlertNotificationCount: alertNotificationCount);
+        output_arguments = ", ".join(
+            [f"{param_value.pascal_case_name}: {param_value.camel_case_name}" for param_value in out_params])
 
-            """
+        return self.render_handler(request_return_type_name, "handler_execute_output",
+                                   output_params=output_params, output_arguments=output_arguments,
+                                   invalidations=self.get_cache_invalidations())
 
-            # Populate the return type class
-            # return new AlertAdded(AlertId: alertId, AlertNotificationCount: alertNotificationCount);
+    def render_batch_handler(self) -> str:
+        """
+            Renders the handler of the batch request of a command with the @dapper:batch size=500 annotation.
 
-            handler = handler + f"""
-            return new {request_return_type_name}({", ".join([f"{param_value['pascal_case_name']}: {param_value['camel_case_name']}" for param_key, param_value in self.sp.sp_params_dict.items() if param_value['direction'] == 'OUT' or param_value['direction'] == 'INOUT'])});
-    }}
-}}
-            """
+            The requests are run on one connection in one transaction, in chunks of size requests. A chunk is sent
+            as one round-trip of EXEC statements, each with its own numbered params:
+            EXEC [dbo].[alert_acknowledge_alert] @user_id = @user_id_0, @alert_id = @alert_id_0;
+        """
+        params = list(self.sp.sp_params_dict.values())
+        size = self.sp.annotations['batch'].get('size', '')
+        batch_size = size.isdigit() and int(size) or DEFAULT_BATCH_SIZE
+        batch_size = max(1, min(batch_size, MAX_BATCH_PARAMS // max(1, len(params))))
+
+        exec_arguments = ",".join(f" @{param_value.name} = @{param_value.name}_{{index}}" for param_value in params)
+        batch_params = "".join(self.get_batch_param(param_value) for param_value in params)
+
+        return self.templates.render(
+            "batch_handler",
+            handler_name=f"{self.sp.batch_request_class_name()}Handler",
+            request_name=self.sp.batch_request_class_name(),
+            batch_size=batch_size,
+            procedure_name=self.sp.procedure_name,
+            exec_arguments=exec_arguments,
+            batch_params=batch_params,
+            invalidations=self.get_cache_invalidations(),
+            records_methods=self.get_records_methods())
+
+    def get_batch_param(self, param_value: ParamIR) -> str:
+        """
+            parameters.Add($"@alert_id_{index}", item.AlertId, DbType.Int32, ParameterDirection.Input);
+        """
+        value = self.sp.param_value_expression(param_value, "item")
+        if param_value.table_type:
+            return self.templates.render("batch_table_param", param_name=param_value.name, value=value)
+        return self.templates.render(
+            "batch_param",
+            param_name=param_value.name,
+            value=value,
+            db_type=param_value.sql_db_type,
+            direction=param_value.csharp_param_direction,
+            size_arguments=self.sp.param_size_arguments(param_value))
+
+    def get_cache_invalidations(self) -> str:
+        """
+            Returns the calls clearing the caches of the queries a command changes the rows of, from its annotation:
+            -- @dapper:invalidates usp_get_alert_severity_image_urls usp_get_alerts
+        """
+        return self.templates.render_each("cache_invalidation", [
+            {"caching_handler": caching_handler} for caching_handler in self.get_invalidated_caching_handlers().values()])
 
-            return handler
+    def get_invalidated_caching_handlers(self) -> dict[str, str]:
+        """
+            Returns the caching handlers a command clears, by the procedure names of its @dapper:invalidates annotation:
+            {"usp_get_alerts": "Queries.GetAlerts.GetAlertsQueryCachingHandler"}
 
-        return handler
+            The queries are generated in the Queries namespace next to the Commands one, C# finds it from the command.
+            DapperFileGenerator checks each one is a query generated with @dapper:cache in the same folder.
+        """
+        if self.sp.sp_type == 'query':
+            return {}
+        caching_handlers = {}
+        for procedure_name in self.sp.annotations.get('invalidates', {}):
+            query_name = SPUtils.to_pascal_case(re.sub(r'^usp_', '', procedure_name, flags=re.IGNORECASE))
+            caching_handlers[procedure_name] = f"Queries.{query_name}.{query_name}QueryCachingHandler"
+        return caching_handlers
 
     def generate_query_handler(self) -> str:
         """
-            Generates the Dapper Query Handler from the SP params dictionary.
+            Generates the Dapper Query Handler from the SP params dictionary,
+            followed by its caching decorator when the SP has the @dapper:cache annotation.
         """
+        handler = self.render_query_handler()
+        if self.return_type_generator.is_cached:
+            handler += self.render_caching_handler()
+        return handler
 
-        is_query = self.sp.get_sp_type() == 'query'
-        handler_name = self.sp.handler_class_name()
-        dynamic_params_section = self.sp.retrive_dynamic_params_section()
+    def render_caching_handler(self) -> str:
+        """
+            Renders a decorator of the query handler keeping its results in a memory cache of its own, keyed on the
+            request record: -- @dapper:cache ttl=300 size=100 keeps 100 results for 5 minutes.
+        """
+        settings = self.sp.annotations['cache']
+        ttl = settings.get('ttl', '').isdigit() and int(settings['ttl']) or DEFAULT_CACHE_TTL
+        size = settings.get('size', '').isdigit() and int(settings['size']) or DEFAULT_CACHE_SIZE
+        return self.templates.render(
+            "caching_handler",
+            caching_handler_name=self.sp.caching_handler_class_name(),
+            handler_name=self.sp.handler_class_name(),
+            request_name=self.sp.request_class_name(),
+            return_type_name=self.return_type_generator.generate_return_type()[0],
+            ttl=ttl,
+            size=size)
+
+    def render_query_handler(self) -> str:
         request_return_type_name, request_return_type_class = self.return_type_generator.generate_return_type()
 
-        handler = f"""internal sealed class {handler_name}(ISqlConnectionFactory sqlConnectionFactory)
-    : {self.handler_name_type_name}<{self.sp.request_class_name()}, Result<{request_return_type_name}>>
-{{
-
-    public async Task<Result<{request_return_type_name}>> Handle({self.sp.request_class_name()} request, CancellationToken cancellationToken)
-    {{
-        using var connection = sqlConnectionFactory.Create();
+        # if the query is streamed, then read the rows unbuffered and yield them as they arrive
+        if self.return_type_generator.is_stream:
+            return self.render_stream_handler()
 
-        {dynamic_params_section}
-     
-        """
+        # if the query returns several result sets, then read them all from one QueryMultipleAsync
+        if self.return_type_generator.has_multiple_result_sets:
+            return self.generate_multiple_result_sets_handler(request_return_type_name)
 
         # if the return type is a List<T>, then use dapper QueryAsync and return the list
-        if "List" in request_return_type_name:
-            handler = handler + f"""
-            var command = new CommandDefinition(
-            "[dbo].[{self.sp.sp_name}]",
-            parameters,
-            commandType: CommandType.StoredProcedure,
-            cancellationToken: cancellationToken
-        );
-
-        var result = await connection.QueryAsync<{request_return_type_name}>(command);
-
-        return result?.ToList() ?? new List<{request_return_type_name}>();
-    }}
-}}
-            """
-
-            return handler
+        if request_return_type_name.startswith("List<"):
+            return self.render_handler(request_return_type_name, "handler_execute_list",
+                                       row_type_name=request_return_type_name[len("List<"):-1])
 
         # if the return type is not a List<T> and it's a query, meaning it has a single return type,
         # then use dapper QueryFirstOrDefaultAsync and return the single object
-        handler = handler + f"""
-        var command = new CommandDefinition(
-        "[dbo].[{self.sp.sp_name}]",
-        parameters,
-        commandType: CommandType.StoredProcedure,
-        cancellationToken: cancellationToken
-    );
+        return self.render_handler(request_return_type_name, "handler_execute_single")
 
-        var result = await connection.QueryFirstOrDefaultAsync<{request_return_type_name}>(command);
+    def generate_multiple_result_sets_handler(self, return_type_name: str) -> str:
+        """
+            Reads every result set from the grid reader of one QueryMultipleAsync, in the order the SP returns them.
+            Only generated when every SELECT runs every time, see DapperReturnTypeGenerator.has_multiple_result_sets.
+        """
+        result_sets = self.return_type_generator.get_result_sets()
+
+        grid_reads = "".join(
+            self.templates.render(result_set["is_single"] and "grid_read_single" or "grid_read_list", **result_set)
+            for result_set in result_sets)
 
-        return result;
+        # Result1 = result1, Result2 = result2
+        result_set_assignments = ",\n".join(
+            [f"            {result_set['property_name']} = {result_set['variable_name']}" for result_set in result_sets])
 
-    }}
-}}
+        return self.render_handler(return_type_name, "handler_execute_multiple",
+                                   grid_reads=grid_reads, result_set_assignments=result_set_assignments)
+
+    def render_stream_handler(self) -> str:
+        """
+            Renders the handler of a streamed query, an IAsyncEnumerable of the rows read with Dapper's unbuffered reader.
         """
+        return self.templates.render(
+            "stream_handler",
+            handler_name=self.sp.handler_class_name(),
+            request_name=self.sp.request_class_name(),
+            row_type_name=self.return_type_generator.get_row_type_name(),
+            dynamic_params_section=self.sp.dynamic_params_section,
+            procedure_name=self.sp.procedure_name,
+            records_methods=self.get_records_methods())
+
+    def get_records_methods(self) -> str:
+        """
+            Returns the methods streaming the rows of the table-valued params as SqlDataRecords, one per param.
+        """
+        return "".join(
+            TableValuedParam(param_value, self.return_type_generator.schema_index).get_records_method(self.templates)
+            for param_value in self.sp.sp_params_dict.values() if param_value.table_type)
 
-        return handler
+    def render_handler(self, return_type_name: str, execute_template: str, **context) -> str:
+        """
+            Renders the handler class. All handlers share the connection, parameters and CommandDefinition code,
+            execute_template renders the call to Dapper and the return.
+        """
+        execute = self.templates.render(execute_template, return_type_name=return_type_name, **context)
+
+        return self.templates.render(
+            "handler",
+            handler_name=self.sp.handler_class_name(),
+            handler_interface=self.handler_name_type_name,
+            request_name=self.sp.request_class_name(),
+            return_type_name=return_type_name,
+            dynamic_params_section=self.sp.dynamic_params_section,
+            procedure_name=self.sp.procedure_name,
+            execute=execute,
+            records_methods=self.get_records_methods())
@@ -1,12 +1,16 @@
 from typing import Dict, Any
 from dapper.dapper_return_type_generator import DapperReturnTypeGenerator
 from dapper.stored_procedure import StoredProcedure
+from dapper.table_valued_param import TableValuedParam
+from dapper.template_engine import Templates, load_templates
 
 
 class DapperRequestGenerator:
-    def __init__(self, sp: StoredProcedure):
+    def __init__(self, sp: StoredProcedure, return_type_generator: DapperReturnTypeGenerator | None = None,
+                 templates: Templates | None = None):
         self.sp = sp
-        self.return_type_generator = DapperReturnTypeGenerator(sp)
+        self.templates = templates or load_templates()
+        self.return_type_generator = return_type_generator or DapperReturnTypeGenerator(sp, self.templates)
 
     def generate(self) -> [str, str]:
         """
@@ -31,21 +35,51 @@ class DapperRequestGenerator:
 
         request_name = self.sp.request_class_name()
         sp_params_dict = self.sp.sp_params_dict
-        request_params = []
 
-        for param_key, param_value in sp_params_dict.items():
-            if param_value["direction"] != "OUT":
-                request_params.append(
-                    f"public {param_value['csharp_type']} {param_value['pascal_case_name']} {{ get; init; }}")
+        # a table-valued param is a collection of its rows
+        table_valued_params = {param_key: TableValuedParam(param_value, self.return_type_generator.schema_index)
+                               for param_key, param_value in sp_params_dict.items() if param_value.table_type}
+
+        request_params = self.templates.render_each("property", [
+            {"type": param_key in table_valued_params and table_valued_params[param_key].get_collection_type() or param_value.csharp_type,
+             "name": param_value.pascal_case_name}
+            for param_key, param_value in sp_params_dict.items() if param_value.direction != "OUT"])
+
+        # the row records of the table types with several columns
+        row_types = "".join(table_valued_param.get_row_type_definition(self.templates)
+                            for table_valued_param in table_valued_params.values())
+
+        # a streamed query yields its rows one by one instead of returning a Result
+        if self.return_type_generator.is_stream:
+            request = self.templates.render(
+                "stream_request",
+                request_name=request_name,
+                row_type_name=self.return_type_generator.get_row_type_name(),
+                properties=request_params)
+            return request + row_types, request_return_type_class
 
-        request_params_str = "\n    ".join(request_params)
         # ICommand or IQuery depending on the SP type
-        interface_type = self.sp.get_sp_type() == 'query' and "IQuery" or "ICommand"
+        interface_type = self.sp.sp_type == 'query' and "IQuery" or "ICommand"
 
-        request = f"\npublic record {request_name} : {interface_type}<Result<{request_return_type_name}>>\n{{\n    {request_params_str}\n}}\n"
+        request = self.templates.render(
+            "request",
+            request_name=request_name,
+            interface_type=interface_type,
+            return_type_name=request_return_type_name,
+            properties=request_params)
 
         # if SP has a return type, then add it to the request
         # if request_return_type_class:
         #     request = request + "\n\n" + request_return_type_class + "\n\n"
 
-        return request, request_return_type_class
+        # a batch command also gets a request holding many requests
+        if self.return_type_generator.is_batch:
+            request += self.templates.render(
+                "request",
+                request_name=self.sp.batch_request_class_name(),
+                interface_type="ICommand",
+                return_type_name="Unit",
+                properties=self.templates.render_each(
+                    "property", [{"type": f"IReadOnlyCollection<{request_name}>", "name": "Requests"}]))
+
+        return request + row_types, request_return_type_class
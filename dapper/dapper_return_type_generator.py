@@ -1,14 +1,32 @@
-import re
+from functools import cached_property
+from dapper.procedure_ir import ColumnIR, ResultSetIR
+from dapper.schema_index import SchemaIndex
 from dapper.sp_utils import SPUtils
+from dapper.sql_lexer import Token
 from dapper.stored_procedure import StoredProcedure
+from dapper.template_engine import Templates, load_templates
 
 
 class DapperReturnTypeGenerator:
-    def __init__(self, sp: StoredProcedure):
+    """
+        Generates the return type of a SP. One instance is shared by the request and handler generators of a SP,
+        so the return type is only generated once.
+
+        With a schema index the column types come from the tables and views the SELECT reads,
+        otherwise they are guessed from the column names.
+    """
+
+    def __init__(self, sp: StoredProcedure, templates: Templates | None = None, schema_index: SchemaIndex | None = None):
         self.sp = sp
+        self.templates = templates or load_templates()
+        self.schema_index = schema_index
 
     # return a tuple with name of the return type and the return type class definition if it has one.
     def generate_return_type(self) -> tuple[str, str | None]:
+        return self.return_type
+
+    @cached_property
+    def return_type(self) -> tuple[str, str | None]:
         """
             Returns the return type of the SP. If the SP has no return type, meaning its a command, then returns Result<Unit>.
             A SP has a return type if:
@@ -20,102 +38,176 @@ class DapperReturnTypeGenerator:
         """
         sp = self.sp
 
-        sp_has_return_type = sp.has_return_type()
+        sp_has_return_type = sp.sp_has_return_type
 
         # if SP has no return type, then return Unit
         if not sp_has_return_type:
             return "Unit", None
 
-        sp_definition = sp.sp_definition
-        sp_params_dict = sp.sp_params_dict
-        sp_name = sp.sp_name
-
         # get the return type name
         return_type_name = self.get_return_type_name()
 
         # if the SP is a command and has a return type, meaning it has a RETURN statement, then return Result<Unit>
         # create a class definition for the return type with the OUT parameters
-        if sp.get_sp_type() == "command":
+        if sp.sp_type == "command":
             return_type_class_definition = self.get_command_return_type_class_definition()
             return f"{return_type_name}", return_type_class_definition
 
         else:
+            # if the SP returns several result sets, then return one object holding all of them
+            if self.has_multiple_result_sets:
+                return f"{return_type_name}", self.get_multiple_result_sets_class_definition()
+
             # if the SP is a query and has a return type, meaning it has a RETURN statement, then return Result<Unit>
             # create a class definition for the return type with the OUT parameters
             return_type_class_definition = self.get_query_return_type_class_definition()
 
             # if the SP has a SELECT Top 1 statement, then return Result<T>
             # Otherwise, return Result<List<T>>
-
-            has_top_1_select_statement = re.search(
-                r'SELECT TOP 1', sp_definition, re.IGNORECASE)
+            result_selects = sp.result_selects
+            has_top_1_select_statement = result_selects and result_selects[0]["top"] in ("1", "(1)")
 
             if has_top_1_select_statement:
-                return_type_class_definition = self.get_query_return_type_class_definition()
                 return f"{return_type_name}", return_type_class_definition
 
             return f"List<{return_type_name}>", return_type_class_definition
 
-    def get_query_return_type_class_definition(self) -> str:
-        sp_text = self.sp.sp_text
-        sp_definition = self.sp.sp_definition
-        sp_params_dict = self.sp.sp_params_dict
-        sp_name = self.sp.sp_name
+    @cached_property
+    def is_stream(self) -> bool:
+        """
+            A query returning a list is streamed row by row when it has the @dapper:stream annotation,
+            in the script or configured for its name.
+        """
+        return 'stream' in self.sp.annotations and self.sp.sp_type == "query" and self.return_type[0].startswith("List<")
 
-        # get the return type name
+    @cached_property
+    def is_cached(self) -> bool:
+        """
+            A query gets a caching decorator when it has the @dapper:cache annotation. A streamed query is never cached.
+        """
+        return 'cache' in self.sp.annotations and self.sp.sp_type == "query" and not self.is_stream
+
+    @cached_property
+    def is_batch(self) -> bool:
+        """
+            A command gets a batch request and handler when it has the @dapper:batch annotation
+            and only input params, there is nothing to read back per request.
+        """
+        return 'batch' in self.sp.annotations and self.sp.sp_type == "command" and self.return_type[0] == "Unit"
+
+    def get_row_type_name(self) -> str:
+        """
+            Returns the type of one row of a query returning a list: List<GetAlertsResult> -> GetAlertsResult.
+        """
+        return_type_name = self.return_type[0]
+        return return_type_name.startswith("List<") and return_type_name[len("List<"):-1] or return_type_name
+
+    @cached_property
+    def has_multiple_result_sets(self) -> bool:
+        """
+            A query whose body has more than one top level SELECT returning rows reads them all in one round-trip.
+
+            The grids are read in order, so every SELECT must run every time. When one is in a branch the result sets
+            depend on the params, the query falls back to reading the first SELECT as its only result set.
+        """
+        result_selects = self.sp.result_selects
+        return self.sp.sp_type == "query" and len(result_selects) > 1 \
+            and not any(select["conditional"] for select in result_selects)
+
+    def get_result_sets(self) -> list[dict]:
+        """
+            Returns the result sets of a query returning several, in the order the SP returns them.
+
+            Result set dict example:
+                "property_name": "Result2",
+                "variable_name": "result2",
+                "row_type_name": "GetAlertsResult2",
+                "is_single": True    (a SELECT TOP 1, read as one row instead of a list)
+        """
         return_type_name = self.get_return_type_name()
+        return [{
+            "property_name": f"Result{index}",
+            "variable_name": f"result{index}",
+            "row_type_name": f"{return_type_name}{index}",
+            "is_single": select["top"] in ("1", "(1)")
+        } for index, select in enumerate(self.sp.result_selects, start=1)]
+
+    def get_multiple_result_sets_class_definition(self) -> str:
+        """
+            Returns the class of every result set and the record holding them, e.g. for two SELECTs:
+            public record GetAlertsResult
+            {
+                public List<GetAlertsResult1> Result1 { get; init; }
+                public GetAlertsResult2 Result2 { get; init; }
+            }
+        """
+        result_sets = self.get_result_sets()
+        properties = self.templates.render_each("property", [
+            {"type": result_set["is_single"] and result_set["row_type_name"] or f"List<{result_set['row_type_name']}>",
+             "name": result_set["property_name"]}
+            for result_set in result_sets])
 
-        # Extract the part of the stored procedure after AS BEGIN
-        match = re.search(r'AS\s+BEGIN(.*)', sp_text,
-                          re.DOTALL | re.IGNORECASE)
-        if match:
-            sp_text_after_as_begin = match.group(1)
+        class_definitions = [self.templates.render("result_record", return_type_name=self.get_return_type_name(), properties=properties)]
+        for result_set, select in zip(result_sets, self.sp.result_selects):
+            class_definitions.append(self.get_select_class_definition(select, result_set["row_type_name"]))
+        return "".join(class_definitions)
 
-            # There can be multiple SELECT statements in the SP. We only want the first one.
-            # if the 1st SELECT statement returns *, then return an empty class definition
-            has_select_star_statement = re.search(
-                r'SELECT\s+\*\s+FROM', sp_text_after_as_begin, re.IGNORECASE)
+    def get_query_return_type_class_definition(self) -> str:
+        # There can be multiple SELECT statements in the SP. We only want the first one that returns rows.
+        result_selects = self.sp.result_selects
+        return self.get_select_class_definition(result_selects and result_selects[0] or None, self.get_return_type_name())
 
-        if has_select_star_statement:
-            return f"public class {return_type_name}\n{{\n}}"
+    def get_select_class_definition(self, select: dict | None, return_type_name: str) -> str:
+        """
+            Returns the class of a row of the SELECT.
+        """
+        # if the SELECT statement returns *, then return an empty class definition
+        if not select or select["is_star"]:
+            return self.templates.render("result_class", return_type_name=return_type_name, properties="")
 
-        # Find the position of the first SELECT after the CREATE PROCEDURE section
-        create_proc_end = re.search(r'\bAS\b', sp_text, re.IGNORECASE).end()
-        select_match = re.search(
-            r'SELECT\s(.*?)\s+FROM', sp_text[create_proc_end:], re.DOTALL | re.IGNORECASE)
+        # create the class definition
+        properties = self.templates.render_each("property", [
+            {"type": column.csharp_type, "name": SPUtils.snake_case_to_pascal_case(column.name)}
+            for column in self.get_select_columns(select)])
 
-        if not select_match:
-            return f"public class {return_type_name}\n{{\n}}"
+        return self.templates.render("result_class", return_type_name=return_type_name, properties=properties)
 
-        select_statement = select_match.group(1)
+    def get_result_sets_ir(self) -> tuple[ResultSetIR, ...]:
+        """
+            Returns the result sets of the SP with their typed columns, in the order the SP returns them.
+            When a SELECT is in a branch only the first one is known to be returned, see has_multiple_result_sets.
+        """
+        result_selects = self.sp.result_selects
+        if any(select["conditional"] for select in result_selects):
+            result_selects = result_selects[:1]
+        return tuple(ResultSetIR(not select["is_star"] and self.get_select_columns(select) or (),
+                                 select["top"] in ("1", "(1)"), select["is_star"])
+                     for select in result_selects)
+
+    def get_select_columns(self, select: dict) -> tuple[ColumnIR, ...]:
+        """
+            Returns the columns of the SELECT with their C# types. A column selected twice keeps its first position.
+        """
         # create a dict to hold the column names and types
         columns = {}
 
-        # separate the columns by comma
-        columns_list = select_statement.split(",")
-        # process the column line and add to the columns dict
-        # examples of column lines:
+        # the aliases and tables of the FROM clause, to look the columns up in the schema index
+        tables = self.schema_index and StoredProcedure.parse_from_tables(self.sp.body, select["from_index"]) or {}
+
+        # the columns are already separated by the commas outside parentheses
+        # process the column tokens and add to the columns dict
+        # examples of columns:
         # vwAlertLocalTime.acknowledged_by AS acknowledged_by_user_id
         # tblAlertState.alert_state_description
         # COALESCE(tblLocation.location_desc, '-- No mapped location --') AS location_desc
 
-        for column_line in columns_list:
+        for column_tokens in select["columns"]:
             column_name, column_type = self.extract_column_name_and_type(
-                column_line)
+                column_tokens, tables)
 
             columns[column_name] = column_type
 
-        # create the class definition
-        class_definition = []
-
-        for column_name, column_type in columns.items():
-            class_definition.append(
-                f"public {column_type} {SPUtils.snake_case_to_pascal_case(column_name)} {{ get; init; }}")
-
-        class_definition_str = "\n    ".join(class_definition)
-        class_definition = f"\npublic class {return_type_name}\n{{\n    {class_definition_str}\n}}\n"
-
-        return class_definition
+        return tuple(ColumnIR(column_name, column_type) for column_name, column_type in columns.items())
 
     def get_csharp_type(self, column_name: str) -> str:
         """
@@ -133,25 +225,23 @@ class DapperReturnTypeGenerator:
         else:
             return 'string'
 
-    def extract_column_name_and_type(self, column_line: str) -> tuple[str, str]:
+    def extract_column_name_and_type(self, column_tokens: list[Token], tables: dict[str, str | None] | None = None) -> tuple[str, str]:
         """
-        Extracts the column name and type from a column line.
+        Extracts the column name and type from the tokens of a column of the SELECT list.
         Example:
-        column_line: vwAlertLocalTime.acknowledged_by AS acknowledged_by_user_id or
-        column_line: tblAlertState.alert_state_description or
-        column_line: COALESCE(tblLocation.location_desc, '-- No mapped location --') AS location_desc
+        column: vwAlertLocalTime.acknowledged_by AS acknowledged_by_user_id or
+        column: tblAlertState.alert_state_description or
+        column: COALESCE(tblLocation.location_desc, '-- No mapped location --') AS location_desc or
+        column: location_desc = COALESCE(tblLocation.location_desc, '-- No mapped location --')
         will return: (acknowledged_by_user_id, int)
+
+        tables are the aliases and tables of the FROM clause, the column is looked up through them in the schema index.
         """
-        # remove leading and trailing spaces
-        column_line = column_line.strip()
+        column_name, expression = StoredProcedure.select_column(column_tokens)
 
-        # Check if there is an alias (AS) and split accordingly
-        if ' AS ' in column_line:
-            column_parts = column_line.split(' AS ')
-            column_name = column_parts[-1]
-        else:
-            parts = column_line.split('.')
-            column_name = parts[-1].strip()
+        column_info = self.schema_index and self.schema_index.resolve(expression, tables or {})
+        if column_info:
+            return column_name, column_info.csharp_type()
 
         # Use the get_csharp_type function to determine the C# type
         column_type = self.get_csharp_type(column_name)
@@ -178,17 +268,13 @@ class DapperReturnTypeGenerator:
         """
 
         sp_params_dict = self.sp.sp_params_dict
-        return_type_class_definition = []
 
-        for param_key, param_value in sp_params_dict.items():
-            if param_value["direction"] == "OUTPUT" or param_value["direction"] == "INOUT" or param_value["direction"] == "OUT":
-                return_type_class_definition.append(
-                    f"public {param_value['csharp_type']} {param_value['pascal_case_name']} {{ get; init; }}")
+        properties = self.templates.render_each("property", [
+            {"type": param_value.csharp_type, "name": param_value.pascal_case_name}
+            for param_key, param_value in sp_params_dict.items()
+            if param_value.is_output])
 
-        return_type_class_definition_str = "\n    ".join(
-            return_type_class_definition)
-        return_type_class_definition = f"\npublic record {self.get_return_type_name()}\n{{\n    {return_type_class_definition_str}\n}}\n"
-        return return_type_class_definition
+        return self.templates.render("result_record", return_type_name=self.get_return_type_name(), properties=properties)
 
     def get_return_type_name(self):
         """
@@ -0,0 +1,120 @@
+import time
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.sql_discovery import iter_sql_entries
+
+# seconds between two scans of the sql folder while nothing changes, a scan of a large folder isn't free
+DEFAULT_POLL_INTERVAL = 0.5
+# seconds a file must keep the same size and mtime before it is generated, editors often save in several writes.
+# While a change waits for it the folder is scanned every debounce seconds, so a save is generated soon after
+DEFAULT_DEBOUNCE = 0.05
+
+
+class DapperWatcher:
+    """
+        Watches a folder of sql files and regenerates the classes of the files that are created, modified or deleted.
+
+        The folder and its sub folders are polled with os.scandir, which works the same on every platform and on
+        network shares where file system events are not delivered. The manifest of the run is loaded once and kept in memory,
+        so a change only costs the scan, the generation of the changed files and the manifest save.
+
+        The parsed procedures are not kept: the outputs of a file only depend on that file, so a change never needs
+        another file parsed again, and the manifest is enough to know what is unchanged.
+
+        file_generator must be incremental, the generator isn't changed by the watcher.
+    """
+
+    def __init__(self, sp_folder_path: str, output_folder_path: str, root_namespace: str,
+                 file_generator: DapperFileGenerator | None = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, debounce: float = DEFAULT_DEBOUNCE):
+        self.sp_folder_path = sp_folder_path
+        self.output_folder_path = output_folder_path
+        self.root_namespace = root_namespace
+        if file_generator is not None and not file_generator.incremental:
+            raise ValueError("the watcher regenerates the changed files only, it needs an incremental generator")
+        # a change is usually one file, a process pool would cost more than it saves
+        self.file_generator = file_generator or DapperFileGenerator(incremental=True)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+
+        self.manifest = None
+        # path relative to the folder -> (size, mtime_ns) of the last scan
+        self.snapshot = {}
+        # relative path -> ((size, mtime_ns) or None when deleted, time the change was seen) of the changes waiting for the debounce
+        self.pending = {}
+
+    def run(self):
+        """
+            Generates the folder, then regenerates the changed files until interrupted with Ctrl+C.
+        """
+        self.start()
+        print(f'Watching {self.sp_folder_path} for changes, press Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(self.pending and min(self.debounce, self.poll_interval) or self.poll_interval)
+                self.poll()
+        except KeyboardInterrupt:
+            print('Stopped watching')
+
+    def start(self) -> list[dict]:
+        """
+            Generates the whole folder incrementally and takes the first snapshot.
+        """
+        self.manifest = self.file_generator.open_manifest(self.output_folder_path, self.root_namespace, self.sp_folder_path)
+        self.snapshot = self.scan()
+        self.pending = {}
+        return self.file_generator.generate_files(self.sp_folder_path, self.output_folder_path, self.root_namespace,
+                                                  sorted(self.snapshot), self.manifest, set(self.snapshot))
+
+    def poll(self) -> list[dict] | None:
+        """
+            Scans the folder once. Regenerates the files whose changes are older than the debounce delay
+            and returns the errors, or None when nothing was generated.
+        """
+        now = time.monotonic()
+        snapshot = self.scan()
+
+        for file in snapshot.keys() | self.snapshot.keys():
+            stat = snapshot.get(file)
+            if stat == self.snapshot.get(file):
+                continue
+            waiting = self.pending.get(file)
+            # a file still being written restarts its debounce
+            if waiting is None or waiting[0] != stat:
+                self.pending[file] = (stat, now)
+
+        ready = [file for file, (stat, seen) in self.pending.items()
+                 if now - seen >= self.debounce and snapshot.get(file) == stat]
+        if not ready:
+            return None
+
+        for file in ready:
+            del self.pending[file]
+            if file in snapshot:
+                self.snapshot[file] = snapshot[file]
+            else:
+                self.snapshot.pop(file, None)
+
+        return self.regenerate(sorted(file for file in ready if file in self.snapshot), ready)
+
+    def regenerate(self, files: list[str], changed: list[str]) -> list[dict]:
+        started = time.perf_counter()
+        # the deleted files are missing from the snapshot, their outputs are removed by the write
+        errors = self.file_generator.generate_files(self.sp_folder_path, self.output_folder_path, self.root_namespace,
+                                                    files, self.manifest, set(self.snapshot))
+
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f'Regenerated {", ".join(sorted(changed))} in {elapsed:.0f} ms')
+        return errors
+
+    def scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        # the same files as a full run of the generator, with its globs and shard
+        generator = self.file_generator
+        for relative_path, entry in iter_sql_entries(self.sp_folder_path, generator.include, generator.exclude, generator.shard):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # deleted between the listing and the stat
+                continue
+            snapshot[relative_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
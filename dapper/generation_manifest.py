@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+
+# bump when the generated output changes in a way the source fingerprint below can't see
+GENERATOR_VERSION = "1"
+
+MANIFEST_FILE_NAME = ".dapper_manifest.json"
+
+
+def hash_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_text(content: str) -> str:
+    return hash_bytes(content.encode('utf-8'))
+
+
+def generator_fingerprint() -> str:
+    """
+        Returns the generator version stamp: GENERATOR_VERSION plus a hash of the generator source files,
+        so editing any generator invalidates the outputs it produced.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256(GENERATOR_VERSION.encode('utf-8'))
+    for file in sorted(os.listdir(package_dir)):
+        if file.endswith('.py'):
+            with open(os.path.join(package_dir, file), 'rb') as source_file:
+                digest.update(file.encode('utf-8'))
+                digest.update(source_file.read())
+    return f"{GENERATOR_VERSION}+{digest.hexdigest()[:16]}"
+
+
+def cached_queries(sources: dict[str, dict]) -> set[str]:
+    """
+        Returns the full names of the caching handlers generated by the sources of a manifest.
+    """
+    return {entry["cached_query"] for entry in sources.values() if "cached_query" in entry}
+
+
+def unresolved_invalidations(invalidates: dict[str, str], cached: set[str]) -> list[str]:
+    """
+        Returns the procedures of a @dapper:invalidates annotation whose caching handler isn't in cached.
+        The command handler calling it wouldn't compile.
+    """
+    return [procedure_name for procedure_name, caching_handler in invalidates.items() if caching_handler not in cached]
+
+
+class GenerationManifest:
+    """
+        Persistent record of what the last run generated, stored as json in the output folder.
+
+        Manifest example:
+            "generator_version": "1+3f2a...",
+            "settings": "<hash of the root namespace and sp folder>",
+            "sources": {
+                "usp_get_alert.sql": {
+                    "hash": "<sha256 of the sql bytes>",
+                    "size": 1234,
+                    "mtime_ns": 1700000000000000000,
+                    "encoding": "utf-8",
+                    "outputs": {"Queries/GetAlert/GetAlertQuery.cs": "<sha256 of the content>", ...}
+                },
+                "usp_delete_alert.sql": {
+                    ...
+                    "invalidates": {"usp_get_alert": "App.Sp.Queries.GetAlert.GetAlertQueryCachingHandler"}
+                }
+            }
+    """
+
+    def __init__(self, output_folder_path: str, settings: str):
+        self.path = os.path.join(output_folder_path, MANIFEST_FILE_NAME)
+        self.generator_version = generator_fingerprint()
+        self.settings = hash_text(settings)
+        self.sources = {}
+
+    def load(self):
+        """
+            Loads the previous manifest. A missing, unreadable or stale manifest starts empty,
+            which makes the run regenerate everything.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as manifest_file:
+                data = json.load(manifest_file)
+        except (OSError, ValueError):
+            return self
+
+        if data.get("generator_version") == self.generator_version and data.get("settings") == self.settings:
+            self.sources = data.get("sources", {})
+        return self
+
+    @staticmethod
+    def read(output_folder_path: str) -> dict | None:
+        """
+            Returns the raw content of the manifest of an output folder, whatever generated it, or None.
+        """
+        try:
+            with open(os.path.join(output_folder_path, MANIFEST_FILE_NAME), 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump({
+                "generator_version": self.generator_version,
+                "settings": self.settings,
+                "sources": self.sources
+            }, manifest_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def is_unchanged(self, source: str, file_path: str, output_folder_path: str) -> bool:
+        """
+            Returns True if the source file has the hash recorded by the last run and all its outputs still exist.
+            The file is only read when its size or mtime changed since the last run.
+        """
+        entry = self.sources.get(source)
+        if entry is None or not self.outputs_exist(entry, output_folder_path):
+            return False
+
+        stat = os.stat(file_path)
+        if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return True
+
+        with open(file_path, 'rb') as file:
+            source_hash = hash_bytes(file.read())
+        if source_hash != entry["hash"]:
+            return False
+
+        # touched but not modified, remember the new stat so the next run doesn't read it again
+        entry["size"] = stat.st_size
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def is_unchanged_hash(self, source: str, source_hash: str, output_folder_path: str) -> bool:
+        """
+            Returns True if the source has the hash recorded by the last run and all its outputs still exist.
+            Used for sources that are not files of their own, like the procedures of a dump file.
+        """
+        entry = self.sources.get(source)
+        return entry is not None and entry["hash"] == source_hash and self.outputs_exist(entry, output_folder_path)
+
+    @staticmethod
+    def outputs_exist(entry: dict, output_folder_path: str) -> bool:
+        return all(os.path.exists(os.path.join(output_folder_path, output)) for output in entry["outputs"])
+
+    def encoding(self, source: str) -> str | None:
+        return self.sources.get(source, {}).get("encoding")
+
+    def output_hash(self, source: str, output: str) -> str | None:
+        return self.sources.get(source, {}).get("outputs", {}).get(output)
+
+    def record(self, source: str, source_stat: dict, outputs: dict[str, str], cache_links: dict | None = None):
+        """
+            Records the source file hash, size and mtime, the hashes of the outputs generated from it
+            and its cache links, see DapperFileGenerator.render_outputs.
+        """
+        self.sources[source] = {**source_stat, **(cache_links or {}), "outputs": outputs}
+
+    def stale_outputs(self, source: str, outputs: dict[str, str]) -> list[str]:
+        """
+            Returns the outputs the previous run generated from the source that are not generated anymore.
+        """
+        previous_outputs = self.sources.get(source, {}).get("outputs", {})
+        return [output for output in previous_outputs if output not in outputs]
+
+    def outputs(self) -> set[str]:
+        """
+            Returns every output recorded, whatever its source.
+        """
+        return {output for entry in self.sources.values() for output in entry["outputs"]}
+
+    def duplicate_outputs(self) -> dict[str, list[str]]:
+        """
+            Returns the outputs recorded for more than one source, with their sources in name order.
+        """
+        output_sources = {}
+        for source, entry in self.sources.items():
+            for output in entry["outputs"]:
+                output_sources.setdefault(output, []).append(source)
+        return {output: sorted(output_sources[output]) for output in sorted(output_sources)
+                if len(output_sources[output]) > 1}
+
+    def deleted_sources(self, sources: set[str]) -> list[str]:
+        """
+            Returns the sources recorded that no longer exist.
+        """
+        return [source for source in self.sources if source not in sources]
+
+    def remove_deleted_sources(self, sources: set[str]) -> list[str]:
+        """
+            Forgets the sources that no longer exist and returns the outputs generated from them.
+        """
+        removed_outputs = []
+        for source in self.deleted_sources(sources):
+            removed_outputs.extend(self.sources.pop(source)["outputs"])
+        return removed_outputs
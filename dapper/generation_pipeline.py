@@ -0,0 +1,63 @@
+import queue
+import threading
+
+# items a stage produces ahead of the stage consuming them
+DEFAULT_STAGE_BUFFER = 8
+
+# seconds a producer waits on a full buffer before checking the consumer is still there
+STAGE_POLL_INTERVAL = 0.1
+
+# marks the end of a stage in its buffer, with the error that stopped it if any
+STAGE_DONE = object()
+
+
+def bounded_stage(items, buffer_size: int = DEFAULT_STAGE_BUFFER):
+    """
+        Yields the items of an iterable, producing them in a thread at most buffer_size items ahead of the consumer.
+
+        The stages of the generation are chained generators, discover -> read -> parse -> render -> write.
+        A bounded stage lets one of them run in its own thread, so reading files overlaps with parsing them,
+        while the full buffer blocks the producer until the consumer catches up and memory stays flat.
+        An error raised by the producer is raised to the consumer, in order, after the items produced before it.
+        buffer_size 0 iterates the items inline.
+    """
+    if buffer_size <= 0:
+        yield from items
+        return
+
+    buffer = queue.Queue(maxsize=buffer_size)
+    stopped = threading.Event()
+
+    def put(entry) -> bool:
+        # gives up once the consumer is gone, so an abandoned stage never keeps its thread blocked
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=STAGE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except BaseException as error:
+            put((STAGE_DONE, error))
+            return
+        put((STAGE_DONE, None))
+
+    thread = threading.Thread(target=produce, name="dapper-stage", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is STAGE_DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
@@ -0,0 +1,170 @@
+import cProfile
+import heapq
+import json
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# number of functions of the cProfile capture and of allocation sites of the tracemalloc capture in the report
+REPORT_TOP_ENTRIES = 25
+
+
+class StageTimings:
+    """
+        Seconds spent in each stage of one procedure and its counters.
+
+        Filled in by the process that renders the procedure and sent back with its result as plain dicts,
+        so it works the same with a process pool.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+
+class GenerationProfiler:
+    """
+        Collects the stage timings and counters of a generation run and reports them as json.
+
+        Pass it to DapperFileGenerator(profiler=...). Every stage of every procedure is timed: read, decode,
+        parse, return_type, request, handler, render and write. The counters count bytes read and written,
+        tokens lexed, manifest and encoding cache hits and unchanged outputs.
+
+        timers are callables(stage, source, seconds) called for every timed stage, to send the timings
+        somewhere else than the report. profile captures a cProfile of the run and trace_memory a tracemalloc
+        snapshot. Both only see the current process, use workers=1 with them.
+    """
+
+    def __init__(self, slowest: int = 10, profile: bool = False, trace_memory: bool = False, timers: list | None = None):
+        self.slowest = slowest
+        self.timers = timers or []
+        self.profiler = profile and cProfile.Profile() or None
+        self.trace_memory = trace_memory
+
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.procedures = 0
+        self.failed = 0
+        # min heap of (seconds, order, source, stages) of the slowest procedures
+        self.slowest_procedures = []
+        self.started = None
+        self.wall_seconds = 0.0
+        self.memory = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.memory = {
+                "peak_bytes": peak,
+                "top": [{"site": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                        for stat in snapshot.statistics('lineno')[:REPORT_TOP_ENTRIES]]
+            }
+        if self.started is not None:
+            self.wall_seconds += time.perf_counter() - self.started
+            self.started = None
+
+    def add_timer(self, timer):
+        self.timers.append(timer)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def add_stage(self, name: str, source: str | None, seconds: float):
+        self.stage_seconds[name] += seconds
+        self.stage_calls[name] += 1
+        for timer in self.timers:
+            timer(name, source, seconds)
+
+    def add_result(self, result: dict):
+        """
+            Adds the timings and counters of a rendered procedure.
+        """
+        if result["error"]:
+            self.failed += 1
+        self.procedures += 1
+
+        stages = result.get("timings") or {}
+        for name, seconds in stages.items():
+            self.add_stage(name, result["source"], seconds)
+        for name, amount in (result.get("counters") or {}).items():
+            self.counters[name] += amount
+
+        entry = (sum(stages.values()), self.procedures, result["source"], stages)
+        if len(self.slowest_procedures) < self.slowest:
+            heapq.heappush(self.slowest_procedures, entry)
+        elif self.slowest_procedures and entry[0] > self.slowest_procedures[0][0]:
+            heapq.heapreplace(self.slowest_procedures, entry)
+
+    def report(self) -> dict:
+        total_seconds = sum(self.stage_seconds.values())
+        report = {
+            "procedures": self.procedures,
+            "failed": self.failed,
+            "wall_seconds": self.wall_seconds,
+            "stages": {name: {"seconds": seconds,
+                              "calls": self.stage_calls[name],
+                              "share": total_seconds and seconds / total_seconds or 0.0}
+                       for name, seconds in sorted(self.stage_seconds.items(), key=lambda item: -item[1])},
+            "counters": dict(sorted(self.counters.items())),
+            "slowest": [{"source": source, "seconds": seconds, "stages": stages}
+                        for seconds, _, source, stages in sorted(self.slowest_procedures, reverse=True)]
+        }
+        if self.memory:
+            report["memory"] = self.memory
+        if self.profiler:
+            report["profile"] = self.profile_entries()
+        return report
+
+    def profile_entries(self) -> list[dict]:
+        """
+            Returns the functions with the most cumulative time in the cProfile capture.
+        """
+        stats = pstats.Stats(self.profiler).stats
+        entries = sorted(stats.items(), key=lambda item: -item[1][3])[:REPORT_TOP_ENTRIES]
+        return [{"function": f"{file}:{line}({function})",
+                 "calls": calls,
+                 "total_seconds": total_seconds,
+                 "cumulative_seconds": cumulative_seconds}
+                for (file, line, function), (_, calls, total_seconds, cumulative_seconds, _) in entries]
+
+    def save_report(self, report_path: str):
+        """
+            Saves the report as json. With profile on, the raw cProfile stats are saved next to it
+            as <report_path>.prof, for snakeviz or pstats.
+        """
+        with open(report_path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+        if self.profiler:
+            self.profiler.dump_stats(f"{report_path}.prof")
@@ -0,0 +1,104 @@
+import os
+from dapper.output_writer import OutputWriter
+
+# first line of the section of a source in a bundle, the bundle is split back into its sections on it
+BUNDLE_SECTION_MARKER = "// dapper-source: "
+
+# size of the sections waiting to be merged into their bundles, past it the touched bundles are rewritten
+DEFAULT_MAX_PENDING_SECTIONS_BYTES = 4 * 1024 * 1024
+
+
+def split_sections(content: str) -> dict[str, str]:
+    """
+        Returns the sections of a bundle by source. Text before the first marker is not a section and is dropped.
+    """
+    sections = {}
+    source = None
+    lines = []
+    for line in content.splitlines(keepends=True):
+        if line.startswith(BUNDLE_SECTION_MARKER):
+            if source is not None:
+                sections[source] = "".join(lines)
+            source = line[len(BUNDLE_SECTION_MARKER):].rstrip("\r\n")
+            lines = []
+        elif source is not None:
+            lines.append(line)
+    if source is not None:
+        sections[source] = "".join(lines)
+    return sections
+
+
+def join_sections(sections: dict[str, str]) -> str:
+    # sorted by source, so the bundle is the same whatever the order the sources were generated in
+    return "\n".join(f"{BUNDLE_SECTION_MARKER}{source}\n{section.rstrip()}\n" for source, section in sorted(sections.items()))
+
+
+class OutputBundler:
+    """
+        Writes the sections of several sources to shared bundle files, e.g. every query of a folder to Queries.cs.
+
+        Each section starts with a marker line naming its source, so a bundle is its own store: an incremental
+        run reads the bundles its changed sources go to, replaces or removes their sections and rewrites them,
+        the sections of the unchanged sources are kept as they are without being generated again.
+        Changes are held until max_pending_bytes of sections are waiting, then the touched bundles are rewritten,
+        which keeps memory flat on a full run of a large folder. A bundle left without sections is deleted.
+
+        known_bundles are the bundles the manifest says the last run wrote. Any other existing file is
+        overwritten rather than merged, it is stale.
+    """
+
+    def __init__(self, writer: OutputWriter, known_bundles: set[str],
+                 max_pending_bytes: int = DEFAULT_MAX_PENDING_SECTIONS_BYTES):
+        self.writer = writer
+        self.known_bundles = set(known_bundles)
+        self.max_pending_bytes = max_pending_bytes
+        # bundle -> {source: section, or None to remove it}
+        self.pending = {}
+        self.pending_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.flush()
+
+    def write(self, bundle: str, source: str, section: str):
+        self.pending.setdefault(bundle, {})[source] = section
+        self.pending_bytes += len(section)
+        if self.pending_bytes >= self.max_pending_bytes:
+            self.flush()
+
+    def remove(self, bundle: str, source: str):
+        self.pending.setdefault(bundle, {})[source] = None
+
+    def flush(self):
+        """
+            Merges the pending sections into their bundles.
+        """
+        pending, self.pending, self.pending_bytes = self.pending, {}, 0
+        for bundle, changes in sorted(pending.items()):
+            sections = self.read_sections(bundle)
+            for source, section in changes.items():
+                if section is None:
+                    sections.pop(source, None)
+                else:
+                    sections[source] = section
+
+            self.known_bundles.add(bundle)
+            if sections:
+                self.writer.write(bundle, join_sections(sections))
+            else:
+                self.writer.remove(bundle)
+
+    def read_sections(self, bundle: str) -> dict[str, str]:
+        if bundle not in self.known_bundles:
+            return {}
+        # the pending writes of the bundle must be on disk before it is read back
+        self.writer.flush()
+        try:
+            with open(os.path.join(self.writer.output_folder_path, bundle), 'r', encoding='utf-8', newline='') as bundle_file:
+                content = bundle_file.read()
+        except FileNotFoundError:
+            return {}
+        return split_sections(content.replace(os.linesep, '\n'))
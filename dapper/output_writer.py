@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# writes handed to the thread pool and not flushed yet, a full queue makes the next write wait for the oldest
+DEFAULT_MAX_PENDING_WRITES = 64
+
+
+class OutputWriter:
+    """
+        Writes the generated files of a run.
+
+        Every file is written to a temp file in its folder and renamed over the target, so a crash never leaves
+        a half written .cs file. Each folder is created once per run, however many files go in it.
+        With threads > 0 the writes are flushed by a thread pool, which hides the latency of network file systems.
+        At most max_pending writes wait in the pool, their content included, so a slow disk slows the run down
+        instead of piling up the rendered files in memory.
+
+        Use as a context manager, or call close() to wait for the pending writes.
+    """
+
+    def __init__(self, output_folder_path: str, threads: int = 0, max_pending: int = DEFAULT_MAX_PENDING_WRITES):
+        self.output_folder_path = output_folder_path
+        self.created_folders = set()
+        self.executor = threads > 0 and ThreadPoolExecutor(max_workers=threads) or None
+        self.max_pending = max(1, max_pending)
+        self.pending = deque()
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "files_written": 0,
+            "bytes_written": 0,
+            "files_removed": 0,
+            "folders_created": 0,
+            # writes that waited for the queue of pending writes to drain
+            "write_waits": 0
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def write(self, relative_path: str, content: str):
+        file_path = os.path.join(self.output_folder_path, relative_path)
+        # folders are created here and not in the pool, so two threads never race on the same folder
+        self.ensure_folder(os.path.dirname(file_path))
+
+        # same line endings as a file opened with open(file_path, 'w')
+        if os.linesep != '\n':
+            content = content.replace('\n', os.linesep)
+        data = content.encode('utf-8')
+
+        if self.executor:
+            if len(self.pending) >= self.max_pending:
+                self.stats["write_waits"] += 1
+                self.pending.popleft().result()
+            self.pending.append(self.executor.submit(self.write_atomic, file_path, data))
+        else:
+            self.write_atomic(file_path, data)
+
+    def write_atomic(self, file_path: str, data: bytes):
+        folder_path, file_name = os.path.split(file_path)
+        # unique per process and thread, and created with the same permissions as the file it replaces would be
+        temp_path = os.path.join(folder_path, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self.stats_lock:
+            self.stats["files_written"] += 1
+            self.stats["bytes_written"] += len(data)
+
+    def ensure_folder(self, folder_path: str):
+        if folder_path in self.created_folders:
+            return
+        if not os.path.isdir(folder_path):
+            os.makedirs(folder_path, exist_ok=True)
+            self.stats["folders_created"] += 1
+        self.created_folders.add(folder_path)
+
+    def remove(self, relative_path: str):
+        """
+            Deletes a generated file, and its folder once it is empty.
+        """
+        self.flush()
+        file_path = os.path.join(self.output_folder_path, relative_path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            self.stats["files_removed"] += 1
+        folder_path = os.path.dirname(file_path)
+        if os.path.isdir(folder_path) and not os.listdir(folder_path):
+            os.rmdir(folder_path)
+            self.created_folders.discard(folder_path)
+
+    def flush(self):
+        """
+            Waits for the pending writes. Raises the first write error.
+        """
+        pending, self.pending = self.pending, deque()
+        for future in pending:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.executor:
+                self.executor.shutdown()
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sys
+from dapper.sp_utils import SPUtils
+
+# bump when the serialized form changes
+PROCEDURE_IR_FORMAT = 1
+
+DIRECTIONS = {direction: direction for direction in ("IN", "OUT", "INOUT")}
+
+
+def intern_or_none(value: str | None) -> str | None:
+    return None if value is None else sys.intern(value)
+
+
+class ParamIR:
+    """
+        A param of a SP: @site_name NVARCHAR(60) OUT.
+
+        Only the declaration is stored, in slots, with its names and types interned so a corpus holds one string
+        per type and per common param name. The C# names and types the emitters need are computed when asked for.
+    """
+    __slots__ = ("name", "sql_type", "length", "precision", "scale", "direction", "table_type")
+
+    def __init__(self, name: str, sql_type: str, length: int | None = None, precision: int | None = None,
+                 scale: int | None = None, direction: str = "IN", table_type: str | None = None):
+        self.name = sys.intern(name)
+        # upper cased type name without its schema and size, NVARCHAR
+        self.sql_type = sys.intern(sql_type)
+        # declared length of a string or binary, -1 for MAX
+        self.length = length
+        # declared precision and scale of a decimal, the scale is also the fractional seconds of a time
+        self.precision = precision
+        self.scale = scale
+        # IN, OUT or INOUT
+        self.direction = DIRECTIONS[direction]
+        # schema qualified name of the table type of a READONLY param
+        self.table_type = intern_or_none(table_type)
+
+    def __repr__(self):
+        return f"ParamIR({self.to_list()!r})"
+
+    @property
+    def is_output(self) -> bool:
+        return self.direction != "IN"
+
+    @property
+    def camel_case_name(self) -> str:
+        return SPUtils.snake_case_to_camel_case(self.name)
+
+    @property
+    def pascal_case_name(self) -> str:
+        return SPUtils.snake_case_to_pascal_case(self.name)
+
+    @property
+    def csharp_type(self) -> str:
+        return SPUtils.sql_type_to_csharp_type(self.sql_type)
+
+    @property
+    def sql_db_type(self) -> str:
+        return SPUtils.str_to_sql_db_type(self.sql_type)
+
+    @property
+    def csharp_param_direction(self) -> str:
+        return SPUtils.str_to_dapper_param_direction(self.direction)
+
+    @property
+    def records_method_name(self) -> str | None:
+        """
+            The handler method turning the rows of a table-valued param into SqlDataRecords.
+        """
+        return self.table_type and f"{self.pascal_case_name}Records" or None
+
+    def to_list(self) -> list:
+        return [self.name, self.sql_type, self.length, self.precision, self.scale, self.direction, self.table_type]
+
+    @staticmethod
+    def from_list(values: list) -> 'ParamIR':
+        return ParamIR(*values)
+
+
+class ColumnIR:
+    """
+        A column of a result set, with the C# type of its property.
+    """
+    __slots__ = ("name", "csharp_type")
+
+    def __init__(self, name: str, csharp_type: str):
+        self.name = sys.intern(name)
+        self.csharp_type = sys.intern(csharp_type)
+
+    def __repr__(self):
+        return f"ColumnIR({self.name!r}, {self.csharp_type!r})"
+
+    def to_list(self) -> list:
+        return [self.name, self.csharp_type]
+
+    @staticmethod
+    def from_list(values: list) -> 'ColumnIR':
+        return ColumnIR(*values)
+
+
+class ResultSetIR:
+    """
+        A result set of a SP. A SELECT * has no known columns, a SELECT TOP 1 is a single row.
+    """
+    __slots__ = ("columns", "is_single", "is_star")
+
+    def __init__(self, columns: tuple[ColumnIR, ...], is_single: bool = False, is_star: bool = False):
+        self.columns = columns
+        self.is_single = is_single
+        self.is_star = is_star
+
+    def to_list(self) -> list:
+        return [self.is_single, self.is_star, [column.to_list() for column in self.columns]]
+
+    @staticmethod
+    def from_list(values: list) -> 'ResultSetIR':
+        is_single, is_star, columns = values
+        return ResultSetIR(tuple(ColumnIR.from_list(column) for column in columns), is_single, is_star)
+
+
+class ProcedureIR:
+    """
+        What the generators know about a SP once it is parsed: its names, type, params, result sets and annotations.
+        A corpus of them can be saved and loaded by other tools without reparsing the scripts.
+
+        Serialized form, one list per procedure:
+            "format": 1,
+            "procedures": [
+                ["usp_get_alerts", "get_alerts", "query",
+                 [["alert_id", "INT", null, null, null, "IN", null], ...],
+                 [[false, false, [["alert_id", "int"], ...]], ...],
+                 {"cache": {"ttl": "60"}}]
+            ]
+    """
+    __slots__ = ("procedure_name", "sp_name", "sp_type", "params", "result_sets", "annotations")
+
+    def __init__(self, procedure_name: str, sp_name: str, sp_type: str, params: tuple[ParamIR, ...],
+                 result_sets: tuple[ResultSetIR, ...] = (), annotations: dict[str, dict[str, str]] | None = None):
+        # the name the procedure is created with, usp_get_alerts
+        self.procedure_name = procedure_name
+        # the name without its usp_ prefix, the generated classes are named after it
+        self.sp_name = sp_name
+        self.sp_type = sys.intern(sp_type)
+        self.params = params
+        self.result_sets = result_sets
+        self.annotations = annotations or {}
+
+    def __repr__(self):
+        return f"ProcedureIR({self.procedure_name!r}, {len(self.params)} params, {len(self.result_sets)} result sets)"
+
+    def to_list(self) -> list:
+        return [self.procedure_name, self.sp_name, self.sp_type,
+                [param.to_list() for param in self.params],
+                [result_set.to_list() for result_set in self.result_sets],
+                self.annotations]
+
+    @staticmethod
+    def from_list(values: list) -> 'ProcedureIR':
+        procedure_name, sp_name, sp_type, params, result_sets, annotations = values
+        return ProcedureIR(procedure_name, sp_name, sp_type,
+                           tuple(ParamIR.from_list(param) for param in params),
+                           tuple(ResultSetIR.from_list(result_set) for result_set in result_sets),
+                           annotations)
+
+
+def save_procedures(procedures, ir_path: str) -> int:
+    """
+        Saves the procedures as compact json. Returns the number of procedures saved.
+    """
+    lists = [procedure.to_list() for procedure in procedures]
+    with open(ir_path, 'w', encoding='utf-8') as ir_file:
+        json.dump({"format": PROCEDURE_IR_FORMAT, "procedures": lists}, ir_file, separators=(',', ':'))
+    return len(lists)
+
+
+def load_procedures(ir_path: str) -> list[ProcedureIR]:
+    with open(ir_path, 'rb') as ir_file:
+        stored = json.loads(ir_file.read())
+    if stored.get("format") != PROCEDURE_IR_FORMAT:
+        raise ValueError(f"{ir_path} was saved by another version of the generator, save it again")
+    return [ProcedureIR.from_list(values) for values in stored["procedures"]]
+
+
+if __name__ == '__main__':
+    # imported here, the generators themselves import this module
+    from dapper.dapper_generator import DapperGenerator
+    from dapper.schema_index import load_schema_index, iter_script_files
+    from dapper.sql_dump_reader import iter_procedures
+
+    parser = argparse.ArgumentParser(description="Saves the parsed procedures of sql files to a json file.")
+    parser.add_argument("ir_path", help="json file to write, load it with dapper.procedure_ir.load_procedures")
+    parser.add_argument("sql_paths", nargs="+", help="sql files, folders of sql files or scripted databases")
+    parser.add_argument("--schema-index", help="index file built by dapper.schema_index, types the result columns")
+    args = parser.parse_args()
+
+    schema_index = args.schema_index and load_schema_index(args.schema_index) or None
+    procedures = (DapperGenerator(sp.sp_text, schema_index=schema_index).procedure_ir()
+                  for file_path in iter_script_files(args.sql_paths)
+                  for _, sp in iter_procedures(file_path))
+    count = save_procedures(procedures, args.ir_path)
+    print(f"Saved {count} procedures to {args.ir_path} ({os.path.getsize(args.ir_path)} bytes)")
@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple
+from dapper.generation_manifest import hash_bytes
+from dapper.sp_utils import SPUtils
+from dapper.sql_discovery import iter_sql_files
+from dapper.sql_dump_reader import iter_batches
+from dapper.sql_lexer import tokenize, split_top_level, Token, WORD, IDENTIFIER, NUMBER, STRING, COMMENT
+from dapper.stored_procedure import StoredProcedure
+
+# bump when the file format changes
+SCHEMA_INDEX_FORMAT = 1
+
+# cheap check before a batch is lexed
+CREATE_PATTERN = re.compile(r'\bCREATE\b', re.IGNORECASE)
+
+# words that start a table constraint instead of a column in CREATE TABLE
+TABLE_CONSTRAINT_WORDS = {'CONSTRAINT', 'PRIMARY', 'UNIQUE', 'FOREIGN', 'CHECK', 'INDEX', 'PERIOD'}
+
+# aggregates whose type doesn't depend on their argument
+AGGREGATE_TYPES = {'COUNT': 'INT', 'COUNT_BIG': 'BIGINT'}
+
+
+class ColumnInfo(NamedTuple):
+    sql_type: str
+    nullable: bool
+    # characters or bytes of a (n)char, (n)varchar or (var)binary, -1 for MAX, None for the other types
+    length: int | None
+    # digits of a decimal or numeric, None for the other types
+    precision: int | None = None
+    # decimals of a decimal or numeric, fractional second digits of a declared datetime2, time or datetimeoffset
+    scale: int | None = None
+
+    def csharp_type(self) -> str:
+        return SPUtils.sql_type_to_csharp_type(self.sql_type, self.nullable)
+
+
+class SchemaIndex:
+    """
+        The type, nullability and length of every column of the tables, views and table types of a database,
+        built from their CREATE TABLE, CREATE VIEW and CREATE TYPE ... AS TABLE scripts.
+
+        Lookups of table.column are a single dict access. Names are case insensitive and the schema is ignored,
+        like the procedures reference their tables.
+
+        Index file example:
+            "format": 1,
+            "tables": {
+                "tbluser": {"user_id": ["INT", false, null, null, null], "email": ["NVARCHAR", true, 255, null, null], ...}
+            }
+    """
+
+    def __init__(self):
+        # "table.column" -> ColumnInfo
+        self.columns = {}
+        # table -> column names, in the order of the script
+        self.tables = {}
+        self.source_hash = ""
+
+    def column(self, table: str, column: str) -> ColumnInfo | None:
+        return self.columns.get(f"{table.lower()}.{column.lower()}")
+
+    def add_column(self, table: str, column: str, column_info: ColumnInfo):
+        table = table.lower()
+        column = column.lower()
+        key = f"{table}.{column}"
+        if key not in self.columns:
+            self.tables.setdefault(table, []).append(column)
+        self.columns[key] = column_info
+
+    def table_columns(self, table: str) -> list[tuple[str, ColumnInfo]]:
+        """
+            Returns the (column, column info) of a table, view or table type in the order of its script.
+        """
+        table = table.lower()
+        return [(column, self.columns[f"{table}.{column}"]) for column in self.tables.get(table, [])]
+
+    def resolve(self, expression: list[Token], tables: dict[str, str | None]) -> ColumnInfo | None:
+        """
+            Returns the column info of a SELECT list expression, or None when it can't be known.
+
+            tables maps the aliases and table names of the FROM clause to their table, see StoredProcedure.parse_from_tables.
+            table.column, alias.column and column resolve through the index, an unqualified column only when exactly one
+            table of the FROM clause has it. CAST, CONVERT, ISNULL, COALESCE and COUNT are typed from their arguments.
+        """
+        if not expression:
+            return None
+
+        if is_column_reference(expression):
+            names = [token.name() for token in expression if not token.is_punct('.')]
+            if len(names) > 1:
+                # an alias, or a table name that isn't in the FROM clause
+                table = tables.get(names[-2].lower(), names[-2])
+                return table and self.column(table, names[-1]) or None
+
+            matches = [column_info for table in set(filter(None, tables.values()))
+                       if (column_info := self.column(table, names[0]))]
+            return len(matches) == 1 and matches[0] or None
+
+        function_name = expression[0].kind == WORD and len(expression) > 2 and expression[1].is_punct('(') \
+            and StoredProcedure.skip_parentheses(expression, 1) == len(expression) and expression[0].upper()
+        if not function_name:
+            return None
+        arguments = split_top_level(expression[2:-1])
+
+        if function_name in AGGREGATE_TYPES:
+            return ColumnInfo(AGGREGATE_TYPES[function_name], False, None)
+
+        if function_name == 'CAST' and arguments:
+            # CAST(expression AS type)
+            as_index = max((index for index, token in enumerate(arguments[0]) if token.is_word('AS')), default=None)
+            if as_index is None:
+                return None
+            column_info, _ = parse_type(arguments[0], as_index + 1)
+            source = self.resolve(arguments[0][:as_index], tables)
+            return column_info._replace(nullable=source is None or source.nullable)
+
+        if function_name in ('CONVERT', 'TRY_CONVERT') and len(arguments) > 1:
+            # CONVERT(type, expression [, style])
+            column_info, _ = parse_type(arguments[0], 0)
+            source = self.resolve(arguments[1], tables)
+            return column_info._replace(nullable=function_name == 'TRY_CONVERT' or source is None or source.nullable)
+
+        if function_name in ('ISNULL', 'COALESCE') and arguments:
+            column_info = self.resolve(arguments[0], tables)
+            if column_info is None:
+                return None
+            # a literal fallback can't be NULL
+            fallback = arguments[-1]
+            not_null = len(fallback) == 1 and fallback[0].kind in (NUMBER, STRING) \
+                or (fallback_info := self.resolve(fallback, tables)) is not None and not fallback_info.nullable
+            return column_info._replace(nullable=column_info.nullable and not not_null)
+
+        return None
+
+    def add_table_script(self, tokens: list[Token], position: int, table_type: bool = False):
+        """
+            Adds the columns of the CREATE TABLE whose name starts at position,
+            or of the CREATE TYPE ... AS TABLE with table_type.
+        """
+        table, position = parse_object_name(tokens, position)
+        if table_type:
+            # CREATE TYPE name FROM base_type is an alias type, not a table type
+            if position + 1 >= len(tokens) or not tokens[position].is_word('AS') or not tokens[position + 1].is_word('TABLE'):
+                return
+            position += 2
+        # temp tables only live in the procedure that creates them
+        if table is None or table.startswith('#') or position >= len(tokens) or not tokens[position].is_punct('('):
+            return
+
+        definitions = split_top_level(tokens[position + 1:StoredProcedure.skip_parentheses(tokens, position) - 1])
+        for definition in definitions:
+            first = definition[0]
+            if first.kind == WORD and first.upper() in TABLE_CONSTRAINT_WORDS or len(definition) < 2:
+                continue
+            # a computed column has no declared type
+            if definition[1].is_word('AS'):
+                continue
+
+            column_info, rest = parse_type(definition, 1)
+            words = [token.upper() for token in definition[rest:] if token.kind == WORD]
+            not_null = any(word == 'NULL' and index > 0 and words[index - 1] == 'NOT' for index, word in enumerate(words)) \
+                or 'IDENTITY' in words or 'PRIMARY' in words or 'ROWGUIDCOL' in words
+            self.add_column(table, first.name(), column_info._replace(nullable=not not_null))
+
+    def add_view_script(self, tokens: list[Token], position: int):
+        """
+            Adds the columns of the CREATE VIEW whose name starts at position. The columns are typed from the tables
+            and views it selects from, the ones that can't be typed are left out.
+        """
+        view, position = parse_object_name(tokens, position)
+        if view is None:
+            return
+
+        column_names = None
+        if position < len(tokens) and tokens[position].is_punct('('):
+            end = StoredProcedure.skip_parentheses(tokens, position)
+            column_names = [token.name() for token in tokens[position + 1:end - 1] if not token.is_punct(',')]
+            position = end
+
+        # WITH SCHEMABINDING ... AS [WITH cte AS (...)] SELECT
+        select_index = next((index for index in range(position, len(tokens)) if tokens[index].is_word('SELECT')), None)
+        if select_index is None:
+            return
+
+        select = StoredProcedure.parse_select(tokens, select_index)
+        tables = StoredProcedure.parse_from_tables(tokens, select["from_index"])
+        for column_index, column_tokens in enumerate(select["columns"]):
+            column_name, expression = StoredProcedure.select_column(column_tokens)
+            if column_names and column_index < len(column_names):
+                column_name = column_names[column_index]
+            column_info = self.resolve(expression, tables)
+            if column_info:
+                self.add_column(view, column_name, column_info)
+
+    def save(self, index_path: str):
+        tables = {table: {column: list(self.columns[f"{table}.{column}"]) for column in columns}
+                  for table, columns in self.tables.items()}
+        with open(index_path, 'w', encoding='utf-8') as index_file:
+            json.dump({"format": SCHEMA_INDEX_FORMAT, "tables": tables}, index_file, separators=(',', ':'))
+
+    @staticmethod
+    def load(index_path: str) -> 'SchemaIndex':
+        with open(index_path, 'rb') as index_file:
+            data = index_file.read()
+
+        stored = json.loads(data)
+        if stored.get("format") != SCHEMA_INDEX_FORMAT:
+            raise ValueError(f"{index_path} was built by another version of the generator, rebuild it")
+
+        index = SchemaIndex()
+        for table, columns in stored["tables"].items():
+            for column, values in columns.items():
+                index.add_column(table, column, ColumnInfo(*values))
+        index.source_hash = hash_bytes(data)
+        return index
+
+
+@lru_cache(maxsize=None)
+def load_schema_index(index_path: str) -> SchemaIndex:
+    """
+        Loads an index file once per process.
+    """
+    return SchemaIndex.load(index_path)
+
+
+def build_schema_index(script_paths: list[str]) -> SchemaIndex:
+    """
+        Builds the index from sql files, or folders of sql files, scripting CREATE TABLE, CREATE VIEW
+        and CREATE TYPE ... AS TABLE statements.
+        One object per file or a whole database scripted to one file both work.
+    """
+    index = SchemaIndex()
+    views = []
+
+    for file_path in iter_script_files(script_paths):
+        for _, batch_text in iter_batches(file_path):
+            if not CREATE_PATTERN.search(batch_text):
+                continue
+            tokens = [token for token in tokenize(batch_text) if token.kind != COMMENT]
+            for position in range(1, len(tokens)):
+                if not tokens[position - 1].is_word('CREATE', 'ALTER'):
+                    continue
+                if tokens[position].is_word('TABLE'):
+                    index.add_table_script(tokens, position + 1)
+                elif tokens[position].is_word('TYPE'):
+                    index.add_table_script(tokens, position + 1, table_type=True)
+                elif tokens[position].is_word('VIEW'):
+                    views.append((tokens, position + 1))
+
+    # views are typed once every table is known, twice so a view can select from a view scripted after it
+    for _ in range(2):
+        for tokens, position in views:
+            index.add_view_script(tokens, position)
+
+    return index
+
+
+def iter_script_files(script_paths: list[str]):
+    """
+        Yields the files, and the sql files of the folders and their sub folders, in the order of iter_sql_files.
+    """
+    for script_path in script_paths:
+        if os.path.isdir(script_path):
+            for relative_path in iter_sql_files(script_path):
+                yield os.path.join(script_path, *relative_path.split('/'))
+        else:
+            yield script_path
+
+
+def is_column_reference(tokens: list[Token]) -> bool:
+    """
+        True for column, table.column and schema.table.column.
+    """
+    return len(tokens) % 2 == 1 and all(
+        index % 2 == 0 and token.kind in (WORD, IDENTIFIER) or index % 2 == 1 and token.is_punct('.')
+        for index, token in enumerate(tokens))
+
+
+def parse_object_name(tokens: list[Token], position: int) -> tuple[str | None, int]:
+    """
+        Reads a [database.][schema.]name at position. Returns the name without its schema and the position after it.
+    """
+    count = len(tokens)
+    if position >= count or tokens[position].kind not in (WORD, IDENTIFIER):
+        return None, position
+    name = tokens[position].name()
+    position += 1
+    while position + 1 < count and tokens[position].is_punct('.') and tokens[position + 1].kind in (WORD, IDENTIFIER):
+        name = tokens[position + 1].name()
+        position += 2
+    return name, position
+
+
+def parse_type(tokens: list[Token], position: int) -> tuple[ColumnInfo, int]:
+    """
+        Reads a type at position: [schema.]name[(length | MAX | precision, scale)].
+        Returns its nullable column info, with the upper cased type name, and the position after the type.
+    """
+    sql_type, position = parse_object_name(tokens, position)
+    sql_type = (sql_type or '').upper()
+    arguments = []
+    if position < len(tokens) and tokens[position].is_punct('('):
+        end = StoredProcedure.skip_parentheses(tokens, position)
+        arguments = [token.value for token in tokens[position + 1:end - 1] if not token.is_punct(',')]
+        position = end
+    length, precision, scale = SPUtils.sql_type_size(sql_type, arguments)
+    return ColumnInfo(sql_type, True, length, precision, scale), position
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the schema index from CREATE TABLE, CREATE VIEW and CREATE TYPE scripts.")
+    parser.add_argument("index_path", help="index file to write, pass it to DapperFileGenerator(schema_index_path=...)")
+    parser.add_argument("script_paths", nargs="+", help="sql files or folders of sql files")
+    args = parser.parse_args()
+
+    schema_index = build_schema_index(args.script_paths)
+    schema_index.save(args.index_path)
+    print(f"Indexed {len(schema_index.columns)} columns of {len(schema_index.tables)} tables and views")
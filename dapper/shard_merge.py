@@ -0,0 +1,136 @@
+import argparse
+import os
+import shutil
+import sys
+from dapper.generation_manifest import GenerationManifest, cached_queries, unresolved_invalidations
+from dapper.output_writer import OutputWriter
+from dapper.sql_discovery import iter_sql_files, shard_index
+
+
+def same_content(first_path: str, second_path: str) -> bool:
+    if not os.path.exists(second_path) or os.path.getsize(first_path) != os.path.getsize(second_path):
+        return False
+    with open(first_path, 'rb') as first_file, open(second_path, 'rb') as second_file:
+        return first_file.read() == second_file.read()
+
+
+def check_shards(sp_folder_path: str, shard_folders: list[str], include=None, exclude=None) -> tuple[list[str], dict]:
+    """
+        Checks the outputs of the shards of a run generated together cover every sql file of the folder.
+
+        shard_folders are the output folders of the shards 1 to N, in order. Every sql file the globs select
+        must be in the manifest of exactly the shard it hashes to, with all its outputs, and no two sources
+        may claim the same output. A file that failed to generate is not in its manifest and is reported missing.
+        The queries a command clears with @dapper:invalidates must be generated with @dapper:cache by a shard.
+
+        Returns the problems found and the merged manifest sources.
+    """
+    problems = []
+    sources = {}
+    # output -> source claiming it
+    claimed_outputs = {}
+    stamps = set()
+    count = len(shard_folders)
+
+    for index, shard_folder in enumerate(shard_folders, 1):
+        manifest = GenerationManifest.read(shard_folder)
+        if manifest is None:
+            problems.append(f"shard {index}/{count} has no manifest in {shard_folder}")
+            continue
+        stamps.add((manifest.get("generator_version"), manifest.get("settings")))
+
+        for source, entry in manifest.get("sources", {}).items():
+            if source in sources:
+                problems.append(f"{source} was generated by several shards")
+                continue
+            if shard_index(source, count) != index:
+                problems.append(f"{source} was generated by shard {index}/{count}, it belongs to shard "
+                                f"{shard_index(source, count)}, were the shards run with another count?")
+            sources[source] = {**entry, "shard_folder": shard_folder}
+
+            for output in entry["outputs"]:
+                if output in claimed_outputs:
+                    problems.append(f"{output} is generated by both {claimed_outputs[output]} and {source}")
+                claimed_outputs[output] = source
+                if not os.path.exists(os.path.join(shard_folder, output)):
+                    problems.append(f"{output} of {source} is missing from {shard_folder}")
+
+    if len(stamps) > 1:
+        problems.append("the shards were generated by different versions of the generator or with different settings")
+
+    expected = set(iter_sql_files(sp_folder_path, include, exclude))
+    problems.extend(f"{source} was not generated by any shard" for source in sorted(expected - sources.keys()))
+    problems.extend(f"{source} was generated but is not in {sp_folder_path} anymore"
+                    for source in sorted(sources.keys() - expected))
+
+    # a shard run can't check the queries of the other shards
+    cached = cached_queries(sources)
+    for source in sorted(sources):
+        unresolved = unresolved_invalidations(sources[source].get("invalidates", {}), cached)
+        if unresolved:
+            problems.append(f"{source}: {', '.join(unresolved)} of @dapper:invalidates is not a query generated "
+                            f"with @dapper:cache in the same folder")
+
+    return problems, sources
+
+
+def merge_shards(sp_folder_path: str, shard_folders: list[str], output_folder_path: str | None = None,
+                 include=None, exclude=None) -> list[str]:
+    """
+        Checks the shards with check_shards, then copies their outputs to output_folder_path with a manifest
+        of every source, so the merged folder is the same as a run without shards. Nothing is copied when
+        a check fails. Outputs with the same content are not rewritten and the outputs of the last merge that
+        no source claims anymore are removed. Returns the problems found.
+    """
+    problems, sources = check_shards(sp_folder_path, shard_folders, include, exclude)
+    for problem in problems:
+        print(problem)
+    if problems or not output_folder_path:
+        if not problems:
+            print(f"The {len(shard_folders)} shards cover the {len(sources)} sql files")
+        return problems
+
+    previous = GenerationManifest.read(output_folder_path) or {}
+    first = GenerationManifest.read(shard_folders[0])
+    manifest = GenerationManifest(output_folder_path, "")
+    manifest.generator_version = first["generator_version"]
+    manifest.settings = first["settings"]
+
+    copied = 0
+    with OutputWriter(output_folder_path) as writer:
+        for source, entry in sources.items():
+            shard_folder = entry.pop("shard_folder")
+            for output in entry["outputs"]:
+                shard_path = os.path.join(shard_folder, output)
+                output_path = os.path.join(output_folder_path, output)
+                if same_content(shard_path, output_path):
+                    continue
+                writer.ensure_folder(os.path.dirname(output_path))
+                shutil.copyfile(shard_path, output_path)
+                copied += 1
+            manifest.sources[source] = entry
+
+        claimed_outputs = {output for entry in sources.values() for output in entry["outputs"]}
+        for entry in previous.get("sources", {}).values():
+            for output in entry["outputs"]:
+                if output not in claimed_outputs:
+                    writer.remove(output)
+
+    manifest.save()
+    print(f"Merged {len(shard_folders)} shards, {len(sources)} sql files: copied {copied} files, "
+          f"removed {writer.stats['files_removed']} files")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Checks the output folders of a sharded run cover every sql file "
+                                                 "and merges them into one output folder.")
+    parser.add_argument("sp_folder_path", help="the sp folder the shards were generated from")
+    parser.add_argument("shard_folders", nargs="+", help="output folders of the shards 1 to N, in order")
+    parser.add_argument("--output", help="folder to merge the shards into, only checks them when omitted")
+    parser.add_argument("--include", action="append", help="the include globs of the run, repeatable")
+    parser.add_argument("--exclude", action="append", help="the exclude globs of the run, repeatable")
+    args = parser.parse_args()
+
+    found = merge_shards(args.sp_folder_path, args.shard_folders, args.output, args.include, args.exclude)
+    sys.exit(found and 1 or 0)
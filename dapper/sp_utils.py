@@ -1,5 +1,61 @@
 import re
 
+# SQL Server type -> C# type of the column or parameter
+SQL_CSHARP_TYPES = {
+    "BIGINT": "long", "INT": "int", "SMALLINT": "short", "TINYINT": "byte", "BIT": "bool",
+    "DECIMAL": "decimal", "NUMERIC": "decimal", "MONEY": "decimal", "SMALLMONEY": "decimal",
+    "FLOAT": "double", "REAL": "float",
+    "DATE": "DateTime", "DATETIME": "DateTime", "DATETIME2": "DateTime", "SMALLDATETIME": "DateTime",
+    "DATETIMEOFFSET": "DateTimeOffset", "TIME": "TimeSpan",
+    "CHAR": "string", "VARCHAR": "string", "TEXT": "string", "NCHAR": "string", "NVARCHAR": "string",
+    "NTEXT": "string", "XML": "string", "SYSNAME": "string",
+    "BINARY": "byte[]", "VARBINARY": "byte[]", "IMAGE": "byte[]", "ROWVERSION": "byte[]", "TIMESTAMP": "byte[]",
+    "UNIQUEIDENTIFIER": "Guid", "SQL_VARIANT": "object"
+}
+
+# SQL Server type -> DbType of the parameter, Ansi for the varchar types so SQL Server doesn't convert the column
+SQL_DB_TYPES = {
+    "BIGINT": "Int64", "INT": "Int32", "SMALLINT": "Int16", "TINYINT": "Byte", "BIT": "Boolean",
+    "DECIMAL": "Decimal", "NUMERIC": "Decimal", "MONEY": "Currency", "SMALLMONEY": "Currency",
+    "FLOAT": "Double", "REAL": "Single",
+    "DATE": "Date", "DATETIME": "DateTime", "DATETIME2": "DateTime2", "SMALLDATETIME": "DateTime",
+    "DATETIMEOFFSET": "DateTimeOffset", "TIME": "Time",
+    "CHAR": "AnsiStringFixedLength", "VARCHAR": "AnsiString", "TEXT": "AnsiString",
+    "NCHAR": "StringFixedLength", "NVARCHAR": "String", "NTEXT": "String", "XML": "Xml", "SYSNAME": "String",
+    "BINARY": "Binary", "VARBINARY": "Binary", "IMAGE": "Binary", "ROWVERSION": "Binary", "TIMESTAMP": "Binary",
+    "UNIQUEIDENTIFIER": "Guid", "SQL_VARIANT": "Object"
+}
+
+# types declared with a (length), the length of a declaration without one
+SIZED_SQL_TYPES = {"CHAR": 1, "VARCHAR": 1, "NCHAR": 1, "NVARCHAR": 1, "BINARY": 1, "VARBINARY": 1, "SYSNAME": 128}
+
+# types declared with a (precision, scale), the default precision and scale
+DECIMAL_SQL_TYPES = {"DECIMAL": (18, 0), "NUMERIC": (18, 0)}
+
+# types declared with a (fractional seconds scale)
+TIME_SQL_TYPES = {"DATETIME2", "TIME", "DATETIMEOFFSET"}
+
+# [dbo].[NVARCHAR](60) -> NVARCHAR
+SQL_TYPE_NAME_PATTERN = re.compile(r'^\s*(?:\[?\w+\]?\s*\.\s*)*\[?(\w+)')
+
+# separators of the parts of a namespace: dots, and the folders of a path on any platform
+NAMESPACE_SEPARATOR_PATTERN = re.compile(r'[./\\]')
+
+# C# keywords, a member with one of these names needs an @ prefix
+CSHARP_KEYWORDS = {
+    "abstract", "as", "base", "bool", "break", "byte", "case", "catch", "char", "checked", "class", "const",
+    "continue", "decimal", "default", "delegate", "do", "double", "else", "enum", "event", "explicit", "extern",
+    "false", "finally", "fixed", "float", "for", "foreach", "goto", "if", "implicit", "in", "int", "interface",
+    "internal", "is", "lock", "long", "namespace", "new", "null", "object", "operator", "out", "override", "params",
+    "private", "protected", "public", "readonly", "ref", "return", "sbyte", "sealed", "short", "sizeof",
+    "stackalloc", "static", "string", "struct", "switch", "this", "throw", "true", "try", "typeof", "uint", "ulong",
+    "unchecked", "unsafe", "ushort", "using", "virtual", "void", "volatile", "while"
+}
+
+# the C# types that need a ? to hold a NULL
+CSHARP_VALUE_TYPES = {"long", "int", "short", "byte", "bool", "decimal", "double", "float", "DateTime",
+                      "DateTimeOffset", "TimeSpan", "Guid"}
+
 
 class SPUtils:
     """
@@ -52,22 +108,52 @@ class SPUtils:
             x.capitalize() or '_' for x in snake_case.split('_'))
         return camel_case
 
+    @staticmethod
+    def to_namespace_parts(path: str) -> list[str]:
+        """
+            Splits dotted names and folder paths into PascalCase C# identifiers: sp_test/sp-site -> [SpTest, SpSite].
+            Characters not allowed in an identifier split words, an identifier can't start with a digit.
+        """
+        parts = []
+        for part in NAMESPACE_SEPARATOR_PATTERN.split(path):
+            if part in ('', '.', '..'):
+                continue
+            part = SPUtils.to_pascal_case(re.sub(r'\W', '_', part))
+            parts.append(part[:1].isdigit() and f"_{part}" or part)
+        return parts
+
+    @staticmethod
+    def to_csharp_identifier(name: str):
+        """
+            Returns the name as a C# identifier: class -> @class. Dapper sees the name without the @.
+        """
+        if name in CSHARP_KEYWORDS:
+            return f"@{name}"
+        return name
+
+    @staticmethod
+    def sql_type_name(type: str):
+        """
+            Returns the upper cased name of a declared type, without its schema, brackets and length: [dbo].[nvarchar](60) -> NVARCHAR
+        """
+        match = SQL_TYPE_NAME_PATTERN.match(type)
+        return match and match.group(1).upper() or ""
+
     @staticmethod
     def str_to_csharp_type(type: str):
         """
-            Converts a string to a C# type
-        """
-        csharp_type = ""
-        if type == "INT":
-            csharp_type = "int"
-        elif type == "VARCHAR":
-            csharp_type = "string"
-        elif type == "DATETIME":
-            csharp_type = "DateTime"
-        elif type == "BIT":
-            csharp_type = "bool"
-        else:
-            csharp_type = "string"
+            Converts a declared SQL type to a C# type, NVARCHAR(60) -> string
+        """
+        return SPUtils.sql_type_to_csharp_type(SPUtils.sql_type_name(type))
+
+    @staticmethod
+    def sql_type_to_csharp_type(sql_type: str, nullable: bool = False):
+        """
+            Converts a SQL Server type name to its C# type. Value types of nullable columns get a ?.
+        """
+        csharp_type = SQL_CSHARP_TYPES.get(sql_type.upper(), "string")
+        if nullable and csharp_type in CSHARP_VALUE_TYPES:
+            csharp_type += "?"
         return csharp_type
 
     @staticmethod
@@ -87,17 +173,26 @@ class SPUtils:
     @staticmethod
     def str_to_sql_db_type(type: str):
         """
-            Converts a string to a C# type
-        """
-        sql_db_type = ""
-        if type == "INT":
-            sql_db_type = "DbType.Int32"
-        elif type == "VARCHAR":
-            sql_db_type = "DbType.String"
-        elif type == "DATETIME":
-            sql_db_type = "DbType.DateTime"
-        elif type == "BIT":
-            sql_db_type = "DbType.Boolean"
-        else:
-            sql_db_type = "DbType.String"
-        return sql_db_type
+            Converts a declared SQL type to its DbType, VARCHAR(50) -> DbType.AnsiString. Unknown types, e.g. alias types, are DbType.String.
+        """
+        return f"DbType.{SQL_DB_TYPES.get(SPUtils.sql_type_name(type), 'String')}"
+
+    @staticmethod
+    def sql_type_size(sql_type: str, arguments: list[str]) -> tuple[int | None, int | None, int | None]:
+        """
+            Returns the length, precision and scale of a declared type from its upper cased name and (arguments).
+
+            VARCHAR(50) -> (50, None, None), NVARCHAR(MAX) -> (-1, None, None), DECIMAL(18, 2) -> (None, 18, 2),
+            DATETIME2(3) -> (None, None, 3). A missing length or precision gets the SQL Server default, VARCHAR is VARCHAR(1).
+        """
+        numbers = [int(argument) for argument in arguments if argument.isdigit()]
+        if sql_type in SIZED_SQL_TYPES:
+            if any(argument.upper() == 'MAX' for argument in arguments):
+                return -1, None, None
+            return numbers and numbers[0] or SIZED_SQL_TYPES[sql_type], None, None
+        if sql_type in DECIMAL_SQL_TYPES:
+            precision, scale = DECIMAL_SQL_TYPES[sql_type]
+            return None, numbers and numbers[0] or precision, len(numbers) > 1 and numbers[1] or scale
+        if sql_type in TIME_SQL_TYPES and numbers:
+            return None, None, numbers[0]
+        return None, None, None
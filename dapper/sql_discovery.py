@@ -0,0 +1,77 @@
+import hashlib
+import os
+from fnmatch import fnmatchcase
+
+# the files generated when no include pattern is given
+DEFAULT_INCLUDE = ("*.sql",)
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+        Parses a --shard option, 2/4 is the second of four shards. Raises ValueError for anything else.
+    """
+    index, _, count = shard.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"shard must be written index/count, like 2/4, not {shard!r}") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"shard {shard} is out of range, the index goes from 1 to the count")
+    return index, count
+
+
+def shard_index(relative_path: str, count: int) -> int:
+    """
+        Returns the shard, from 1 to count, a sql file belongs to.
+
+        The shard is a hash of the path relative to the sp folder, the same on every machine and every run,
+        unlike hash() which is salted per process. Adding a file never moves the other files to another shard.
+    """
+    digest = hashlib.sha256(relative_path.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def matches(relative_path: str, patterns) -> bool:
+    # * matches / too, so *.sql matches the files of every sub folder and archive/* everything under archive
+    return any(fnmatchcase(relative_path, pattern) for pattern in patterns)
+
+
+def iter_sql_entries(sp_folder_path: str, include=None, exclude=None, shard: tuple[int, int] | None = None):
+    """
+        Yields the (path relative to the folder, os.DirEntry) of the sql files of the folder and its sub folders.
+
+        Folders are walked depth first with os.scandir, the files of a folder in name order before its sub folders,
+        so the order is the same on every run. Symlinked folders are not followed, a link loop can't hang the walk.
+        Relative paths use / whatever the platform, they are the manifest keys.
+        A file is yielded when it matches an include pattern and no exclude pattern, a sub folder matching
+        an exclude pattern is not walked. With a shard (index, count) only the files of that shard are yielded.
+    """
+    include = include or DEFAULT_INCLUDE
+    exclude = exclude or ()
+    # folders waiting to be walked, the last one is walked first
+    folders = [""]
+    while folders:
+        relative_folder = folders.pop()
+        with os.scandir(os.path.join(sp_folder_path, relative_folder)) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+
+        sub_folders = []
+        for entry in entries:
+            relative_path = relative_folder and f"{relative_folder}/{entry.name}" or entry.name
+            if matches(relative_path, exclude):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                sub_folders.append(relative_path)
+            elif entry.is_file() and matches(relative_path, include) \
+                    and (shard is None or shard_index(relative_path, shard[1]) == shard[0]):
+                yield relative_path, entry
+        folders.extend(reversed(sub_folders))
+
+
+def iter_sql_files(sp_folder_path: str, include=None, exclude=None, shard: tuple[int, int] | None = None):
+    """
+        Yields the paths relative to the folder of its sql files, see iter_sql_entries.
+        Only the paths are kept, the files are read one at a time by the next stage.
+    """
+    for relative_path, _ in iter_sql_entries(sp_folder_path, include, exclude, shard):
+        yield relative_path
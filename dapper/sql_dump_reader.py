@@ -0,0 +1,103 @@
+import codecs
+import mmap
+import re
+from dapper.sql_file_reader import ENCODING_SAMPLE_SIZE, detect_stream_encoding
+from dapper.stored_procedure import StoredProcedure
+
+# bytes decoded at a time from the memory map
+READ_CHUNK_SIZE = 1024 * 1024
+
+# GO alone on its line, with an optional repeat count and comment. Same rule as the lexer.
+GO_LINE_PATTERN = re.compile(r'[ \t]*GO(?![\w@$#])[ \t]*\d*[ \t]*(?:--[^\n]*)?\n?$', re.IGNORECASE)
+
+# the only things that change whether a GO line is a batch separator
+STATE_PATTERN = re.compile(r"'|\"|\[|\]|--|/\*|\*/")
+
+# cheap check before a batch is parsed
+PROCEDURE_PATTERN = re.compile(r'\bPROC(?:EDURE)?\b', re.IGNORECASE)
+
+
+def iter_lines(dump_file_path: str):
+    """
+        Yields the decoded lines of the file, ending with \\n. The file is memory mapped and decoded a chunk
+        at a time, so only the current chunk and line are held in memory.
+    """
+    with open(dump_file_path, 'rb') as file:
+        # mmap can't map an empty file
+        if file.seek(0, 2) == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as dump:
+            encoding, bom_length = detect_stream_encoding(dump[:ENCODING_SAMPLE_SIZE])
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+            pending = ''
+            for offset in range(bom_length, len(dump), READ_CHUNK_SIZE):
+                lines = (pending + decoder.decode(dump[offset:offset + READ_CHUNK_SIZE])).split('\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield line.removesuffix('\r') + '\n'
+
+            pending += decoder.decode(b'', final=True)
+            if pending:
+                yield pending.removesuffix('\r')
+
+
+def iter_batches(dump_file_path: str):
+    """
+        Yields the GO separated batches of the file as (first line number, batch text).
+
+        A GO line inside a string, a [bracketed] or "quoted" identifier or a block comment doesn't end the batch.
+    """
+    # None, or the delimiter the current line is inside of: ' " [ /*
+    state = None
+    comment_depth = 0
+    batch = []
+    batch_line = 1
+
+    for line_number, line in enumerate(iter_lines(dump_file_path), start=1):
+        if state is None and GO_LINE_PATTERN.match(line):
+            if batch:
+                yield batch_line, ''.join(batch)
+            batch = []
+            batch_line = line_number + 1
+            continue
+
+        batch.append(line)
+
+        for match in STATE_PATTERN.finditer(line):
+            delimiter = match.group()
+            if state is None:
+                if delimiter == '--':
+                    break
+                if delimiter == '/*':
+                    state = '/*'
+                    comment_depth = 1
+                elif delimiter in ("'", '"', '['):
+                    state = delimiter
+            elif state == '/*':
+                if delimiter == '/*':
+                    comment_depth += 1
+                elif delimiter == '*/':
+                    comment_depth -= 1
+                    if comment_depth == 0:
+                        state = None
+            elif delimiter == (state == '[' and ']' or state):
+                # '' ]] and "" escapes close and reopen, which leaves the state as it was
+                state = None
+
+    if batch:
+        yield batch_line, ''.join(batch)
+
+
+def iter_procedures(dump_file_path: str):
+    """
+        Yields the CREATE PROCEDURE batches of a scripted database file, one at a time, as
+        (first line number, StoredProcedure). Memory use doesn't depend on the size of the file.
+    """
+    for line_number, batch_text in iter_batches(dump_file_path):
+        if not PROCEDURE_PATTERN.search(batch_text):
+            continue
+        sp = StoredProcedure(batch_text)
+        if sp.header is not None:
+            yield line_number, sp
@@ -0,0 +1,113 @@
+import codecs
+import re
+import chardet
+
+# chardet only ever sees this many bytes
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# used when chardet can't tell, SSMS scripts without a BOM are usually saved in the Windows ANSI code page
+FALLBACK_ENCODING = 'cp1252'
+
+# the utf-32 BOMs start with the utf-16 ones, so they have to be checked first
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+NON_ASCII_BYTE = re.compile(rb'[\x80-\xff]')
+
+
+def sniff_bom(sp_bytes: bytes) -> tuple[str, int] | tuple[None, int]:
+    """
+        Returns the encoding announced by the byte order mark and the BOM length.
+    """
+    for bom, encoding in BOMS:
+        if sp_bytes.startswith(bom):
+            return encoding, len(bom)
+    return None, 0
+
+
+def detect_sample_encoding(sp_bytes: bytes) -> str:
+    """
+        Runs chardet on a bounded sample of the file. The sample starts at the first non ascii byte,
+        the ascii part of a script tells chardet nothing.
+    """
+    match = NON_ASCII_BYTE.search(sp_bytes)
+    start = max(0, match.start() - 1024) if match else 0
+    result = chardet.detect(sp_bytes[start:start + ENCODING_SAMPLE_SIZE])
+    encoding = result['encoding']
+
+    if not encoding or encoding.lower() == 'ascii':
+        return FALLBACK_ENCODING
+    return encoding
+
+
+def decode_sql_bytes(sp_bytes: bytes, encoding_hint: str | None = None) -> tuple[str, str]:
+    """
+        Decodes the content of a sql file and returns the text and the encoding that was used.
+
+        The encoding is detected in tiers, from cheapest to most expensive:
+            the byte order mark,
+            strict utf-8,
+            the encoding detected for this file by a previous run (encoding_hint),
+            chardet on a sample of the file.
+
+        Strict utf-8 goes before the hint, a single byte code page like cp1252 decodes any input without error.
+
+        Line endings are normalized to \\n, the same way reading the file in text mode does.
+    """
+    encoding, bom_length = sniff_bom(sp_bytes)
+    if encoding:
+        text = sp_bytes[bom_length:].decode(encoding, errors='replace')
+        return normalize_newlines(text), encoding
+
+    for encoding in filter(None, ('utf-8', encoding_hint)):
+        try:
+            return normalize_newlines(sp_bytes.decode(encoding)), encoding
+        except (UnicodeDecodeError, LookupError):
+            pass
+
+    encoding = detect_sample_encoding(sp_bytes)
+    try:
+        text = sp_bytes.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        # the sample guessed wrong for the rest of the file
+        encoding = FALLBACK_ENCODING
+        text = sp_bytes.decode(encoding, errors='replace')
+
+    return normalize_newlines(text), encoding
+
+
+def detect_stream_encoding(head: bytes) -> tuple[str, int]:
+    """
+        Detects the encoding of a file too large to decode at once from its first bytes.
+        Returns the encoding and the length of the BOM to skip.
+    """
+    encoding, bom_length = sniff_bom(head)
+    if encoding:
+        return encoding, bom_length
+
+    try:
+        # not final, the head may end in the middle of a character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        return detect_sample_encoding(head), 0
+
+
+def normalize_newlines(text: str) -> str:
+    if '\r' not in text:
+        return text
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def read_sql_file(file_path: str, encoding_hint: str | None = None) -> tuple[str, str]:
+    """
+        Reads a sql file with a single read and returns the decoded text and its encoding.
+    """
+    with open(file_path, 'rb') as file:
+        sp_bytes = file.read()
+    return decode_sql_bytes(sp_bytes, encoding_hint)
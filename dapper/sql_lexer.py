@@ -0,0 +1,166 @@
+import re
+from typing import NamedTuple
+
+# token kinds
+WORD = 'word'
+VARIABLE = 'variable'
+STRING = 'string'
+IDENTIFIER = 'identifier'  # [bracketed] or "quoted" identifier
+NUMBER = 'number'
+PUNCT = 'punct'
+COMMENT = 'comment'
+GO = 'go'
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+)
+    |(?P<line_comment>--[^\n]*)
+    |(?P<block_comment>/\*)
+    |(?P<string>[Nn]?'[^']*(?:''[^']*)*'?)
+    |(?P<bracket>\[[^\]]*(?:\]\][^\]]*)*\]?)
+    |(?P<quoted>"[^"]*(?:""[^"]*)*"?)
+    |(?P<variable>@@?[\w@$#]*)
+    |(?P<number>0[xX][0-9a-fA-F]*|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+    |(?P<word>(?:[^\W\d]|\#)[\w@$#]*)
+    |(?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+BLOCK_COMMENT_PATTERN = re.compile(r'/\*|\*/')
+
+# what may follow GO on its own line: an optional repeat count and a comment
+GO_LINE_REST_PATTERN = re.compile(r'[ \t]*(?:\d+)?[ \t]*(?:--[^\n]*)?(?=\r?\n|$)')
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    start: int
+    end: int
+    # index of the GO separated batch the token belongs to
+    batch: int
+
+    def upper(self) -> str:
+        return self.value.upper()
+
+    def is_word(self, *words: str) -> bool:
+        return self.kind == WORD and self.value.upper() in words
+
+    def is_punct(self, value: str) -> bool:
+        return self.kind == PUNCT and self.value == value
+
+    def name(self) -> str:
+        """
+            Returns the identifier without its brackets or quotes: [dbo] -> dbo, "user id" -> user id, N'total' -> total
+        """
+        if self.kind == IDENTIFIER:
+            closing = self.value[0] == '[' and ']' or '"'
+            return self.value[1:-1].replace(closing * 2, closing)
+        if self.kind == STRING:
+            return self.value[self.value.index("'") + 1:-1].replace("''", "'")
+        return self.value
+
+
+def tokenize(text: str) -> list[Token]:
+    """
+        Splits a T-SQL script into tokens in a single pass.
+
+        Whitespace is dropped. Comments are kept as COMMENT tokens so annotations can be read from them,
+        the analysis of the script skips them. Strings, [bracketed] and "quoted" identifiers are single tokens,
+        so nothing inside them is mistaken for a keyword. A GO on its own line becomes a GO token and starts a new batch.
+    """
+    return list(iter_tokens(text))
+
+
+def iter_tokens(text: str, position: int = 0, batch: int = 0):
+    """
+        Yields the tokens of the script lazily, starting at position in the given batch.
+        Lets a caller stop lexing as soon as it has what it needs, or resume where it stopped.
+    """
+    length = len(text)
+    match_token = TOKEN_PATTERN.match
+
+    while position < length:
+        match = match_token(text, position)
+        kind = match.lastgroup
+        start = position
+        end = match.end()
+
+        if kind == 'ws':
+            position = end
+            continue
+
+        if kind == 'block_comment':
+            end = block_comment_end(text, start)
+            yield Token(COMMENT, text[start:end], start, end, batch)
+        elif kind == 'line_comment':
+            yield Token(COMMENT, match.group(), start, end, batch)
+        elif kind == 'word' and end - start == 2 and match.group().upper() == 'GO' and is_go_line(text, start, end):
+            end = GO_LINE_REST_PATTERN.match(text, end).end()
+            yield Token(GO, text[start:end], start, end, batch)
+            batch += 1
+        elif kind in ('bracket', 'quoted'):
+            yield Token(IDENTIFIER, match.group(), start, end, batch)
+        else:
+            yield Token(kind, match.group(), start, end, batch)
+
+        position = end
+
+
+def block_comment_end(text: str, start: int) -> int:
+    """
+        Returns the end of the block comment starting at start. T-SQL block comments nest.
+    """
+    depth = 0
+    for match in BLOCK_COMMENT_PATTERN.finditer(text, start):
+        depth += match.group() == '/*' and 1 or -1
+        if depth == 0:
+            return match.end()
+    return len(text)
+
+
+def is_go_line(text: str, start: int, end: int) -> bool:
+    """
+        GO is only a batch separator when it is alone on its line.
+    """
+    line_start = text.rfind('\n', 0, start) + 1
+    if text[line_start:start].strip():
+        return False
+    return GO_LINE_REST_PATTERN.match(text, end) is not None
+
+
+def split_top_level(tokens: list[Token], separator: str = ',') -> list[list[Token]]:
+    """
+        Splits the tokens on the separator, ignoring the separators nested in parentheses.
+    """
+    parts = [[]]
+    depth = 0
+    for token in tokens:
+        if token.kind == PUNCT:
+            if token.value == '(':
+                depth += 1
+            elif token.value == ')':
+                depth -= 1
+            elif token.value == separator and depth == 0:
+                parts.append([])
+                continue
+        parts[-1].append(token)
+    return [part for part in parts if part]
+
+
+def tokens_to_text(tokens: list[Token]) -> str:
+    """
+        Joins the tokens back into a single line of sql: one space between tokens,
+        none around dots or inside parentheses. Comments are dropped.
+    """
+    text = []
+    previous = None
+    for token in tokens:
+        if token.kind == COMMENT:
+            continue
+        if previous is not None and not (
+                token.is_punct('.') or token.is_punct(')') or token.is_punct(',')
+                or previous.is_punct('.') or previous.is_punct('(')
+                or (token.is_punct('(') and previous.kind == WORD)):
+            text.append(' ')
+        text.append(token.value)
+        previous = token
+    return ''.join(text)
@@ -1,13 +1,208 @@
+import fnmatch
+from functools import cached_property
+from dapper.procedure_ir import ParamIR
 from dapper.sp_utils import SPUtils
+from dapper.sql_lexer import tokenize, iter_tokens, split_top_level, tokens_to_text, Token, WORD, IDENTIFIER, VARIABLE, STRING, COMMENT, GO
 import re
 
+# words that end a SELECT list when they appear outside parentheses
+SELECT_LIST_END_WORDS = {
+    'FROM', 'INTO', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'UNION', 'EXCEPT', 'INTERSECT', 'OPTION', 'FOR',
+    'END', 'ELSE', 'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'SET', 'DECLARE', 'IF', 'WHILE', 'BEGIN',
+    'RETURN', 'EXEC', 'EXECUTE', 'PRINT', 'RAISERROR', 'THROW', 'COMMIT', 'ROLLBACK', 'TRUNCATE', 'WITH'
+}
+
+# words that start a statement. The branch of an IF, ELSE or WHILE that isn't a BEGIN ... END block is one statement,
+# it ends at the next of them
+STATEMENT_START_WORDS = {
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'SET', 'DECLARE', 'IF', 'WHILE', 'BEGIN', 'RETURN', 'EXEC',
+    'EXECUTE', 'PRINT', 'RAISERROR', 'THROW', 'COMMIT', 'ROLLBACK', 'TRUNCATE', 'WITH', 'BREAK', 'CONTINUE', 'GOTO',
+    'OPEN', 'FETCH', 'CLOSE', 'DEALLOCATE', 'WAITFOR'
+}
+
+# words that leave the body or the loop, every statement after one of them in a branch may not run
+EXIT_WORDS = {'RETURN', 'THROW', 'GOTO', 'BREAK', 'CONTINUE'}
+
+# -- @dapper:stream or /* @dapper:cache ttl=60 */, in a comment of the script
+ANNOTATION_PATTERN = re.compile(r'@dapper:(\w+)([^\r\n]*)')
+# ttl=60 size=100 or a bare flag
+ANNOTATION_ARGUMENT_PATTERN = re.compile(r'(\w+)(?:=([^\s,*]+))?')
+
+# types the anonymous params object binds with their exact DbType: Dapper maps their C# type to it,
+# and the strings are sent as a DbString with their declared length
+PARAMS_OBJECT_SQL_TYPES = {
+    "BIGINT", "INT", "SMALLINT", "TINYINT", "BIT", "FLOAT", "REAL", "UNIQUEIDENTIFIER", "DATETIME", "DATETIMEOFFSET",
+    "TIME", "CHAR", "VARCHAR", "NCHAR", "NVARCHAR", "SYSNAME"
+}
+
+# words that end a FROM clause when they appear outside parentheses. WITH is a table hint there.
+FROM_CLAUSE_END_WORDS = SELECT_LIST_END_WORDS - {'FROM', 'INTO', 'WITH'}
+
+# words that can follow a table source and are not its alias
+TABLE_SOURCE_WORDS = FROM_CLAUSE_END_WORDS | {
+    'ON', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS', 'OUTER', 'APPLY', 'WITH', 'PIVOT', 'UNPIVOT', 'TABLESAMPLE'
+}
+
 
 class StoredProcedure:
+    """
+        Analysis of a stored procedure script.
+
+        Every fact is computed lazily, the first time it is used, and only once. The header facts (name, params,
+        definition) only lex the script up to the AS of CREATE PROCEDURE, the body is lexed when a body fact
+        (type of return, result selects) is needed. The generators share one instance per script.
+    """
+
     def __init__(self, text: str):
         self.sp_text = text
-        self.sp_definition = self.extract_stored_procedure_definition()
-        self.sp_params_dict = self.retrive_sp_params()
-        self.sp_name = self.retrive_sp_name()
+
+    @cached_property
+    def tokens(self) -> list[Token]:
+        """
+            All the tokens of the script, comments included.
+        """
+        return tokenize(self.sp_text)
+
+    @cached_property
+    def header_tokens(self) -> list[Token]:
+        """
+            The tokens up to and including the AS that ends the CREATE PROCEDURE header, without comments.
+            Lexing stops there.
+        """
+        tokens = []
+        in_header = False
+        depth = 0
+        for token in iter_tokens(self.sp_text):
+            if token.kind == COMMENT:
+                continue
+            tokens.append(token)
+
+            if not in_header:
+                # CREATE [OR ALTER] PROC[EDURE] or ALTER PROC[EDURE]
+                in_header = token.is_word('PROC', 'PROCEDURE') and len(tokens) > 1 and tokens[-2].is_word('CREATE', 'ALTER')
+            elif token.is_punct('('):
+                depth += 1
+            elif token.is_punct(')'):
+                depth -= 1
+            elif depth == 0 and token.is_word('AS') and tokens[-2].kind != VARIABLE and not tokens[-2].is_word('EXEC', 'EXECUTE'):
+                # @param AS type and EXECUTE AS OWNER have their own AS
+                break
+        return tokens
+
+    @cached_property
+    def header(self) -> dict | None:
+        return self.parse_header()
+
+    @cached_property
+    def body(self) -> list[Token]:
+        """
+            The tokens of the SP body, from after AS to the end of the batch, without comments.
+        """
+        if not self.header or self.header["as_index"] is None:
+            return []
+        as_token = self.header_tokens[self.header["as_index"]]
+        body = []
+        for token in iter_tokens(self.sp_text, as_token.end, as_token.batch):
+            if token.kind == GO:
+                break
+            if token.kind != COMMENT:
+                body.append(token)
+        return body
+
+    @cached_property
+    def annotations(self) -> dict[str, dict[str, str]]:
+        """
+            The @dapper:name key=value annotations found in the comments of the script, by name:
+            -- @dapper:cache ttl=60 -> {"cache": {"ttl": "60"}}
+        """
+        annotations = {}
+        # most scripts have none, they are not lexed for it
+        if '@dapper:' not in self.sp_text:
+            return annotations
+        for token in self.tokens:
+            if token.kind == COMMENT:
+                for match in ANNOTATION_PATTERN.finditer(token.value):
+                    annotations[match.group(1).lower()] = parse_annotation_arguments(match.group(2))
+        return annotations
+
+    @cached_property
+    def procedure_name(self) -> str | None:
+        """
+            The name of the procedure as it is created, with its usp_ prefix.
+        """
+        if not self.header or not self.header["name_tokens"]:
+            return None
+        return self.header["name_tokens"][-1].name()
+
+    def apply_annotation_patterns(self, annotation_patterns: dict[str, str] | None):
+        """
+            Adds the annotations configured for the procedure name, e.g. {"usp_report_*": "stream"}.
+            The annotations written in the script win over the configured ones.
+        """
+        if not annotation_patterns or not self.procedure_name:
+            return
+        procedure_name = self.procedure_name.lower()
+        for pattern, annotation in annotation_patterns.items():
+            if fnmatch.fnmatchcase(procedure_name, pattern.lower()):
+                match = ANNOTATION_PATTERN.match(f"@dapper:{annotation.removeprefix('@dapper:')}")
+                if match:
+                    self.annotations.setdefault(match.group(1).lower(), parse_annotation_arguments(match.group(2)))
+
+    @cached_property
+    def sp_definition(self) -> str:
+        return self.extract_stored_procedure_definition()
+
+    @cached_property
+    def sp_params_dict(self) -> dict:
+        return self.retrive_sp_params()
+
+    @cached_property
+    def sp_name(self) -> str | None:
+        return self.retrive_sp_name()
+
+    @cached_property
+    def sp_type(self) -> str:
+        # look for 'get' or 'select' in the SP name
+        if "get" in self.sp_name or "select" in self.sp_name:
+            return "query"
+        else:
+            return "command"
+
+    @cached_property
+    def sp_has_return_type(self) -> bool:
+        # A SP has a return type if:
+        # its name contains 'get' or 'retrieve'
+        # or it has a RETURN statement.
+        # or it has OUT or OUTPUT parameters.
+
+        # check if SP name contains 'get' or 'retrieve'
+        if re.search(r'(get|retrieve)', self.sp_name or '', re.IGNORECASE):
+            return True
+
+        # check if SP has OUT or OUTPUT parameters, only needs the header
+        if self.has_output_params:
+            return True
+
+        # check if SP has RETURN statement, comments and strings are not tokens so they can't match
+        if any(token.is_word('RETURN') for token in self.body):
+            return True
+
+        return False
+
+    @cached_property
+    def result_selects(self) -> list[dict]:
+        return self.retrive_result_selects()
+
+    @cached_property
+    def has_output_params(self) -> bool:
+        """
+            True when the SP has OUT or INOUT params, their values are read back after the call.
+        """
+        return any(param.is_output for param in self.sp_params_dict.values())
+
+    @cached_property
+    def dynamic_params_section(self) -> str:
+        return self.retrive_dynamic_params_section()
 
     def handler_class_name(self) -> str:
         """
@@ -25,38 +220,370 @@ class StoredProcedure:
         handler_name = f"{SPUtils.snake_case_to_pascal_case(self.sp_name)}{sp_type.capitalize()}"
         return handler_name
 
+    def caching_handler_class_name(self) -> str:
+        """
+            Returns the name of the decorator caching the results of a query. Example: GetAlertsQueryCachingHandler
+        """
+        return f"{SPUtils.snake_case_to_pascal_case(self.sp_name)}QueryCachingHandler"
+
+    def batch_request_class_name(self) -> str:
+        """
+            Returns the name of the request running many requests of a command. Example: AlertAcknowledgeAlertBatchCommand
+        """
+        return f"{SPUtils.snake_case_to_pascal_case(self.sp_name)}BatchCommand"
+
     def get_sp_type(self):
         """
             Returns the type of the SP whether is a query or a command.
         """
-        # look for 'get' or 'select' in the SP name
-        if "get" in self.sp_name or "select" in self.sp_name:
-            return "query"
-        else:
-            return "command"
+        return self.sp_type
 
     def has_return_type(self) -> bool:
         """
             Returns True if the SP has a return type.
         """
-        # A SP has a return type if:
-        # its name contains 'get' or 'retrieve'
-        # or it has a RETURN statement.
-        # or it has OUT or OUTPUT parameters.
+        return self.sp_has_return_type
 
-        # check if SP name contains 'get' or 'retrieve'
-        if re.search(r'(get|retrieve)', self.sp_name, re.IGNORECASE):
-            return True
+    def parse_header(self) -> dict | None:
+        """
+            Finds the CREATE PROCEDURE header in the header tokens.
 
-        # check if SP has RETURN statement
-        if re.search(r'\bRETURN\b', self.sp_text, re.IGNORECASE):
-            return True
+            Returns the index of the CREATE token, the name tokens, the parameter tokens and the index of the AS token
+            that starts the body. Returns None if the script has no CREATE PROCEDURE.
+        """
+        tokens = self.header_tokens
+        count = len(tokens)
 
-        # check if SP has OUT or OUTPUT parameters
-        if re.search(r'\b(OUT|OUTPUT|INOUT)\b', self.sp_text, re.IGNORECASE):
-            return True
+        # CREATE [OR ALTER] PROC[EDURE] or ALTER PROC[EDURE]
+        create_index = None
+        position = None
+        for index, token in enumerate(tokens):
+            if not token.is_word('CREATE', 'ALTER'):
+                continue
+            position = index + 1
+            if position + 1 < count and tokens[position].is_word('OR') and tokens[position + 1].is_word('ALTER'):
+                position += 2
+            if position < count and tokens[position].is_word('PROC', 'PROCEDURE'):
+                create_index = index
+                position += 1
+                break
 
-        return False
+        if create_index is None:
+            return None
+
+        # [schema].[name], the parts are separated by dots
+        name_tokens = []
+        while position < count and tokens[position].kind in (WORD, IDENTIFIER):
+            name_tokens.append(tokens[position])
+            position += 1
+            if position < count and tokens[position].is_punct('.'):
+                position += 1
+            else:
+                break
+
+        # numbered procedures: CREATE PROCEDURE name;2
+        if position + 1 < count and tokens[position].is_punct(';'):
+            position += 2
+
+        # the parameters end at the first WITH, FOR REPLICATION or AS outside parentheses
+        params_start = position
+        depth = 0
+        while position < count:
+            token = tokens[position]
+            if token.is_punct('('):
+                depth += 1
+            elif token.is_punct(')'):
+                depth -= 1
+            elif depth == 0 and token.is_word('WITH', 'FOR', 'AS') and tokens[position - 1].kind != VARIABLE:
+                # @param AS type is the parameter's own AS
+                break
+            position += 1
+        params_end = position
+
+        # skip the procedure options, EXECUTE AS has its own AS
+        while position < count and not (tokens[position].is_word('AS') and not tokens[position - 1].is_word('EXEC', 'EXECUTE')):
+            position += 1
+
+        param_tokens = tokens[params_start:params_end]
+        if param_tokens and param_tokens[0].is_punct('(') and param_tokens[-1].is_punct(')'):
+            param_tokens = param_tokens[1:-1]
+
+        return {
+            "create_index": create_index,
+            "name_tokens": name_tokens,
+            "param_tokens": param_tokens,
+            "as_index": position < count and position or None
+        }
+
+    def retrive_result_selects(self) -> list[dict]:
+        """
+            Returns the SELECT statements of the body that return a result set to the caller.
+
+            SELECTs nested in parentheses (subqueries, IF EXISTS, CTE bodies), INSERT ... SELECT, SELECT ... INTO,
+            variable assignments (SELECT @count = COUNT(*)), cursor definitions and the right side of a UNION are skipped.
+
+            A SELECT is conditional when it may not run every time the body runs: it is in a branch of an IF or ELSE,
+            in a WHILE loop or a CATCH block, or it follows a RETURN or THROW of such a branch. The branch of an IF
+            is a BEGIN ... END block or the single statement after the condition.
+
+            Select dict example:
+                "top": "1",
+                "columns": [[token, ...], ...],
+                "is_star": False,
+                "conditional": False
+        """
+        body = self.body
+        selects = []
+        depth = 0
+        insert_pending = False
+        previous = None
+        # one entry per open BEGIN ... END block, True when the block runs conditionally
+        blocks = []
+        case_depth = 0
+        # None outside a single statement branch, "condition" while reading the condition of an IF or WHILE,
+        # "start" before the statement of an ELSE, then the first word of the statement of the branch
+        branch = None
+        # a branch can RETURN or THROW, the statements after it may not run
+        exited = False
+
+        for index, token in enumerate(body):
+            if token.is_punct('('):
+                depth += 1
+            elif token.is_punct(')'):
+                depth -= 1
+                if depth == 0:
+                    previous = token
+                continue
+
+            if depth != 0:
+                continue
+
+            following = index + 1 < len(body) and body[index + 1] or None
+            if token.is_word('CASE'):
+                case_depth += 1
+            elif token.is_word('END') and case_depth > 0:
+                case_depth -= 1
+            elif case_depth > 0:
+                # WHEN ... ELSE ... of a CASE expression
+                pass
+            elif token.is_word('IF', 'WHILE'):
+                # a WHILE loop runs its statement any number of times, an IF once or not at all
+                branch = "condition"
+            elif token.is_word('ELSE'):
+                branch = "start"
+            elif token.is_word('BEGIN') and not (following and following.is_word('TRAN', 'TRANSACTION', 'DISTRIBUTED')):
+                # BEGIN TRY runs in sequence, BEGIN CATCH only on an error
+                blocks.append(branch is not None or bool(following and following.is_word('CATCH')))
+                branch = None
+            elif token.is_word('END'):
+                if blocks:
+                    blocks.pop()
+                branch = None
+            elif token.is_punct(';'):
+                if branch not in ("condition", "start"):
+                    branch = None
+            elif token.kind == WORD and token.upper() in STATEMENT_START_WORDS:
+                if branch in ("condition", "start") \
+                        or branch == 'WITH' and token.is_word('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE'):
+                    # the first statement of the branch, or the statement of its WITH common table expressions
+                    branch = token.upper()
+                elif branch is not None:
+                    branch = None
+                if token.upper() in EXIT_WORDS and (branch is not None or any(blocks)):
+                    exited = True
+
+            if token.is_word('INSERT'):
+                insert_pending = True
+            elif token.is_punct(';') or token.is_word('EXEC', 'EXECUTE', 'VALUES'):
+                insert_pending = False
+            elif token.is_word('SELECT'):
+                if insert_pending:
+                    insert_pending = False
+                elif not (previous and previous.is_word('UNION', 'ALL', 'EXCEPT', 'INTERSECT', 'FOR')):
+                    select = self.parse_select(body, index)
+                    if not select["into"] and not select["assignment"]:
+                        select["conditional"] = exited or branch is not None or any(blocks)
+                        selects.append(select)
+
+            previous = token
+
+        return selects
+
+    @staticmethod
+    def parse_select(tokens: list[Token], select_index: int) -> dict:
+        """
+            Parses the SELECT list of the SELECT statement at select_index.
+        """
+        count = len(tokens)
+        position = select_index + 1
+        top = None
+
+        if position < count and tokens[position].is_word('DISTINCT', 'ALL'):
+            position += 1
+
+        if position < count and tokens[position].is_word('TOP'):
+            position += 1
+            if position < count and tokens[position].is_punct('('):
+                top_start = position + 1
+                while position < count and not tokens[position].is_punct(')'):
+                    position += 1
+                top = tokens_to_text(tokens[top_start:position])
+            else:
+                top = position < count and tokens[position].value or None
+            position += 1
+            if position < count and tokens[position].is_word('PERCENT'):
+                position += 1
+            if position + 1 < count and tokens[position].is_word('WITH') and tokens[position + 1].is_word('TIES'):
+                position += 2
+
+        list_start = position
+        depth = 0
+        case_depth = 0
+        into = False
+        from_index = None
+        while position < count:
+            token = tokens[position]
+            if token.is_punct('('):
+                depth += 1
+            elif token.is_punct(')'):
+                depth -= 1
+                if depth < 0:
+                    break
+            elif depth == 0:
+                if token.is_word('CASE'):
+                    case_depth += 1
+                elif token.is_word('END') and case_depth > 0:
+                    case_depth -= 1
+                elif token.is_punct(';'):
+                    break
+                elif token.kind == WORD and token.upper() in SELECT_LIST_END_WORDS and not (
+                        case_depth > 0 and token.is_word('ELSE')):
+                    into = token.is_word('INTO')
+                    from_index = token.is_word('FROM') and position or None
+                    break
+            position += 1
+
+        columns = split_top_level(tokens[list_start:position])
+
+        return {
+            "top": top,
+            "columns": columns,
+            "is_star": any(column[-1].is_punct('*') and (len(column) == 1 or column[-2].is_punct('.'))
+                           for column in columns),
+            "into": into,
+            "from_index": from_index,
+            "assignment": bool(columns) and len(columns[0]) > 1
+            and columns[0][0].kind == VARIABLE and columns[0][1].value in ('=', '+', '-', '*', '/', '|', '&', '^')
+        }
+
+    @staticmethod
+    def parse_from_tables(tokens: list[Token], from_index: int | None) -> dict[str, str | None]:
+        """
+            Returns the table sources of the FROM clause at from_index, by alias and by table name, lower cased:
+            FROM dbo.tblAlert a JOIN vwUser ON ... -> {"a": "tblAlert", "tblalert": "tblAlert", "vwuser": "vwUser"}
+
+            Derived tables and table functions map to None, their columns can't be looked up.
+        """
+        tables = {}
+        if from_index is None:
+            return tables
+
+        count = len(tokens)
+        position = from_index + 1
+        expect_table = True
+        while position < count:
+            token = tokens[position]
+            if token.is_punct(';') or token.kind == WORD and token.upper() in FROM_CLAUSE_END_WORDS:
+                break
+
+            if token.is_punct('('):
+                # a derived table, a table hint or a condition, skipped whole
+                position = StoredProcedure.skip_parentheses(tokens, position)
+                if expect_table:
+                    position, alias = StoredProcedure.parse_alias(tokens, position)
+                    if alias:
+                        tables[alias.lower()] = None
+                    expect_table = False
+                continue
+
+            if token.is_punct(',') or token.is_word('JOIN', 'APPLY'):
+                expect_table = True
+            elif expect_table and token.kind in (WORD, IDENTIFIER, VARIABLE):
+                # [server.][database.][schema.]table
+                name = token.name()
+                position += 1
+                while position + 1 < count and tokens[position].is_punct('.') and tokens[position + 1].kind in (WORD, IDENTIFIER):
+                    name = tokens[position + 1].name()
+                    position += 2
+
+                # a table valued function has no columns to look up
+                is_function = position < count and tokens[position].is_punct('(')
+                if is_function:
+                    position = StoredProcedure.skip_parentheses(tokens, position)
+
+                position, alias = StoredProcedure.parse_alias(tokens, position)
+                table = not is_function and name or None
+                tables[name.lower()] = table
+                if alias:
+                    tables[alias.lower()] = table
+                expect_table = False
+                continue
+
+            position += 1
+
+        return tables
+
+    @staticmethod
+    def parse_alias(tokens: list[Token], position: int) -> tuple[int, str | None]:
+        """
+            Reads the optional [AS] alias of a table source at position. Returns the position after it and the alias.
+        """
+        count = len(tokens)
+        has_as = position < count and tokens[position].is_word('AS')
+        if has_as:
+            position += 1
+        if position < count and (tokens[position].kind == IDENTIFIER or tokens[position].kind == WORD
+                                 and tokens[position].upper() not in TABLE_SOURCE_WORDS):
+            return position + 1, tokens[position].name()
+        return position, None
+
+    @staticmethod
+    def skip_parentheses(tokens: list[Token], position: int) -> int:
+        """
+            Returns the position after the parenthesis that closes the one at position.
+        """
+        depth = 0
+        for index in range(position, len(tokens)):
+            if tokens[index].is_punct('('):
+                depth += 1
+            elif tokens[index].is_punct(')'):
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+        return len(tokens)
+
+    @staticmethod
+    def select_column(column_tokens: list[Token]) -> tuple[str, list[Token]]:
+        """
+            Splits a column of a SELECT list into its name and the tokens of its expression:
+            alias = expression, expression [AS] alias, table.column and column.
+        """
+        # alias = expression
+        if len(column_tokens) > 2 and column_tokens[1].is_punct('=') and column_tokens[0].kind in (WORD, IDENTIFIER, STRING):
+            return column_tokens[0].name(), column_tokens[2:]
+
+        last = column_tokens[-1]
+        # expression AS alias, expression alias, table.column and column all end with the name
+        if last.kind not in (WORD, IDENTIFIER, STRING):
+            return last.value, column_tokens
+
+        if len(column_tokens) > 1 and not column_tokens[-2].is_punct('.'):
+            expression = column_tokens[:-1]
+            if expression[-1].is_word('AS'):
+                expression = expression[:-1]
+            return last.name(), expression
+
+        return last.name(), column_tokens
 
     def extract_stored_procedure_definition(self) -> str:
         """
@@ -64,18 +591,12 @@ class StoredProcedure:
 
             Return everything between CREATE PROCEDURE and AS including CREATE PROCEDURE and AS.
         """
-        # Define the pattern to match the stored procedure definition
-        pattern = re.compile(
-            r'(CREATE\s+PROCEDURE\s*[\s\S]*?\s*AS)', re.IGNORECASE)
-
-        # Search for the pattern in the SQL script
-        match = pattern.search(self.sp_text)
-
-        if match:
-            procedure_definition = match.group(1)
-            return procedure_definition.strip()
+        if not self.header or self.header["as_index"] is None:
+            return ""
 
-        return ""
+        start = self.header_tokens[self.header["create_index"]].start
+        end = self.header_tokens[self.header["as_index"]].end
+        return self.sp_text[start:end]
 
     def retrive_sp_name(self) -> str:
         """
@@ -87,76 +608,87 @@ class StoredProcedure:
                 @site_timezone_id VARCHAR(100) OUT,
                 @sensor_type_desc VARCHAR(100) OUT
             AS
-            capture everything between CREATE PROCEDURE and the first @
-            will return alertTriggerMapping_get_test_location
+            the name is the last part of the qualified name after CREATE PROCEDURE, without the brackets
+            and the usp_ prefix. will return alertTriggerMapping_get_test_location
         """
-
-        # Use a regular expression to find the stored procedure name
-        match = re.search(r'usp_(.*?)\s', self.sp_definition, re.IGNORECASE)
-
-        if match:
-            # The stored procedure name is the first (and only) group in the match
-            sp_name = match.group(1)
-            # remove the square brackets
-            sp_name = sp_name.replace("[", "").replace("]", "")
-            return sp_name
-        else:
+        if not self.header or not self.header["name_tokens"]:
             return None
 
-    def retrive_sp_params(self) -> dict:
+        sp_name = self.header["name_tokens"][-1].name()
+        return re.sub(r'^usp_', '', sp_name, flags=re.IGNORECASE)
+
+    def retrive_sp_params(self) -> dict[str, ParamIR]:
         """
-            Returns a dictionary of SP params from the SP text.
+            Returns the SP params from the SP text, by name.
 
-            Dict example:
-                "name": param_name,
-                "camel_case_name": camel_case_name,
-                "pascal_case_name": pascal_case_name,
-                "type": param_type,
-                "csharp_type": csharp_type,
-                "sql_db_type": sql_db_type,
-                "direction": param_direction
+            @site_name NVARCHAR(60) OUT -> "site_name": ParamIR(name="site_name", sql_type="NVARCHAR", length=60, direction="OUT")
         """
-        # split the text into lines
-        lines = self.sp_definition.strip().rstrip().split("\n")
-        # remove any lines that doesn't start with @
-        param_lines = [
-            line for line in lines if line.strip().startswith("@")]
+        if not self.header:
+            return {}
 
-        # params dict with key as param name camel case and value as object with name, type and direction
+        # params dict with key as param name and value as its ParamIR
         params = {}
 
-        for line in param_lines:
-            # remove leading and trailing spaces
-            line = line.strip().replace(",", "")
-            # split by space
-            parts = line.split(" ")
+        # @name [AS] type [(length)] [VARYING] [= default] [OUT | OUTPUT] [READONLY]
+        for param_tokens in split_top_level(self.header["param_tokens"]):
+            if param_tokens[0].kind != VARIABLE:
+                continue
             # get the param name without @
-            param_name = parts[0][1:]
-            # get the param type
-            param_type = parts[1]
-            # get the param direction
+            param_name = param_tokens[0].value[1:]
+
+            position = 1
+            if position < len(param_tokens) and param_tokens[position].is_word('AS'):
+                position += 1
+
+            # get the param type, a schema qualified type name and its (length) or (precision, scale)
+            type_start = position
+            sql_type = ""
+            while position < len(param_tokens) and param_tokens[position].kind in (WORD, IDENTIFIER):
+                sql_type = param_tokens[position].name().upper()
+                position += 1
+                if position < len(param_tokens) and param_tokens[position].is_punct('.'):
+                    position += 1
+                else:
+                    break
+            type_arguments = []
+            if position < len(param_tokens) and param_tokens[position].is_punct('('):
+                position += 1
+                while position < len(param_tokens) and not param_tokens[position].is_punct(')'):
+                    if not param_tokens[position].is_punct(','):
+                        type_arguments.append(param_tokens[position].value)
+                    position += 1
+                position += 1
+            length, precision, scale = SPUtils.sql_type_size(sql_type, type_arguments)
+
+            # get the param direction, a READONLY param is a table-valued param and always an input
             param_direction = "IN"
-            if "OUT" in parts:
-                param_direction = "OUT"
-            elif "INOUT" in parts:
-                param_direction = "INOUT"
+            table_type = None
+            for token in param_tokens[position:]:
+                if token.is_word('OUT', 'OUTPUT'):
+                    param_direction = "OUT"
+                elif token.is_word('INOUT'):
+                    param_direction = "INOUT"
+                elif token.is_word('READONLY'):
+                    table_type = ".".join(type_token.name() for type_token in param_tokens[type_start:position]
+                                          if not type_token.is_punct('.'))
             # add to params dict
-            params[param_name] = {
-                "name": param_name,
-                "camel_case_name": SPUtils.snake_case_to_camel_case(param_name),
-                "pascal_case_name": SPUtils.snake_case_to_pascal_case(param_name),
-                "type": param_type,
-                "csharp_type": SPUtils.str_to_csharp_type(param_type),
-                "sql_db_type": SPUtils.str_to_sql_db_type(param_type),
-                "direction": param_direction,
-                "csharp_param_direction": SPUtils.str_to_dapper_param_direction(param_direction)
-            }
+            params[param_name] = ParamIR(param_name, sql_type, length, precision, scale, param_direction, table_type)
 
         return params
 
     def retrive_dynamic_params_section(self):
         """
-            Returns the dynamic params section of the handler.
+            Returns the params section of the handler.
+
+            A SP with OUT or INOUT params binds them with DynamicParameters, so their values can be read back.
+            A SP with input params only binds an anonymous object: Dapper compiles one reader per anonymous type
+            and sets the params from it, without the dictionary and the boxing of DynamicParameters.
+
+            Every param is sent with the DbType, size, precision and scale it is declared with, so SQL Server
+            doesn't convert a column to compare it to the param, and a param has one size and one cached plan
+            whatever the length of its value. A param the anonymous object can't type exactly, e.g. a DECIMAL(18, 2)
+            or a DATETIME2, makes the SP bind DynamicParameters too.
+
             Example:
 
             For the following SP:
@@ -166,18 +698,107 @@ class StoredProcedure:
                 @user_id INT
             AS
 
-            The following dynamic params section will be generated:
+            The following params section will be generated:
+
+            var parameters = new
+            {
+                alert_id = request.AlertId,
+                user_id = request.UserId
+            };
+
+            A @user_name VARCHAR(50) param would be sent as
+
+                user_name = new DbString { Value = request.UserName, IsAnsi = true, Length = 50 }
+
+            With @user_id INT OUT and @site_name NVARCHAR(60) OUT it would be:
 
             var parameters = new DynamicParameters();
-            parameters.Add("@user_id", request.UserId, DbType.Int32);
-            parameters.Add("@alert_id", request.AlertId, DbType.Int32);
+            parameters.Add("@alert_id", request.AlertId, DbType.Int32, ParameterDirection.Input);
+            parameters.Add("@user_id", dbType: DbType.Int32, direction: ParameterDirection.Output);
+            parameters.Add("@site_name", dbType: DbType.String, direction: ParameterDirection.Output, size: 60);
+
+            A table-valued param is bound to its rows as SqlDataRecords, see TableValuedParam:
+
+            tblLocationIds = TbllocationidsRecords(request.Tbllocationids).AsTableValuedParameter("tpIntTable")
         """
+        if not self.has_output_params and all(param_value.table_type or param_value.sql_type in PARAMS_OBJECT_SQL_TYPES
+                                              for param_value in self.sp_params_dict.values()):
+            return self.retrive_params_object_section()
 
         dynamic_params = []
         for param_key, param_value in self.sp_params_dict.items():
+            # an OUT param has no value to send, the request doesn't have it
+            if param_value.direction == "OUT":
+                dynamic_params.append(
+                    f"parameters.Add(\"@{param_value.name}\", dbType: {param_value.sql_db_type}, direction: {param_value.csharp_param_direction}{self.param_size_arguments(param_value)});")
+                continue
+            if param_value.table_type:
+                dynamic_params.append(f"parameters.Add(\"@{param_value.name}\", {self.param_value_expression(param_value)});")
+                continue
             dynamic_params.append(
-                f"\tparameters.Add(\"@{param_value['name']}\", request.{param_value['pascal_case_name']}, {param_value['sql_db_type']}, {param_value['csharp_param_direction']});")
-        dynamic_params_str = "var parameters = new DynamicParameters(); \n    "
-        dynamic_params_str = dynamic_params_str + \
-            "\n".join(dynamic_params)
+                f"parameters.Add(\"@{param_value.name}\", request.{param_value.pascal_case_name}, {param_value.sql_db_type}, {param_value.csharp_param_direction}{self.param_size_arguments(param_value)});")
+        # the section is rendered at the indentation of the handler body
+        dynamic_params_str = "\n        ".join(["var parameters = new DynamicParameters();"] + dynamic_params)
         return dynamic_params_str
+
+    def retrive_params_object_section(self) -> str:
+        """
+            Returns the params section of a SP without OUT params: an anonymous object with a member per param,
+            named like the param so Dapper binds it by name. Strings are wrapped in a DbString with their declared
+            type and length, Dapper would send them as NVARCHAR(4000) otherwise.
+        """
+        members = []
+        for param_value in self.sp_params_dict.values():
+            value = self.param_value_expression(param_value)
+            if param_value.length is not None and param_value.csharp_type == "string":
+                value = f"new DbString {{ Value = {value}, {self.db_string_arguments(param_value)} }}"
+            members.append(f"{SPUtils.to_csharp_identifier(param_value.name)} = {value}")
+        if not members:
+            return "var parameters = new { };"
+        # the section is rendered at the indentation of the handler body
+        return "var parameters = new\n        {\n            " + ",\n            ".join(members) + "\n        };"
+
+    @staticmethod
+    def param_value_expression(param_value: ParamIR, request: str = "request") -> str:
+        """
+            Returns the value a param is bound to: the request property, or the records of a table-valued param.
+        """
+        value = f"{request}.{param_value.pascal_case_name}"
+        if param_value.table_type:
+            return f"{param_value.records_method_name}({value}).AsTableValuedParameter(\"{param_value.table_type}\")"
+        return value
+
+    @staticmethod
+    def param_size_arguments(param_value: ParamIR) -> str:
+        """
+            Returns the size, precision and scale arguments of DynamicParameters.Add: ", size: 60", ", precision: 18, scale: 2".
+        """
+        arguments = ""
+        if param_value.length is not None:
+            arguments += f", size: {param_value.length}"
+        if param_value.precision is not None:
+            arguments += f", precision: {param_value.precision}"
+        if param_value.scale is not None:
+            arguments += f", scale: {param_value.scale}"
+        return arguments
+
+    @staticmethod
+    def db_string_arguments(param_value: ParamIR) -> str:
+        """
+            IsAnsi = true, IsFixedLength = true, Length = 10 for a CHAR(10). A MAX length is -1.
+        """
+        arguments = []
+        if param_value.sql_type in ("CHAR", "VARCHAR"):
+            arguments.append("IsAnsi = true")
+        if param_value.sql_type in ("CHAR", "NCHAR"):
+            arguments.append("IsFixedLength = true")
+        arguments.append(f"Length = {param_value.length}")
+        return ", ".join(arguments)
+
+
+def parse_annotation_arguments(text: str) -> dict[str, str]:
+    """
+        ttl=60 size=100 -> {"ttl": "60", "size": "100"}. A bare flag gets an empty value.
+    """
+    text = text.split('*/')[0]
+    return {key.lower(): value for key, value in ANNOTATION_ARGUMENT_PATTERN.findall(text)}
@@ -0,0 +1,152 @@
+import re
+from dapper.procedure_ir import ParamIR
+from dapper.schema_index import ColumnInfo, SchemaIndex
+from dapper.sp_utils import SPUtils, CSHARP_VALUE_TYPES, SIZED_SQL_TYPES
+from dapper.template_engine import Templates
+
+# SQL Server type -> SqlDbType member of the SqlMetaData of a table type column
+SQL_DB_TYPE_NAMES = {
+    "BIGINT": "BigInt", "INT": "Int", "SMALLINT": "SmallInt", "TINYINT": "TinyInt", "BIT": "Bit",
+    "DECIMAL": "Decimal", "NUMERIC": "Decimal", "MONEY": "Money", "SMALLMONEY": "SmallMoney",
+    "FLOAT": "Float", "REAL": "Real",
+    "DATE": "Date", "DATETIME": "DateTime", "DATETIME2": "DateTime2", "SMALLDATETIME": "SmallDateTime",
+    "DATETIMEOFFSET": "DateTimeOffset", "TIME": "Time",
+    "CHAR": "Char", "VARCHAR": "VarChar", "TEXT": "Text", "NCHAR": "NChar", "NVARCHAR": "NVarChar",
+    "NTEXT": "NText", "XML": "Xml", "SYSNAME": "NVarChar",
+    "BINARY": "Binary", "VARBINARY": "VarBinary", "IMAGE": "Image", "ROWVERSION": "Timestamp", "TIMESTAMP": "Timestamp",
+    "UNIQUEIDENTIFIER": "UniqueIdentifier", "SQL_VARIANT": "Variant"
+}
+
+# C# type -> SqlDataRecord setter, the other types are set with SetValue
+DATA_RECORD_SETTERS = {
+    "long": "SetInt64", "int": "SetInt32", "short": "SetInt16", "byte": "SetByte", "bool": "SetBoolean",
+    "decimal": "SetDecimal", "double": "SetDouble", "float": "SetFloat", "DateTime": "SetDateTime",
+    "DateTimeOffset": "SetDateTimeOffset", "TimeSpan": "SetTimeSpan", "Guid": "SetGuid", "string": "SetString"
+}
+
+# the column of a table type that isn't in the schema index is guessed from the words of the name of the type,
+# tpIntTable -> tp, int, table -> INT. Two words in a row count as one too, tpBigIntTable -> bigint.
+# The first match wins, so bigint is looked for before int.
+TABLE_TYPE_NAME_GUESSES = [
+    ("bigint", ColumnInfo("BIGINT", False, None)),
+    ("int", ColumnInfo("INT", False, None)),
+    ("guid", ColumnInfo("UNIQUEIDENTIFIER", False, None)),
+    ("uniqueidentifier", ColumnInfo("UNIQUEIDENTIFIER", False, None)),
+    ("string", ColumnInfo("NVARCHAR", False, -1)),
+    ("nvarchar", ColumnInfo("NVARCHAR", False, -1)),
+    ("varchar", ColumnInfo("NVARCHAR", False, -1)),
+    ("char", ColumnInfo("NVARCHAR", False, -1)),
+    ("datetime", ColumnInfo("DATETIME2", False, None)),
+    ("date", ColumnInfo("DATETIME2", False, None)),
+]
+
+# the words of a name: tp_BigIntTable2 -> tp, Big, Int, Table, 2
+NAME_WORD_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+class TableValuedParam:
+    """
+        A READONLY table-valued param of a SP.
+
+        The request holds its rows as a collection, the handler streams them to SQL Server as a structured param
+        of SqlDataRecords, read from the collection while the command is sent, without copying them to a DataTable.
+
+        A table type with one column is a collection of its C# type, e.g. tpIntTable -> IReadOnlyCollection<int>.
+        A table type with several columns, known from the schema index, gets a row record with a property per column.
+    """
+
+    def __init__(self, param: ParamIR, schema_index: SchemaIndex | None = None):
+        self.param = param
+        self.type_name = param.table_type
+        # the index ignores the schema, like for the tables
+        columns = schema_index and schema_index.table_columns(self.type_name.split('.')[-1]) or None
+        self.columns = columns or [("value", self.guess_column())]
+
+    def guess_column(self) -> ColumnInfo:
+        """
+            Returns the column of a table type guessed from its name, see TABLE_TYPE_NAME_GUESSES.
+            Raises ValueError when no word of the name is a type, rather than generating a wrongly typed param.
+        """
+        type_name = self.type_name.split('.')[-1].strip('[]')
+        words = [word.lower() for word in NAME_WORD_PATTERN.findall(type_name)]
+        words += [first + second for first, second in zip(words, words[1:])]
+        column_info = next((column_info for word, column_info in TABLE_TYPE_NAME_GUESSES if word in words), None)
+        if column_info is None:
+            raise ValueError(f"the columns of the table type {self.type_name} of {self.param.name} are unknown, "
+                             f"add its CREATE TYPE script to the schema index")
+        return column_info
+
+    @property
+    def has_row_type(self) -> bool:
+        return len(self.columns) > 1
+
+    def get_row_type_name(self) -> str:
+        """
+            Returns the C# type of one row: the type of the column, or the row record, tpAlertMapping -> TpAlertMappingRow.
+        """
+        if not self.has_row_type:
+            return self.columns[0][1].csharp_type()
+        name = self.type_name.split('.')[-1]
+        return f"{name[:1].upper()}{name[1:]}Row"
+
+    def get_collection_type(self) -> str:
+        return f"IReadOnlyCollection<{self.get_row_type_name()}>"
+
+    def get_row_type_definition(self, templates: Templates) -> str:
+        """
+            Returns the row record of a table type with several columns, or an empty string.
+        """
+        if not self.has_row_type:
+            return ""
+        return templates.render(
+            "result_record",
+            return_type_name=self.get_row_type_name(),
+            properties=templates.render_each("property", [
+                {"type": column_info.csharp_type(), "name": SPUtils.snake_case_to_pascal_case(column)}
+                for column, column_info in self.columns]))
+
+    def get_records_method(self, templates: Templates) -> str:
+        """
+            Returns the handler method turning the rows into the SqlDataRecords of the structured param.
+
+            One record is filled and yielded per row, SqlClient sends its values before asking for the next one,
+            so the rows are never all copied at once.
+        """
+        metadata = ",\n".join(f"            {self.get_column_metadata(column, column_info)}"
+                              for column, column_info in self.columns)
+        setters = "\n".join(self.get_column_setter(ordinal, column, column_info)
+                            for ordinal, (column, column_info) in enumerate(self.columns))
+
+        return templates.render(
+            "table_valued_records",
+            method_name=self.param.records_method_name,
+            row_type_name=self.get_row_type_name(),
+            metadata=metadata,
+            setters=setters)
+
+    @staticmethod
+    def get_column_metadata(column: str, column_info: ColumnInfo) -> str:
+        """
+            new SqlMetaData("name", SqlDbType.NVarChar, 255). MAX and unknown lengths are SqlMetaData.Max, -1.
+        """
+        sql_type = column_info.sql_type
+        arguments = f'"{column}", SqlDbType.{SQL_DB_TYPE_NAMES.get(sql_type, "NVarChar")}'
+        if sql_type in SIZED_SQL_TYPES or sql_type not in SQL_DB_TYPE_NAMES:
+            arguments += f", {column_info.length or -1}"
+        elif sql_type in ("DECIMAL", "NUMERIC"):
+            arguments += f", {column_info.precision or 18}, {column_info.scale or 0}"
+        return f"new SqlMetaData({arguments})"
+
+    def get_column_setter(self, ordinal: int, column: str, column_info: ColumnInfo) -> str:
+        """
+            record.SetInt32(0, row.AlertId); with a SetDBNull for a NULL of a nullable column.
+        """
+        csharp_type = SPUtils.sql_type_to_csharp_type(column_info.sql_type)
+        setter = DATA_RECORD_SETTERS.get(csharp_type, "SetValue")
+        value = self.has_row_type and f"row.{SPUtils.snake_case_to_pascal_case(column)}" or "row"
+
+        if not column_info.nullable:
+            return f"            record.{setter}({ordinal}, {value});"
+
+        set_value = csharp_type in CSHARP_VALUE_TYPES and f"{value}.Value" or value
+        return (f"            if ({value} is null) record.SetDBNull({ordinal});\n"
+                f"            else record.{setter}({ordinal}, {set_value});")
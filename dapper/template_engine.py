@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+# folder with the default templates, shipped next to this file
+DEFAULT_TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+TEMPLATE_SUFFIX = '.cs.template'
+
+# {{ name }}
+FIELD_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class Template:
+    """
+        A template compiled once into its literal parts and field names.
+        Rendering is a single pass over the parts, so it costs the size of the output.
+    """
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        parts = FIELD_PATTERN.split(source)
+        # split with a group alternates literal, field, literal, ..., literal
+        self.literals = parts[0::2]
+        self.fields = parts[1::2]
+
+    def iter_parts(self, context: dict):
+        literals = self.literals
+        yield literals[0]
+        for index, field in enumerate(self.fields):
+            try:
+                yield str(context[field])
+            except KeyError:
+                raise ValueError(f"Template {self.name} has no value for {{{{{field}}}}}") from None
+            yield literals[index + 1]
+
+    def render(self, **context) -> str:
+        return ''.join(self.iter_parts(context))
+
+    def render_to(self, stream, **context):
+        """
+            Writes the rendered template straight to an open file, without building the string.
+        """
+        stream.writelines(self.iter_parts(context))
+
+
+class Templates:
+    """
+        The set of templates used by the request, result and handler generators.
+
+        The default templates are read from dapper/templates. A template folder can override any of them
+        with a file of the same name, e.g. handler.cs.template.
+    """
+
+    def __init__(self, template_folder: str | None = None):
+        self.template_folder = template_folder
+        self.templates = {}
+        sources = {}
+        for folder in filter(None, (DEFAULT_TEMPLATE_FOLDER, template_folder)):
+            for file in sorted(os.listdir(folder)):
+                if file.endswith(TEMPLATE_SUFFIX):
+                    name = file[:-len(TEMPLATE_SUFFIX)]
+                    with open(os.path.join(folder, file), 'r', encoding='utf-8') as template_file:
+                        sources[name] = template_file.read()
+                    self.templates[name] = Template(name, sources[name])
+
+        # changes whenever a template changes, so the manifest can tell the outputs are stale
+        digest = hashlib.sha256()
+        for name in sorted(sources):
+            digest.update(f"{name}\0{sources[name]}\0".encode('utf-8'))
+        self.source_hash = digest.hexdigest()
+
+    def get(self, name: str) -> Template:
+        return self.templates[name]
+
+    def render(self, name: str, **context) -> str:
+        return self.templates[name].render(**context)
+
+    def render_each(self, name: str, contexts) -> str:
+        """
+            Renders the template once per context and joins the results, e.g. one property per column.
+        """
+        template = self.templates[name]
+        return ''.join(part for context in contexts for part in template.iter_parts(context))
+
+    def render_to(self, stream, name: str, **context):
+        self.templates[name].render_to(stream, **context)
+
+
+@lru_cache(maxsize=None)
+def load_templates(template_folder: str | None = None) -> Templates:
+    """
+        Returns the templates for the folder, compiled once per process.
+    """
+    return Templates(template_folder)
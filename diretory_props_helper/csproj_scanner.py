@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree.ElementTree import iterparse, ParseError
+
+# folders that never hold a project file of the solution, they are not walked
+PRUNED_DIRS = {'bin', 'obj', 'node_modules', '.git', '.vs'}
+
+# threads reading the project files, the reads wait on the disk more than they use the CPU
+DEFAULT_THREADS = 16
+
+# 1.2.3, 1.2.3.4, 1.2.3-beta.1+build and the lower bound of a range, [1.2.3, 2.0.0)
+SEMVER_PATTERN = re.compile(r'^\s*[\[(]?\s*v?(\d+(?:\.\d+)*)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?')
+
+
+def iter_csproj_files(solution_dir):
+    """
+        Yields the .csproj files of the solution folder and its sub folders, in name order.
+
+        The tree is walked once with os.scandir and the build output, package and git folders are pruned,
+        they can hold thousands of files and never a project of the solution.
+    """
+    folders = [solution_dir]
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as error:
+            print(f'Skipped {folder}: {error}', file=sys.stderr)
+            continue
+
+        sub_folders = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name.lower() not in PRUNED_DIRS:
+                    sub_folders.append(entry.path)
+            elif entry.name.endswith('.csproj') and entry.is_file():
+                yield entry.path
+        folders.extend(reversed(sub_folders))
+
+
+def local_name(tag):
+    # old style projects have a namespace, {http://schemas.microsoft.com/developer/msbuild/2003}PackageReference
+    return tag.rpartition('}')[2]
+
+
+def read_package_refs(csproj_file):
+    """
+        Returns the (package name, version) of the <PackageReference> elements of a project file.
+
+        The file is read with a streaming parser and each reference is dropped once read. The version is
+        the Version or VersionOverride attribute or a <Version> child element. A reference without a version
+        is already managed centrally and is skipped. A file that is not valid XML is reported and skipped.
+    """
+    package_refs = []
+    try:
+        for _, element in iterparse(csproj_file, events=('end',)):
+            if local_name(element.tag) != 'PackageReference':
+                continue
+            include = element.get('Include') or element.get('Update')
+            version = element.get('Version') or element.get('VersionOverride')
+            if version is None:
+                version = next((child.text for child in element if local_name(child.tag) == 'Version'), None)
+            if include and version:
+                package_refs.append((include, version.strip()))
+            element.clear()
+    except (OSError, ParseError) as error:
+        print(f'Skipped {csproj_file}: {error}', file=sys.stderr)
+    return package_refs
+
+
+def semver_key(version):
+    """
+        Returns a key sorting versions by semantic version precedence: 1.10.0 > 1.9.0, 2.0.0 > 2.0.0-rc.1,
+        rc.10 > rc.2. Missing parts are 0, so 1.0 and 1.0.0 are equal. A version that isn't a number,
+        like a $(property), sorts before all the others.
+    """
+    match = SEMVER_PATTERN.match(version)
+    if not match:
+        return (), 0, ()
+    numbers = tuple(int(number) for number in match.group(1).split('.'))
+    numbers += (0,) * (4 - len(numbers))
+    prerelease = match.group(2)
+    if prerelease is None:
+        return numbers, 1, ()
+    # numeric identifiers sort before the alphanumeric ones and are compared as numbers
+    identifiers = tuple(identifier.isdigit() and (0, int(identifier), '') or (1, 0, identifier.lower())
+                        for identifier in prerelease.split('.'))
+    return numbers, 0, identifiers
+
+
+def scan_package_refs(csproj_files, threads=DEFAULT_THREADS):
+    """
+        Reads the package references of the project files on a thread pool.
+        Returns {package name: {version: [project files]}}, the files in the order given.
+    """
+    csproj_files = list(csproj_files)
+    package_versions = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for csproj_file, package_refs in zip(csproj_files, executor.map(read_package_refs, csproj_files)):
+            for include, version in package_refs:
+                package_versions.setdefault(include, {}).setdefault(version, []).append(csproj_file)
+    return package_versions
+
+
+def resolve_versions(package_versions):
+    """
+        Picks the highest semantic version of each package.
+        Returns {package name: version} and {package name: {version: [project files]}} of the packages
+        referenced with several versions.
+    """
+    resolved = {}
+    conflicts = {}
+    for include, versions in package_versions.items():
+        resolved[include] = max(versions, key=semver_key)
+        if len(versions) > 1:
+            conflicts[include] = versions
+    return resolved, conflicts
+
+
+def print_conflicts(resolved, conflicts):
+    for include, versions in sorted(conflicts.items()):
+        print(f'{include} is referenced with {len(versions)} versions, using {resolved[include]}:')
+        for version in sorted(versions, key=semver_key, reverse=True):
+            print(f'    {version}: {", ".join(versions[version])}')
@@ -1,5 +1,9 @@
 import os
-import xml.etree.ElementTree as ET
+import sys
+
+# the scanner sits next to this script, which is run from the solution folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from csproj_scanner import iter_csproj_files, scan_package_refs, resolve_versions, print_conflicts
 
 # Directory containing your solution
 solution_dir = './'
@@ -7,10 +11,8 @@ solution_dir = './'
 # File to write the package references to
 output_file = 'Directory.Packages.props'
 
-# Find all .csproj files in the solution directory
-csproj_files = [os.path.join(root, file)
-                for root, dirs, files in os.walk(solution_dir)
-                for file in files if file.endswith('.csproj')]
+# Find all .csproj files in the solution directory, in one walk that skips bin, obj, node_modules and .git
+csproj_files = list(iter_csproj_files(solution_dir))
 
 print(f'Found {len(csproj_files)} .csproj files in {solution_dir}')
 
@@ -18,29 +20,11 @@ print(f'Found {len(csproj_files)} .csproj files in {solution_dir}')
 for csproj_file in csproj_files:
     print(csproj_file)
 
-# Extract package references from each .csproj file
-def get_package_refs(csproj_file):
-    tree = ET.parse(csproj_file)
-    root = tree.getroot()
-    package_refs = {}
-    # look for <PackageReference> elements
-    for package_ref in root.iter('PackageReference'):
-        # get the package name and version
-        include = package_ref.attrib['Include']
-        version = package_ref.attrib['Version']
-        package_refs[include] = version
-    return package_refs
-
-# find all package references in files ending in .csproj and add them to the package_refs dictionary
+# find all package references in the .csproj files, read on a thread pool
 # the key is the package name and the value is the version
-all_csproj_files = [os.path.join(root, file) 
-                    for root, dirs, files in os.walk(solution_dir)
-                    for file in files if file.endswith('.csproj')]
-
-package_refs = {}
-
-for csproj_file in all_csproj_files:
-    package_refs.update(get_package_refs(csproj_file))
+# a package referenced with several versions gets the highest one and is reported
+package_refs, conflicts = resolve_versions(scan_package_refs(csproj_files))
+print_conflicts(package_refs, conflicts)
 
 # Write the package references to the Directory.Packages.props file
 with open(output_file, 'w') as f:
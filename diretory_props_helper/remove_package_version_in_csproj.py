@@ -1,16 +1,19 @@
 import os
+import sys
 import xml.etree.ElementTree as ET
 
+# the scanner sits next to this script, which is run from the solution folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from csproj_scanner import iter_csproj_files
+
 # Directory containing your solution
 solution_dir = './'
 
 # File to write the package references to
 output_file = 'Directory.Packages.props'
 
-# Find all .csproj files in the solution directory
-csproj_files = [os.path.join(root, file)
-                for root, dirs, files in os.walk(solution_dir)
-                for file in files if file.endswith('.csproj')]
+# Find all .csproj files in the solution directory, skipping bin, obj, node_modules and .git
+csproj_files = list(iter_csproj_files(solution_dir))
 
 print(f'Found {len(csproj_files)} .csproj files in {solution_dir}')
 
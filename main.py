@@ -1,6 +1,10 @@
+import sys
 from dapper.dapper_file_generator import DapperFileGenerator
 from dapper.dapper_generator import DapperGenerator
 from dapper.dapper_return_type_generator import DapperReturnTypeGenerator
+from dapper.dapper_watcher import DapperWatcher
+from dapper.generation_profiler import GenerationProfiler
+from dapper.sql_discovery import parse_shard
 
 
 sp_query = """
@@ -111,6 +115,27 @@ root_namespace = 'Webmonitor.Site'
 
 # dapper_generator.generate(sp_folder, root_namespace)
 
-dapper_file_generator = DapperFileGenerator()
+# python main.py --profile saves the stage timings and the slowest procedures to generation_report.json
+profiler = '--profile' in sys.argv and GenerationProfiler(profile=True) or None
+
+# python main.py --shard 2/4 generates the second quarter of the sql files, see dapper.shard_merge to combine them
+shard = '--shard' in sys.argv and parse_shard(sys.argv[sys.argv.index('--shard') + 1]) or None
+
+# python main.py --verbose prints the traceback of the files that fail to generate
+verbose = '--verbose' in sys.argv
+
+dapper_file_generator = DapperFileGenerator(profiler=profiler, shard=shard, verbose=verbose)
 output_folder_path = 'sp_test/sp_output'
-dapper_file_generator.generate(sp_folder, output_folder_path, root_namespace)
+
+if profiler:
+    profiler.start()
+
+# python main.py --watch keeps regenerating the changed sql files
+if '--watch' in sys.argv:
+    DapperWatcher(sp_folder, output_folder_path, root_namespace, dapper_file_generator).run()
+else:
+    dapper_file_generator.generate(sp_folder, output_folder_path, root_namespace)
+
+if profiler:
+    profiler.stop()
+    profiler.save_report('generation_report.json')
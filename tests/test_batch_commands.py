@@ -0,0 +1,52 @@
+from dapper.dapper_file_generator import DapperFileGenerator
+
+SP_TEXT = """-- @dapper:batch size=500
+CREATE PROCEDURE dbo.usp_alert_acknowledge_alert
+    @alert_id INT,
+    @note VARCHAR(100)
+AS
+UPDATE dbo.alerts SET note = @note WHERE alert_id = @alert_id
+"""
+
+
+def render(sp_text):
+    return {path.rsplit("/", 1)[-1]: content for path, content in DapperFileGenerator.render_text(sp_text, "Sp", "App")}
+
+
+def test_batch_annotation_adds_a_batch_request_and_handler():
+    outputs = render(SP_TEXT)
+
+    assert "public record AlertAcknowledgeAlertBatchCommand : ICommand<Result<Unit>>" in outputs["AlertAcknowledgeAlertCommand.cs"]
+    assert "IReadOnlyCollection<AlertAcknowledgeAlertCommand> Requests" in outputs["AlertAcknowledgeAlertCommand.cs"]
+    handler = outputs["AlertAcknowledgeAlertHandler.cs"]
+    assert "internal sealed class AlertAcknowledgeAlertBatchCommandHandler(" in handler
+    assert "private const int BatchSize = 500;" in handler
+    assert 'sql.Append($"EXEC [dbo].[usp_alert_acknowledge_alert] @alert_id = @alert_id_{index}, @note = @note_{index};\\n");' in handler
+    assert 'parameters.Add($"@alert_id_{index}", item.AlertId, DbType.Int32, ParameterDirection.Input);' in handler
+    assert 'parameters.Add($"@note_{index}", item.Note, DbType.AnsiString, ParameterDirection.Input, size: 100);' in handler
+    assert "await transaction.CommitAsync(cancellationToken);" in handler
+    # the single request handler is still generated
+    assert "internal sealed class AlertAcknowledgeAlertCommandHandler(" in handler
+
+
+def test_batch_size_keeps_a_chunk_under_the_parameter_limit():
+    params = ",\n".join(f"    @value_{number} INT" for number in range(40))
+    handler = render(SP_TEXT.replace("    @alert_id INT,\n    @note VARCHAR(100)", params))["AlertAcknowledgeAlertHandler.cs"]
+
+    # 2000 parameters / 40 per request
+    assert "private const int BatchSize = 50;" in handler
+
+
+def test_default_batch_size():
+    handler = render(SP_TEXT.replace("size=500", ""))["AlertAcknowledgeAlertHandler.cs"]
+
+    assert "private const int BatchSize = 100;" in handler
+
+
+def test_commands_with_output_parameters_and_queries_get_no_batch():
+    with_output = render(SP_TEXT.replace("@note VARCHAR(100)", "@note VARCHAR(100) OUTPUT"))
+    query = render(SP_TEXT.replace("usp_alert_acknowledge_alert", "usp_get_alert")
+                   .replace("UPDATE dbo.alerts SET note = @note WHERE", "SELECT note FROM dbo.alerts WHERE"))
+
+    assert not any("BatchCommand" in content for content in with_output.values())
+    assert not any("BatchCommand" in content for content in query.values())
@@ -0,0 +1,131 @@
+import os
+from pathlib import Path
+import pytest
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.shard_merge import check_shards
+
+QUERY = """-- @dapper:cache ttl=300 size=100
+CREATE PROCEDURE dbo.usp_get_alert_severity_image_urls
+AS
+SELECT severity, image_url FROM dbo.alert_severities
+"""
+
+COMMAND = """-- @dapper:invalidates usp_get_alert_severity_image_urls
+CREATE PROCEDURE dbo.usp_update_alert_severity
+    @severity INT,
+    @image_url VARCHAR(255)
+AS
+UPDATE dbo.alert_severities SET image_url = @image_url WHERE severity = @severity
+"""
+
+CACHING_HANDLER = "Queries.GetAlertSeverityImageUrls.GetAlertSeverityImageUrlsQueryCachingHandler"
+
+
+def write_sql(folder, relative_path, text):
+    path = Path(folder, *relative_path.split("/"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def generated(output_folder):
+    return {path.relative_to(output_folder).as_posix(): path.read_text() for path in Path(output_folder).rglob("*.cs")}
+
+
+@pytest.fixture
+def folders(tmp_path):
+    return str(tmp_path / "Sp"), str(tmp_path / "out")
+
+
+def test_cached_query_gets_a_caching_handler():
+    handler = next(content for path, content in DapperFileGenerator.render_text(QUERY, "Sp", "App")
+                   if path.endswith("Handler.cs"))
+
+    assert "internal sealed class GetAlertSeverityImageUrlsQueryCachingHandler(" \
+           "GetAlertSeverityImageUrlsQueryHandler handler)" in handler
+    assert "new MemoryCacheOptions { SizeLimit = 100 }" in handler
+    assert "TimeSpan.FromSeconds(300)" in handler
+    assert "if (result.IsSuccess)" in handler
+
+
+def test_streamed_query_is_not_cached():
+    outputs = DapperFileGenerator.render_text(QUERY.replace("-- @dapper:cache", "-- @dapper:stream\n-- @dapper:cache"),
+                                              "Sp", "App")
+
+    assert not any("CachingHandler" in content for _, content in outputs)
+
+
+def test_command_clears_the_cache_of_a_query_of_its_folder(folders):
+    sp_folder, output_folder = folders
+    write_sql(sp_folder, "alerts/usp_get_alert_severity_image_urls.sql", QUERY)
+    # written before the query, the command waits for it
+    write_sql(sp_folder, "alerts/usp_a_update_alert_severity.sql", COMMAND)
+
+    assert DapperFileGenerator().generate(sp_folder, output_folder, "App") == []
+
+    handler = generated(output_folder)["Alerts/Commands/UpdateAlertSeverity/UpdateAlertSeverityHandler.cs"]
+    assert f"        {CACHING_HANDLER}.Invalidate();" in handler
+
+
+@pytest.mark.parametrize("query", [
+    QUERY.replace("usp_get_alert_severity_image_urls", "usp_get_alert_severity_images"),
+    QUERY.replace("-- @dapper:cache ttl=300 size=100\n", ""),
+], ids=["unknown query", "query without cache"])
+def test_unresolved_invalidation_fails_the_command(folders, query):
+    sp_folder, output_folder = folders
+    write_sql(sp_folder, "usp_get_alert_severity_image_urls.sql", query)
+    write_sql(sp_folder, "usp_update_alert_severity.sql", COMMAND)
+
+    errors = DapperFileGenerator().generate(sp_folder, output_folder, "App")
+
+    assert [os.path.basename(error["file"]) for error in errors] == ["usp_update_alert_severity.sql"]
+    assert "usp_get_alert_severity_image_urls of @dapper:invalidates" in errors[0]["error"]
+    assert not any(path.startswith("Commands/") for path in generated(output_folder))
+
+
+def test_query_of_another_folder_is_not_found(folders):
+    sp_folder, output_folder = folders
+    write_sql(sp_folder, "alerts/usp_get_alert_severity_image_urls.sql", QUERY)
+    write_sql(sp_folder, "admin/usp_update_alert_severity.sql", COMMAND)
+
+    errors = DapperFileGenerator().generate(sp_folder, output_folder, "App")
+
+    assert [os.path.basename(error["file"]) for error in errors] == ["usp_update_alert_severity.sql"]
+
+
+def test_unchanged_command_is_removed_when_its_query_loses_the_cache(folders):
+    sp_folder, output_folder = folders
+    write_sql(sp_folder, "usp_get_alert_severity_image_urls.sql", QUERY)
+    write_sql(sp_folder, "usp_update_alert_severity.sql", COMMAND)
+    assert DapperFileGenerator().generate(sp_folder, output_folder, "App") == []
+
+    write_sql(sp_folder, "usp_get_alert_severity_image_urls.sql", QUERY.replace("-- @dapper:cache ttl=300 size=100\n", ""))
+    errors = DapperFileGenerator().generate(sp_folder, output_folder, "App")
+
+    assert [error["file"] for error in errors] == ["usp_update_alert_severity.sql"]
+    assert not any(path.startswith("Commands/") for path in generated(output_folder))
+
+    # generated again once the query is cached again
+    write_sql(sp_folder, "usp_get_alert_severity_image_urls.sql", QUERY)
+    assert DapperFileGenerator().generate(sp_folder, output_folder, "App") == []
+    assert "Commands/UpdateAlertSeverity/UpdateAlertSeverityHandler.cs" in generated(output_folder)
+
+
+def test_shard_merge_checks_the_queries_of_every_shard(folders, tmp_path):
+    sp_folder, _ = folders
+    write_sql(sp_folder, "usp_get_alert_severity_image_urls.sql", QUERY)
+    write_sql(sp_folder, "usp_update_alert_severity.sql", COMMAND)
+    shard_folders = [str(tmp_path / f"shard{index}") for index in (1, 2)]
+    for index, shard_folder in enumerate(shard_folders, 1):
+        assert DapperFileGenerator(shard=(index, 2)).generate(sp_folder, shard_folder, "App") == []
+
+    problems, _ = check_shards(sp_folder, shard_folders)
+    assert problems == []
+
+    # the query file of its shard only
+    write_sql(sp_folder, "usp_get_alert_severity_image_urls.sql", QUERY.replace("-- @dapper:cache ttl=300 size=100\n", ""))
+    for index, shard_folder in enumerate(shard_folders, 1):
+        DapperFileGenerator(shard=(index, 2)).generate(sp_folder, shard_folder, "App")
+
+    problems, _ = check_shards(sp_folder, shard_folders)
+    assert problems == ["usp_update_alert_severity.sql: usp_get_alert_severity_image_urls of @dapper:invalidates "
+                        "is not a query generated with @dapper:cache in the same folder"]
@@ -0,0 +1,77 @@
+from diretory_props_helper.csproj_scanner import (iter_csproj_files, read_package_refs, resolve_versions,
+                                                  scan_package_refs, semver_key)
+
+PROJECT = """<Project Sdk="Microsoft.NET.Sdk">
+  <ItemGroup>
+    <PackageReference Include="Dapper" Version="2.1.35" />
+    <PackageReference Include="MediatR" VersionOverride="12.2.0" />
+    <PackageReference Include="Serilog">
+      <Version> 3.1.1 </Version>
+    </PackageReference>
+    <PackageReference Include="Microsoft.Data.SqlClient" />
+  </ItemGroup>
+</Project>
+"""
+
+OLD_STYLE_PROJECT = """<Project xmlns="http://schemas.microsoft.com/developer/msbuild/2003">
+  <ItemGroup>
+    <PackageReference Include="Dapper" Version="2.0.123" />
+  </ItemGroup>
+</Project>
+"""
+
+
+def test_semver_key_orders_by_precedence():
+    versions = ["2.0.0", "1.9.0", "2.0.0-rc.1", "1.10.0", "2.0.0-rc.10", "2.0.0-rc.2", "2.0.0-beta", "$(DapperVersion)"]
+
+    assert sorted(versions, key=semver_key) == [
+        "$(DapperVersion)", "1.9.0", "1.10.0", "2.0.0-beta", "2.0.0-rc.1", "2.0.0-rc.2", "2.0.0-rc.10", "2.0.0"]
+    assert semver_key("1.10.0") > semver_key("1.9.0")
+    assert semver_key("2.0.0") > semver_key("2.0.0-rc.1")
+    assert semver_key("1.0") == semver_key("1.0.0") == semver_key("1.0.0+build.5")
+    assert semver_key("[1.2.3, 2.0.0)") == semver_key("1.2.3")
+
+
+def test_read_package_refs(tmp_path):
+    csproj_file = tmp_path / "App.csproj"
+    csproj_file.write_text(PROJECT)
+    old_style_file = tmp_path / "Legacy.csproj"
+    old_style_file.write_text(OLD_STYLE_PROJECT)
+
+    assert read_package_refs(str(csproj_file)) == [("Dapper", "2.1.35"), ("MediatR", "12.2.0"), ("Serilog", "3.1.1")]
+    assert read_package_refs(str(old_style_file)) == [("Dapper", "2.0.123")]
+
+
+def test_invalid_project_is_reported_on_stderr(tmp_path, capsys):
+    csproj_file = tmp_path / "Broken.csproj"
+    csproj_file.write_text("<Project>")
+
+    assert read_package_refs(str(csproj_file)) == []
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "Skipped" in captured.err
+
+
+def test_build_folders_are_pruned(tmp_path):
+    for relative_path in ("src/App/App.csproj", "src/App/bin/Debug/App.csproj", "src/App/obj/App.csproj",
+                          "tests/App.Tests/App.Tests.csproj", "node_modules/pkg/Pkg.csproj", "README.md"):
+        path = tmp_path.joinpath(*relative_path.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(PROJECT)
+
+    csproj_files = [path.replace(str(tmp_path), "").replace("\\", "/") for path in iter_csproj_files(str(tmp_path))]
+
+    assert csproj_files == ["/src/App/App.csproj", "/tests/App.Tests/App.Tests.csproj"]
+
+
+def test_highest_version_wins_and_conflicts_are_kept(tmp_path):
+    first = tmp_path / "First.csproj"
+    first.write_text(PROJECT)
+    second = tmp_path / "Second.csproj"
+    second.write_text(PROJECT.replace("2.1.35", "2.1.4"))
+
+    resolved, conflicts = resolve_versions(scan_package_refs([str(first), str(second)], threads=2))
+
+    assert resolved["Dapper"] == "2.1.35"
+    assert resolved["Serilog"] == "3.1.1"
+    assert conflicts == {"Dapper": {"2.1.35": [str(first)], "2.1.4": [str(second)]}}
@@ -0,0 +1,88 @@
+import io
+from xml.etree.ElementTree import fromstring
+from dapper.dacpac_reader import param_type, param_declaration, read_user_types, iter_model_procedures
+
+MODEL = """<?xml version="1.0" encoding="utf-8"?>
+<DataSchemaModel xmlns="http://schemas.microsoft.com/sqlserver/dac/Serialization/2012/02">
+    <Model>
+        <Element Type="SqlProcedure" Name="[dbo].[usp_add_user]">
+            <Property Name="BodyScript"><Value><![CDATA[BEGIN SELECT 1 END]]></Value></Property>
+            <Relationship Name="Parameters">
+                <Entry>
+                    <Element Type="SqlSubroutineParameter" Name="[dbo].[usp_add_user].[@email]">
+                        <Relationship Name="Type"><Entry><References Name="[dbo].[Email]" /></Entry></Relationship>
+                    </Element>
+                </Entry>
+                <Entry>
+                    <Element Type="SqlSubroutineParameter" Name="[dbo].[usp_add_user].[@location_ids]">
+                        <Relationship Name="Type"><Entry><References Name="[dbo].[tpIntTable]" /></Entry></Relationship>
+                    </Element>
+                </Entry>
+            </Relationship>
+        </Element>
+        <Element Type="SqlUserDefinedDataType" Name="[dbo].[Email]">
+            <Property Name="Length" Value="256" />
+            <Relationship Name="Type">
+                <Entry><References ExternalSource="BuiltIns" Name="[nvarchar]" /></Entry>
+            </Relationship>
+        </Element>
+        <Element Type="SqlTableType" Name="[dbo].[tpIntTable]" />
+    </Model>
+</DataSchemaModel>
+"""
+
+
+def param(type_xml: str, properties: str = "") -> object:
+    return fromstring(f"""<Element Type="SqlSubroutineParameter" Name="[dbo].[usp_get_alerts].[@value]">
+        {properties}<Relationship Name="Type"><Entry>{type_xml}</Entry></Relationship></Element>""")
+
+
+def specifier(name: str, properties: str = "") -> str:
+    return f"""<Element Type="SqlTypeSpecifier">{properties}<Relationship Name="Type"><Entry>
+        <References ExternalSource="BuiltIns" Name="{name}" /></Entry></Relationship></Element>"""
+
+
+def test_builtin_types_keep_their_facets():
+    assert param_type(param(specifier("[int]"))) == ("INT", False)
+    assert param_type(param(specifier("[nvarchar]", '<Property Name="Length" Value="60" />'))) \
+        == ("NVARCHAR(60)", False)
+    assert param_type(param(specifier("[varbinary]", '<Property Name="IsMax" Value="True" />'))) \
+        == ("VARBINARY(MAX)", False)
+    assert param_type(param(specifier("[decimal]", '<Property Name="Precision" Value="10" />'
+                                                   '<Property Name="Scale" Value="2" />'))) == ("DECIMAL(10, 2)", False)
+
+
+def test_param_without_a_type_is_a_variant():
+    assert param_type(fromstring('<Element Type="SqlSubroutineParameter" Name="[@value]" />')) == ("SQL_VARIANT", False)
+
+
+def test_user_types_are_resolved_through_the_model():
+    user_types = read_user_types(io.BytesIO(MODEL.encode()))
+
+    assert user_types == {"[dbo].[Email]": ("NVARCHAR(256)", False),
+                          "[dbo].[tpIntTable]": ("[dbo].[tpIntTable]", True)}
+    assert param_type(param('<References Name="[dbo].[Email]" />'), user_types) == ("NVARCHAR(256)", False)
+    assert param_type(param('<References Name="[dbo].[tpIntTable]" />'), user_types) == ("[dbo].[tpIntTable]", True)
+
+
+def test_alias_type_is_not_a_table_type():
+    declaration = param_declaration(param('<References Name="[dbo].[Email]" />'))
+
+    assert declaration == "@value [dbo].[Email]"
+
+
+def test_read_only_param_is_declared_read_only():
+    declaration = param_declaration(param('<References Name="[dbo].[tpIntTable]" />',
+                                          '<Property Name="IsReadOnly" Value="True" />'))
+
+    assert declaration == "@value [dbo].[tpIntTable] READONLY"
+
+
+def test_procedure_params_are_declared_with_the_user_types_of_the_model():
+    user_types = read_user_types(io.BytesIO(MODEL.encode()))
+    procedures = list(iter_model_procedures(io.BytesIO(MODEL.encode()), user_types))
+
+    assert [name for name, _ in procedures] == ["[dbo].[usp_add_user]"]
+    script = procedures[0][1]
+    assert "@email NVARCHAR(256),\n" in script
+    assert "@location_ids [dbo].[tpIntTable] READONLY\n" in script
@@ -0,0 +1,70 @@
+import os
+from pathlib import Path
+import pytest
+from dapper import dapper_watcher
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.dapper_watcher import DapperWatcher
+
+SP_TEXT = """CREATE PROCEDURE dbo.usp_get_user
+    @id INT
+AS
+SELECT id, name FROM dbo.users WHERE id = @id
+"""
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dapper_watcher.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    sp_folder = tmp_path / "Sp"
+    sp_folder.mkdir()
+    (sp_folder / "usp_get_user.sql").write_text(SP_TEXT)
+    watcher = DapperWatcher(str(sp_folder), str(tmp_path / "out"), "App", debounce=10)
+    assert watcher.start() == []
+    return watcher
+
+
+def outputs(watcher):
+    return {path.name: path.read_text() for path in Path(watcher.output_folder_path).rglob("*.cs")}
+
+
+def test_change_waits_for_the_file_to_settle(watcher, clock):
+    sp_file = os.path.join(watcher.sp_folder_path, "usp_get_user.sql")
+    with open(sp_file, "w") as file:
+        file.write(SP_TEXT.replace("id, name", "id"))
+    assert watcher.poll() is None
+
+    # a second write restarts the debounce
+    clock[0] += 5
+    with open(sp_file, "w") as file:
+        file.write(SP_TEXT.replace("id, name", "id, name, email"))
+    assert watcher.poll() is None
+    clock[0] += 6
+    assert watcher.poll() is None
+
+    clock[0] += 5
+    assert watcher.poll() == []
+    assert watcher.pending == {}
+    assert "Email" in outputs(watcher)["GetUserResult.cs"]
+    assert watcher.poll() is None
+
+
+def test_deleted_file_removes_its_outputs(watcher, clock):
+    assert outputs(watcher) != {}
+
+    os.remove(os.path.join(watcher.sp_folder_path, "usp_get_user.sql"))
+    assert watcher.poll() is None
+    clock[0] += 10
+
+    assert watcher.poll() == []
+    assert outputs(watcher) == {}
+
+
+def test_generator_must_be_incremental(tmp_path):
+    with pytest.raises(ValueError):
+        DapperWatcher(str(tmp_path), str(tmp_path / "out"), "App", DapperFileGenerator(incremental=False))
@@ -0,0 +1,98 @@
+import os
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.generation_manifest import GenerationManifest, hash_bytes
+
+GET_ALERTS = "CREATE PROCEDURE dbo.usp_get_alerts @site_id INT\nAS\nSELECT alert_id, title FROM dbo.tblAlert\n"
+ADD_ALERT = "CREATE PROCEDURE dbo.usp_add_alert @title NVARCHAR(60)\nAS\nINSERT INTO dbo.tblAlert (title) VALUES (@title)\n"
+
+
+def write(path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(text.encode())
+
+
+def recorded_manifest(tmp_path, settings: str = "settings") -> GenerationManifest:
+    sql_file = tmp_path / "usp_get_alerts.sql"
+    write(sql_file, GET_ALERTS)
+    write(tmp_path / "out" / "Queries" / "GetAlertsQuery.cs", "class GetAlertsQuery {}")
+    stat = os.stat(sql_file)
+    manifest = GenerationManifest(str(tmp_path / "out"), settings)
+    manifest.record("usp_get_alerts.sql", {"hash": hash_bytes(GET_ALERTS.encode()), "size": stat.st_size,
+                                           "mtime_ns": stat.st_mtime_ns, "encoding": "utf-8"},
+                    {"Queries/GetAlertsQuery.cs": "hash"})
+    manifest.save()
+    return manifest
+
+
+def test_saved_manifest_is_loaded_with_the_same_settings(tmp_path):
+    recorded_manifest(tmp_path)
+
+    assert GenerationManifest(str(tmp_path / "out"), "settings").load().sources.keys() == {"usp_get_alerts.sql"}
+    # other settings or another generator version regenerate everything
+    assert GenerationManifest(str(tmp_path / "out"), "other settings").load().sources == {}
+
+
+def test_unchanged_source_is_skipped(tmp_path):
+    manifest = recorded_manifest(tmp_path)
+    sql_file = str(tmp_path / "usp_get_alerts.sql")
+    output_folder = str(tmp_path / "out")
+
+    assert manifest.is_unchanged("usp_get_alerts.sql", sql_file, output_folder)
+
+    # touched with the same content
+    os.utime(sql_file, ns=(0, 0))
+    assert manifest.is_unchanged("usp_get_alerts.sql", sql_file, output_folder)
+    assert manifest.sources["usp_get_alerts.sql"]["mtime_ns"] == 0
+
+    write(tmp_path / "usp_get_alerts.sql", GET_ALERTS.replace("title", "name"))
+    assert not manifest.is_unchanged("usp_get_alerts.sql", sql_file, output_folder)
+
+
+def test_source_with_a_missing_output_is_regenerated(tmp_path):
+    manifest = recorded_manifest(tmp_path)
+    os.remove(tmp_path / "out" / "Queries" / "GetAlertsQuery.cs")
+
+    assert not manifest.is_unchanged("usp_get_alerts.sql", str(tmp_path / "usp_get_alerts.sql"), str(tmp_path / "out"))
+
+
+def test_stale_and_deleted_outputs(tmp_path):
+    manifest = recorded_manifest(tmp_path)
+    manifest.record("usp_add_alert.sql", {"hash": "h"}, {"Commands/AddAlertCommand.cs": "a", "Commands/Old.cs": "b"})
+
+    assert manifest.stale_outputs("usp_add_alert.sql", {"Commands/AddAlertCommand.cs": "c"}) == ["Commands/Old.cs"]
+    assert manifest.deleted_sources({"usp_add_alert.sql"}) == ["usp_get_alerts.sql"]
+    assert manifest.remove_deleted_sources({"usp_add_alert.sql"}) == ["Queries/GetAlertsQuery.cs"]
+    assert manifest.sources.keys() == {"usp_add_alert.sql"}
+
+
+def test_outputs_claimed_by_two_sources_are_duplicates(tmp_path):
+    manifest = recorded_manifest(tmp_path)
+    manifest.record("copy.sql", {"hash": "h"}, {"Queries/GetAlertsQuery.cs": "hash"})
+
+    assert manifest.duplicate_outputs() == {"Queries/GetAlertsQuery.cs": ["copy.sql", "usp_get_alerts.sql"]}
+
+
+def output_files(output_folder) -> set[str]:
+    return {os.path.relpath(os.path.join(folder, file), output_folder).replace(os.sep, "/")
+            for folder, _, files in os.walk(output_folder) for file in files if not file.startswith(".")}
+
+
+def test_incremental_run_regenerates_changes_and_removes_the_outputs_of_deleted_files(tmp_path):
+    sp_folder = tmp_path / "sp"
+    output_folder = str(tmp_path / "out")
+    write(sp_folder / "usp_get_alerts.sql", GET_ALERTS)
+    write(sp_folder / "reports" / "usp_add_alert.sql", ADD_ALERT)
+
+    assert DapperFileGenerator().generate(str(sp_folder), output_folder, "App") == []
+    first_outputs = output_files(output_folder)
+    assert "Queries/GetAlerts/GetAlertsQuery.cs" in first_outputs
+    assert "Reports/Commands/AddAlert/AddAlertCommand.cs" in first_outputs
+
+    generator = DapperFileGenerator()
+    generator.generate(str(sp_folder), output_folder, "App")
+    assert generator.write_stats["files_written"] == 0
+
+    os.remove(sp_folder / "reports" / "usp_add_alert.sql")
+    generator.generate(str(sp_folder), output_folder, "App")
+    assert output_files(output_folder) == {output for output in first_outputs if not output.startswith("Reports/")}
+    assert GenerationManifest.read(output_folder)["sources"].keys() == {"usp_get_alerts.sql"}
@@ -0,0 +1,72 @@
+import threading
+import time
+import pytest
+from dapper.generation_pipeline import bounded_stage
+
+
+def test_items_come_in_order_from_another_thread():
+    threads = set()
+
+    def items():
+        for number in range(100):
+            threads.add(threading.current_thread())
+            yield number
+
+    assert list(bounded_stage(items(), 4)) == list(range(100))
+    assert threading.current_thread() not in threads
+
+
+def test_no_buffer_iterates_inline():
+    threads = set()
+
+    def items():
+        threads.add(threading.current_thread())
+        yield from range(3)
+
+    assert list(bounded_stage(items(), 0)) == [0, 1, 2]
+    assert threads == {threading.current_thread()}
+
+
+def test_producer_stays_at_most_the_buffer_ahead():
+    produced = []
+
+    def items():
+        for number in range(50):
+            produced.append(number)
+            yield number
+
+    stage = bounded_stage(items(), 3)
+    assert next(stage) == 0
+    # time for the producer to run as far ahead as it can
+    time.sleep(0.3)
+    # the item consumed, a full buffer and the item waiting to be put
+    assert len(produced) <= 5
+    assert list(stage) == list(range(1, 50))
+
+
+def test_producer_error_is_raised_after_the_items_before_it():
+    def items():
+        yield 1
+        yield 2
+        raise ValueError("unreadable file")
+
+    received = []
+    with pytest.raises(ValueError, match="unreadable file"):
+        for item in bounded_stage(items(), 8):
+            received.append(item)
+    assert received == [1, 2]
+
+
+def test_abandoned_stage_stops_its_thread():
+    def items():
+        number = 0
+        while True:
+            yield number
+            number += 1
+
+    before = threading.active_count()
+    stage = bounded_stage(items(), 2)
+    assert next(stage) == 0
+    stage.close()
+
+    assert threading.active_count() == before
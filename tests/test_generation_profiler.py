@@ -0,0 +1,68 @@
+import json
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.generation_profiler import GenerationProfiler, StageTimings
+
+SP_TEXT = """CREATE PROCEDURE dbo.usp_get_user
+    @id INT
+AS
+SELECT id, name FROM dbo.users WHERE id = @id
+"""
+
+
+def result(source, error=None, **stages):
+    return {"source": source, "error": error, "timings": stages, "counters": {"bytes_read": 10}}
+
+
+def test_stage_timings_add_up_repeated_stages():
+    timings = StageTimings()
+    with timings.stage("parse"):
+        pass
+    with timings.stage("parse"):
+        pass
+    timings.count("tokens_lexed", 5)
+    timings.count("tokens_lexed", 2)
+
+    assert list(timings.stages) == ["parse"]
+    assert timings.stages["parse"] >= 0.0
+    assert timings.counters == {"tokens_lexed": 7}
+
+
+def test_report_keeps_the_slowest_procedures_and_stage_shares():
+    seen = []
+    profiler = GenerationProfiler(slowest=2, timers=[lambda *timing: seen.append(timing)])
+    profiler.add_result(result("a.sql", parse=0.1, render=0.1))
+    profiler.add_result(result("b.sql", parse=0.5, render=0.1))
+    profiler.add_result(result("c.sql", parse=0.3, render=0.1))
+    profiler.add_result(result("d.sql", error="ValueError: bad", parse=0.1))
+
+    report = profiler.report()
+
+    assert report["procedures"] == 4
+    assert report["failed"] == 1
+    assert [entry["source"] for entry in report["slowest"]] == ["b.sql", "c.sql"]
+    assert list(report["stages"]) == ["parse", "render"]
+    assert report["stages"]["parse"]["calls"] == 4
+    assert round(report["stages"]["parse"]["share"] + report["stages"]["render"]["share"], 9) == 1.0
+    assert report["counters"] == {"bytes_read": 40}
+    assert ("parse", "b.sql", 0.5) in seen
+
+
+def test_generation_run_is_profiled(tmp_path):
+    sp_folder = tmp_path / "Sp"
+    sp_folder.mkdir()
+    (sp_folder / "usp_get_user.sql").write_text(SP_TEXT)
+    (sp_folder / "usp_get_order.sql").write_text(SP_TEXT.replace("user", "order"))
+    report_path = str(tmp_path / "report.json")
+
+    with GenerationProfiler(profile=True, trace_memory=True) as profiler:
+        DapperFileGenerator(profiler=profiler).generate(str(sp_folder), str(tmp_path / "out"), "App")
+    profiler.save_report(report_path)
+
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    assert report["procedures"] == 2
+    assert {"read", "decode", "parse", "return_type", "request", "handler", "render", "write"} <= report["stages"].keys()
+    assert report["counters"]["tokens_lexed"] > 0
+    assert report["memory"]["peak_bytes"] > 0
+    assert report["profile"]
+    assert (tmp_path / "report.json.prof").exists()
@@ -0,0 +1,77 @@
+from dapper.output_bundler import BUNDLE_SECTION_MARKER, OutputBundler, join_sections, split_sections
+from dapper.output_writer import OutputWriter
+
+ALERT = "namespace App.Sp.Queries.GetAlert\n{\n    public record GetAlertQuery;\n}\n"
+USER = "namespace App.Sp.Queries.GetUser\n{\n    public record GetUserQuery;\n}\n"
+SITE = "namespace App.Sp.Queries.GetSite\n{\n    public record GetSiteQuery;\n}\n"
+
+
+def read_sections(tmp_path, bundle="Queries.cs"):
+    return split_sections((tmp_path / bundle).read_text(encoding="utf-8"))
+
+
+def test_join_sorts_the_sections_and_split_reads_them_back():
+    content = join_sections({"usp_get_user.sql": USER, "usp_get_alert.sql": ALERT})
+
+    assert content.index(f"{BUNDLE_SECTION_MARKER}usp_get_alert.sql\n") < content.index(f"{BUNDLE_SECTION_MARKER}usp_get_user.sql\n")
+    sections = split_sections(content)
+    assert {source: section.rstrip() for source, section in sections.items()} == \
+        {"usp_get_alert.sql": ALERT.rstrip(), "usp_get_user.sql": USER.rstrip()}
+    # a bundle read back and written again is the same
+    assert join_sections(sections) == content
+
+
+def test_text_before_the_first_section_is_dropped():
+    assert split_sections(f"// header\n{BUNDLE_SECTION_MARKER}a.sql\nclass A;\n") == {"a.sql": "class A;\n"}
+
+
+def test_incremental_run_replaces_and_removes_sections(tmp_path):
+    with OutputWriter(str(tmp_path)) as writer, OutputBundler(writer, set()) as bundler:
+        bundler.write("Queries.cs", "usp_get_alert.sql", ALERT)
+        bundler.write("Queries.cs", "usp_get_user.sql", USER)
+    assert set(read_sections(tmp_path)) == {"usp_get_alert.sql", "usp_get_user.sql"}
+
+    # the next run only knows the changed sources, the others are read back from the bundle
+    with OutputWriter(str(tmp_path)) as writer, OutputBundler(writer, {"Queries.cs"}) as bundler:
+        bundler.write("Queries.cs", "usp_get_user.sql", USER.replace("GetUserQuery", "GetUserByIdQuery"))
+        bundler.write("Queries.cs", "usp_get_site.sql", SITE)
+        bundler.remove("Queries.cs", "usp_get_alert.sql")
+
+    sections = read_sections(tmp_path)
+    assert list(sections) == ["usp_get_site.sql", "usp_get_user.sql"]
+    assert "GetUserByIdQuery" in sections["usp_get_user.sql"]
+
+
+def test_unknown_bundle_is_overwritten(tmp_path):
+    (tmp_path / "Queries.cs").write_text(f"{BUNDLE_SECTION_MARKER}stale.sql\nclass Stale;\n", encoding="utf-8")
+
+    with OutputWriter(str(tmp_path)) as writer, OutputBundler(writer, set()) as bundler:
+        bundler.write("Queries.cs", "usp_get_alert.sql", ALERT)
+
+    assert list(read_sections(tmp_path)) == ["usp_get_alert.sql"]
+
+
+def test_bundle_without_sections_is_deleted(tmp_path):
+    with OutputWriter(str(tmp_path)) as writer, OutputBundler(writer, set()) as bundler:
+        bundler.write("Queries.cs", "usp_get_alert.sql", ALERT)
+
+    with OutputWriter(str(tmp_path)) as writer, OutputBundler(writer, {"Queries.cs"}) as bundler:
+        bundler.remove("Queries.cs", "usp_get_alert.sql")
+
+    assert not (tmp_path / "Queries.cs").exists()
+
+
+def test_pending_sections_are_flushed_past_the_limit(tmp_path):
+    with OutputWriter(str(tmp_path)) as writer:
+        bundler = OutputBundler(writer, set(), max_pending_bytes=len(ALERT) + 1)
+        bundler.write("Queries.cs", "usp_get_alert.sql", ALERT)
+        assert not (tmp_path / "Queries.cs").exists()
+
+        bundler.write("Queries.cs", "usp_get_user.sql", USER)
+        writer.flush()
+        assert set(read_sections(tmp_path)) == {"usp_get_alert.sql", "usp_get_user.sql"}
+
+        # merged with the sections written by the first flush
+        bundler.write("Queries.cs", "usp_get_site.sql", SITE)
+        bundler.flush()
+    assert set(read_sections(tmp_path)) == {"usp_get_alert.sql", "usp_get_site.sql", "usp_get_user.sql"}
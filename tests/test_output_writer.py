@@ -0,0 +1,73 @@
+import os
+import pytest
+from dapper.output_writer import OutputWriter
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("threads", [0, 4])
+def test_files_are_written_and_folders_created_once(tmp_path, threads):
+    with OutputWriter(str(tmp_path), threads=threads, max_pending=2) as writer:
+        for number in range(10):
+            writer.write(os.path.join("Queries", "GetUser", f"File{number}.cs"), f"// {number}\n")
+
+    folder = tmp_path / "Queries" / "GetUser"
+    assert sorted(os.listdir(folder)) == sorted(f"File{number}.cs" for number in range(10))
+    assert read(folder / "File7.cs") == "// 7\n"
+    assert writer.stats["files_written"] == 10
+    assert writer.stats["folders_created"] == 1
+
+
+def test_rewrite_replaces_the_file_without_leaving_temp_files(tmp_path):
+    with OutputWriter(str(tmp_path)) as writer:
+        writer.write("GetUser.cs", "old")
+        writer.write("GetUser.cs", "new")
+
+    assert os.listdir(tmp_path) == ["GetUser.cs"]
+    assert read(tmp_path / "GetUser.cs") == "new"
+
+
+def test_failed_write_keeps_the_old_file(tmp_path, monkeypatch):
+    writer = OutputWriter(str(tmp_path))
+    writer.write("GetUser.cs", "old")
+
+    def fail_replace(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail_replace)
+    with pytest.raises(OSError):
+        writer.write("GetUser.cs", "new")
+
+    assert os.listdir(tmp_path) == ["GetUser.cs"]
+    assert read(tmp_path / "GetUser.cs") == "old"
+
+
+def test_thread_pool_write_error_is_raised_on_close(tmp_path):
+    writer = OutputWriter(str(tmp_path), threads=2)
+    # a folder where the file should go can't be replaced by the temp file
+    (tmp_path / "GetUser.cs").mkdir()
+    writer.write("GetUser.cs", "content")
+
+    with pytest.raises(OSError):
+        writer.close()
+
+
+def test_remove_deletes_the_empty_folder(tmp_path):
+    with OutputWriter(str(tmp_path)) as writer:
+        writer.write(os.path.join("Commands", "AddUser", "AddUserCommand.cs"), "command")
+        writer.write(os.path.join("Commands", "AddUser", "AddUserHandler.cs"), "handler")
+
+        writer.remove(os.path.join("Commands", "AddUser", "AddUserCommand.cs"))
+        assert os.listdir(tmp_path / "Commands" / "AddUser") == ["AddUserHandler.cs"]
+
+        writer.remove(os.path.join("Commands", "AddUser", "AddUserHandler.cs"))
+        assert not (tmp_path / "Commands" / "AddUser").exists()
+
+        # the folder is created again for a later write
+        writer.write(os.path.join("Commands", "AddUser", "AddUserCommand.cs"), "command")
+
+    assert writer.stats["files_removed"] == 2
+    assert read(tmp_path / "Commands" / "AddUser" / "AddUserCommand.cs") == "command"
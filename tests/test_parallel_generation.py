@@ -0,0 +1,32 @@
+import os
+from benchmarks.sp_corpus import write_corpus_folder
+from dapper.dapper_file_generator import DapperFileGenerator
+
+
+def read_tree(folder: str) -> dict[str, bytes]:
+    tree = {}
+    for root, _, files in os.walk(folder):
+        for file in files:
+            path = os.path.join(root, file)
+            with open(path, 'rb') as tree_file:
+                tree[os.path.relpath(path, folder).replace(os.sep, '/')] = tree_file.read()
+    return tree
+
+
+def test_worker_processes_write_the_same_files_as_one_process(tmp_path):
+    sp_folder = str(tmp_path / "sp")
+    write_corpus_folder(sp_folder, 40)
+    # a broken script is reported the same way by a worker
+    with open(os.path.join(sp_folder, "broken.sql"), 'w') as broken_file:
+        broken_file.write("CREATE PROCEDURE\n")
+
+    serial_errors = DapperFileGenerator(workers=1, incremental=False).generate(sp_folder, str(tmp_path / "serial"), "App")
+    # small chunks so the files are spread over both workers and come back out of order
+    parallel_errors = DapperFileGenerator(workers=2, chunk_size=3, incremental=False).generate(
+        sp_folder, str(tmp_path / "parallel"), "App")
+
+    serial = read_tree(str(tmp_path / "serial"))
+    assert len(serial) > 40
+    assert read_tree(str(tmp_path / "parallel")) == serial
+    assert [os.path.basename(error["file"]) for error in serial_errors] == ["broken.sql"]
+    assert [error["file"] for error in parallel_errors] == [error["file"] for error in serial_errors]
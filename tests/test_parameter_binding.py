@@ -0,0 +1,43 @@
+from dapper.dapper_file_generator import DapperFileGenerator
+
+SP_TEXT = """CREATE PROCEDURE dbo.usp_alert_acknowledge_alert
+    @alert_trigger_id BIGINT,
+    @user_id INT,
+    @is_silent BIT = 0
+AS
+UPDATE dbo.alert_triggers SET acknowledged_by = @user_id WHERE alert_trigger_id = @alert_trigger_id
+"""
+
+
+def render_handler(sp_text):
+    return next(content for path, content in DapperFileGenerator.render_text(sp_text, "Sp", "App")
+                if path.endswith("Handler.cs"))
+
+
+def test_input_parameters_are_an_anonymous_object():
+    handler = render_handler(SP_TEXT)
+
+    assert """        var parameters = new
+        {
+            alert_trigger_id = request.AlertTriggerId,
+            user_id = request.UserId,
+            is_silent = request.IsSilent
+        };
+""" in handler
+    assert "DynamicParameters" not in handler
+
+
+def test_procedure_without_parameters_passes_an_empty_object():
+    handler = render_handler("CREATE PROCEDURE dbo.usp_get_users AS SELECT id, name FROM dbo.users")
+
+    assert "var parameters = new { };" in handler
+    assert "DynamicParameters" not in handler
+
+
+def test_output_parameters_use_dynamic_parameters():
+    handler = render_handler(SP_TEXT.replace("@is_silent BIT = 0", "@acknowledged_count INT OUTPUT"))
+
+    assert "var parameters = new DynamicParameters();" in handler
+    assert 'parameters.Add("@alert_trigger_id", request.AlertTriggerId, DbType.Int64, ParameterDirection.Input);' in handler
+    assert 'parameters.Add("@acknowledged_count", dbType: DbType.Int32, direction: ParameterDirection.Output);' in handler
+    assert 'parameters.Get<int>("@acknowledged_count")' in handler
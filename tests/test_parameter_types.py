@@ -0,0 +1,33 @@
+from dapper.dapper_file_generator import DapperFileGenerator
+
+
+def render_handler(params):
+    sp_text = f"CREATE PROCEDURE dbo.usp_update_site\n    {params}\nAS\nUPDATE dbo.sites SET updated = 1"
+    return next(content for path, content in DapperFileGenerator.render_text(sp_text, "Sp", "App")
+                if path.endswith("Handler.cs"))
+
+
+def test_strings_are_sent_with_their_declared_length():
+    handler = render_handler("@email VARCHAR(255), @name NVARCHAR(60), @notes NVARCHAR(MAX), @code CHAR(3)")
+
+    assert "email = new DbString { Value = request.Email, IsAnsi = true, Length = 255 }" in handler
+    assert "name = new DbString { Value = request.Name, Length = 60 }" in handler
+    assert "notes = new DbString { Value = request.Notes, Length = -1 }" in handler
+    assert "code = new DbString { Value = request.Code, IsAnsi = true, IsFixedLength = true, Length = 3 }" in handler
+
+
+def test_exact_types_use_dynamic_parameters():
+    handler = render_handler("@site_id INT, @weight DECIMAL(18, 2), @opened DATE, @changed DATETIME2(3), @name VARCHAR(20)")
+
+    assert "var parameters = new DynamicParameters();" in handler
+    assert 'parameters.Add("@site_id", request.SiteId, DbType.Int32, ParameterDirection.Input);' in handler
+    assert 'parameters.Add("@weight", request.Weight, DbType.Decimal, ParameterDirection.Input, precision: 18, scale: 2);' in handler
+    assert 'parameters.Add("@opened", request.Opened, DbType.Date, ParameterDirection.Input);' in handler
+    assert 'parameters.Add("@changed", request.Changed, DbType.DateTime2, ParameterDirection.Input, scale: 3);' in handler
+    assert 'parameters.Add("@name", request.Name, DbType.AnsiString, ParameterDirection.Input, size: 20);' in handler
+
+
+def test_output_parameters_keep_their_size():
+    handler = render_handler("@site_id INT, @site_name NVARCHAR(60) OUTPUT")
+
+    assert 'parameters.Add("@site_name", dbType: DbType.String, direction: ParameterDirection.Output, size: 60);' in handler
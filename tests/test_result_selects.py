@@ -0,0 +1,118 @@
+from dapper.dapper_return_type_generator import DapperReturnTypeGenerator
+from dapper.stored_procedure import StoredProcedure
+
+
+def result_selects(body: str) -> list[dict]:
+    return StoredProcedure(f"CREATE PROCEDURE dbo.usp_get_alerts @alert_id INT\nAS\n{body}").result_selects
+
+
+def column_names(select: dict) -> list[str]:
+    return [column[-1].name() for column in select["columns"]]
+
+
+def test_top_level_selects_are_result_sets():
+    selects = result_selects("SELECT TOP 1 alert_id, title FROM dbo.tblAlert; SELECT user_id FROM dbo.tblUser")
+
+    assert [column_names(select) for select in selects] == [["alert_id", "title"], ["user_id"]]
+    assert selects[0]["top"] == "1"
+    assert not any(select["conditional"] for select in selects)
+
+
+def test_selects_not_returning_rows_are_skipped():
+    selects = result_selects("""
+        DECLARE @count INT
+        SELECT @count = COUNT(*) FROM dbo.tblAlert
+        INSERT INTO dbo.tblLog (message) SELECT title FROM dbo.tblAlert
+        SELECT alert_id INTO #alerts FROM dbo.tblAlert
+        IF EXISTS (SELECT 1 FROM #alerts) PRINT 'alerts'
+        SELECT alert_id FROM dbo.tblAlert UNION ALL SELECT alert_id FROM dbo.tblArchivedAlert
+    """)
+
+    assert [column_names(select) for select in selects] == [["alert_id"]]
+
+
+def test_case_expression_does_not_end_the_select():
+    selects = result_selects("SELECT CASE WHEN is_read = 1 THEN 'read' ELSE 'new' END AS status FROM dbo.tblAlert")
+
+    assert [column_names(select) for select in selects] == [["status"]]
+    assert not selects[0]["conditional"]
+
+
+def test_if_else_selects_are_conditional():
+    selects = result_selects("""
+        IF @alert_id = 1
+            SELECT title FROM dbo.tblAlert
+        ELSE
+            SELECT user_name FROM dbo.tblUser
+    """)
+
+    assert [column_names(select) for select in selects] == [["title"], ["user_name"]]
+    assert all(select["conditional"] for select in selects)
+
+
+def test_if_else_blocks_and_loops_are_conditional():
+    selects = result_selects("""
+        BEGIN
+            IF @alert_id IS NULL
+            BEGIN
+                SELECT title FROM dbo.tblAlert
+            END
+            ELSE BEGIN
+                SELECT user_name FROM dbo.tblUser
+            END
+            WHILE @alert_id < 10
+                SELECT @alert_id AS alert_id
+        END
+    """)
+
+    assert [select["conditional"] for select in selects] == [True, True, True]
+
+
+def test_select_after_a_single_statement_branch_always_runs():
+    selects = result_selects("""
+        IF @alert_id IS NULL SET @alert_id = 0;
+        SELECT title FROM dbo.tblAlert
+        SELECT user_name FROM dbo.tblUser
+    """)
+
+    assert [select["conditional"] for select in selects] == [False, False]
+
+
+def test_select_after_a_conditional_return_may_not_run():
+    selects = result_selects("""
+        IF @alert_id IS NULL RETURN
+        SELECT title FROM dbo.tblAlert
+    """)
+
+    assert [select["conditional"] for select in selects] == [True]
+
+
+def test_try_runs_in_sequence_and_catch_is_conditional():
+    selects = result_selects("""
+        BEGIN TRY
+            SELECT title FROM dbo.tblAlert
+        END TRY
+        BEGIN CATCH
+            SELECT ERROR_MESSAGE() AS error_message
+        END CATCH
+    """)
+
+    assert [select["conditional"] for select in selects] == [False, True]
+
+
+def test_sequential_selects_are_multiple_result_sets():
+    sp = StoredProcedure("CREATE PROCEDURE dbo.usp_get_alerts @alert_id INT\nAS\n"
+                         "SELECT title FROM dbo.tblAlert SELECT user_name FROM dbo.tblUser")
+
+    assert DapperReturnTypeGenerator(sp).has_multiple_result_sets
+
+
+def test_if_else_procedure_falls_back_to_a_single_result_set():
+    sp = StoredProcedure("CREATE PROCEDURE dbo.usp_get_alerts @alert_id INT\nAS\n"
+                         "IF @alert_id = 1 SELECT title FROM dbo.tblAlert ELSE SELECT user_name FROM dbo.tblUser")
+    return_type_generator = DapperReturnTypeGenerator(sp)
+
+    assert not return_type_generator.has_multiple_result_sets
+    assert return_type_generator.return_type[0] == "List<GetAlertsResult>"
+    assert "Title" in return_type_generator.return_type[1]
+    assert len(return_type_generator.get_result_sets_ir()) == 1
@@ -0,0 +1,85 @@
+import pytest
+from dapper.schema_index import ColumnInfo, SchemaIndex, build_schema_index
+from dapper.sql_lexer import tokenize
+
+TABLES = """CREATE TABLE dbo.tblUser (
+    user_id INT IDENTITY(1, 1) NOT NULL,
+    email NVARCHAR(255) NULL,
+    balance DECIMAL(18, 2) NOT NULL,
+    CONSTRAINT pk_user PRIMARY KEY (user_id)
+)
+GO
+CREATE TABLE dbo.tblOrder (
+    order_id INT NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    note VARCHAR(MAX)
+)
+GO
+"""
+
+VIEW = """CREATE VIEW dbo.vwUserEmail (id, address)
+AS
+SELECT u.user_id, u.email FROM dbo.tblUser u
+GO
+"""
+
+
+@pytest.fixture
+def schema_index(tmp_path):
+    (tmp_path / "tables").mkdir()
+    (tmp_path / "tables" / "user_and_order.sql").write_text(TABLES)
+    (tmp_path / "views" / "users").mkdir(parents=True)
+    (tmp_path / "views" / "users" / "vw_user_email.sql").write_text(VIEW)
+    return build_schema_index([str(tmp_path / "tables"), str(tmp_path / "views")])
+
+
+def resolve(schema_index, expression, tables):
+    return schema_index.resolve(tokenize(expression), tables)
+
+
+def test_tables_are_indexed(schema_index):
+    assert schema_index.column("TBLUSER", "Email") == ColumnInfo("NVARCHAR", True, 255)
+    assert schema_index.column("tblUser", "user_id").nullable is False
+    assert schema_index.column("tblUser", "balance") == ColumnInfo("DECIMAL", False, None, 18, 2)
+    assert schema_index.column("tblOrder", "note").length == -1
+    assert [column for column, _ in schema_index.table_columns("tblOrder")] == ["order_id", "user_id", "note"]
+
+
+def test_views_in_sub_folders_are_typed_from_their_tables(schema_index):
+    assert schema_index.column("vwUserEmail", "address") == ColumnInfo("NVARCHAR", True, 255)
+    assert schema_index.column("vwUserEmail", "id").sql_type == "INT"
+
+
+def test_resolve_column_references(schema_index):
+    tables = {"u": "tblUser", "tbluser": "tblUser", "o": "tblOrder", "tblorder": "tblOrder"}
+
+    assert resolve(schema_index, "u.email", tables).sql_type == "NVARCHAR"
+    assert resolve(schema_index, "dbo.tblOrder.note", tables).sql_type == "VARCHAR"
+    assert resolve(schema_index, "balance", tables).sql_type == "DECIMAL"
+    # in both tables of the FROM clause
+    assert resolve(schema_index, "user_id", tables) is None
+    assert resolve(schema_index, "missing", tables) is None
+    assert resolve(schema_index, "u.email + 'x'", tables) is None
+
+
+def test_resolve_functions(schema_index):
+    tables = {"u": "tblUser", "tbluser": "tblUser"}
+
+    assert resolve(schema_index, "COUNT(*)", tables) == ColumnInfo("INT", False, None)
+    assert resolve(schema_index, "CAST(u.balance AS INT)", tables) == ColumnInfo("INT", False, None)
+    assert resolve(schema_index, "CAST(u.email AS VARCHAR(20))", tables) == ColumnInfo("VARCHAR", True, 20)
+    assert resolve(schema_index, "CONVERT(BIGINT, u.user_id)", tables).nullable is False
+    assert resolve(schema_index, "TRY_CONVERT(BIGINT, u.user_id)", tables).nullable is True
+    assert resolve(schema_index, "ISNULL(u.email, '')", tables) == ColumnInfo("NVARCHAR", False, 255)
+    assert resolve(schema_index, "COALESCE(u.email, u.email)", tables).nullable is True
+    assert resolve(schema_index, "SUM(u.balance)", tables) is None
+
+
+def test_save_and_load(schema_index, tmp_path):
+    index_path = str(tmp_path / "schema.json")
+    schema_index.save(index_path)
+
+    loaded = SchemaIndex.load(index_path)
+
+    assert loaded.columns == schema_index.columns
+    assert loaded.source_hash
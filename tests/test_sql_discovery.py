@@ -0,0 +1,50 @@
+import pytest
+from dapper.sql_discovery import parse_shard, shard_index, iter_sql_files
+
+
+def test_shard_index_is_stable_and_in_range():
+    paths = [f"reports/usp_get_report_{number}.sql" for number in range(200)]
+    indexes = [shard_index(path, 4) for path in paths]
+
+    assert indexes == [shard_index(path, 4) for path in paths]
+    assert set(indexes) == {1, 2, 3, 4}
+    # sha256 based, the same on every machine and in every process
+    assert shard_index("usp_get_alerts.sql", 4) == 1
+
+
+def test_single_shard_holds_every_file():
+    assert {shard_index(f"{number}.sql", 1) for number in range(50)} == {1}
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for shard in ("0/4", "5/4", "2", "a/b", "1/0"):
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+@pytest.fixture
+def sp_folder(tmp_path):
+    for relative_path in ("usp_b.sql", "usp_a.sql", "notes.txt", "reports/usp_c.sql", "reports/daily/usp_d.sql",
+                          "archive/usp_old.sql"):
+        path = tmp_path.joinpath(*relative_path.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("SELECT 1")
+    return str(tmp_path)
+
+
+def test_files_of_a_folder_come_before_its_sub_folders(sp_folder):
+    assert list(iter_sql_files(sp_folder)) == [
+        "usp_a.sql", "usp_b.sql", "archive/usp_old.sql", "reports/usp_c.sql", "reports/daily/usp_d.sql"]
+
+
+def test_include_and_exclude_globs(sp_folder):
+    assert list(iter_sql_files(sp_folder, include=["reports/*"], exclude=["*/daily/*"])) == ["reports/usp_c.sql"]
+    assert "archive/usp_old.sql" not in iter_sql_files(sp_folder, exclude=["archive"])
+
+
+def test_shards_split_the_files_without_overlap(sp_folder):
+    all_files = list(iter_sql_files(sp_folder))
+    shards = [list(iter_sql_files(sp_folder, shard=(index, 3))) for index in (1, 2, 3)]
+
+    assert sorted(file for shard in shards for file in shard) == sorted(all_files)
@@ -0,0 +1,61 @@
+from dapper import sql_dump_reader
+from dapper.sql_dump_reader import iter_batches, iter_lines, iter_procedures
+
+DUMP = """SET NOCOUNT ON
+GO
+-- a header comment
+CREATE PROCEDURE dbo.usp_get_first
+    @id INT
+AS
+SELECT 'line one
+GO
+line two' AS text
+go
+/* the next GO is commented out
+GO
+*/
+CREATE PROCEDURE [dbo].[usp_get_second]
+AS
+SELECT [weird
+GO
+name] FROM dbo.items -- GO here doesn't split either
+GO 2
+CREATE TABLE dbo.items (id INT)
+GO
+"""
+
+
+def write_dump(tmp_path, text, encoding="utf-8"):
+    path = tmp_path / "dump.sql"
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_go_inside_a_string_comment_or_identifier_doesnt_split(tmp_path):
+    procedures = list(iter_procedures(write_dump(tmp_path, DUMP)))
+
+    assert [(line, sp.procedure_name) for line, sp in procedures] == [(3, "usp_get_first"), (11, "usp_get_second")]
+    assert "line two' AS text" in procedures[0][1].sp_text
+    assert "name] FROM dbo.items" in procedures[1][1].sp_text
+
+
+def test_batches_without_a_procedure_are_skipped(tmp_path):
+    batches = list(iter_batches(write_dump(tmp_path, DUMP)))
+
+    assert len(batches) == 4
+    assert batches[0] == (1, "SET NOCOUNT ON\n")
+    assert batches[-1] == (20, "CREATE TABLE dbo.items (id INT)\n")
+
+
+def test_lines_are_the_same_across_chunks(tmp_path, monkeypatch):
+    path = write_dump(tmp_path, "SELECT 'é'\r\nGO\r\nSELECT 'ü'", "utf-16")
+    expected = list(iter_lines(path))
+
+    # a tiny chunk splits lines and the two byte characters between memory map reads
+    monkeypatch.setattr(sql_dump_reader, "READ_CHUNK_SIZE", 3)
+
+    assert list(iter_lines(path)) == expected == ["SELECT 'é'\n", "GO\n", "SELECT 'ü'"]
+
+
+def test_empty_file(tmp_path):
+    assert list(iter_procedures(write_dump(tmp_path, ""))) == []
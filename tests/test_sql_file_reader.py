@@ -0,0 +1,41 @@
+import codecs
+from dapper.sql_file_reader import decode_sql_bytes, detect_stream_encoding
+
+SCRIPT = "-- Liste des alertes, créée par René\r\nCREATE PROCEDURE dbo.usp_get_alerts AS SELECT 1\r\n"
+TEXT = SCRIPT.replace("\r\n", "\n")
+
+
+def test_byte_order_marks_win():
+    assert decode_sql_bytes(codecs.BOM_UTF8 + SCRIPT.encode("utf-8")) == (TEXT, "utf-8")
+    assert decode_sql_bytes(codecs.BOM_UTF16_LE + SCRIPT.encode("utf-16-le")) == (TEXT, "utf-16-le")
+    # the utf-32 BOM starts with the utf-16 one
+    assert decode_sql_bytes(codecs.BOM_UTF32_LE + SCRIPT.encode("utf-32-le")) == (TEXT, "utf-32-le")
+
+
+def test_utf8_without_bom():
+    assert decode_sql_bytes(SCRIPT.encode("utf-8")) == (TEXT, "utf-8")
+
+
+def test_cp1252_is_detected():
+    # the quotes and the euro sign only exist in cp1252
+    script = SCRIPT.replace("René", "René, “coût” 10 €") * 20
+    text, encoding = decode_sql_bytes(script.encode("cp1252"))
+
+    assert text == script.replace("\r\n", "\n")
+    assert codecs.lookup(encoding).name == "cp1252"
+
+
+def test_encoding_hint_is_used_when_utf8_fails():
+    assert decode_sql_bytes(SCRIPT.encode("cp1252"), encoding_hint="cp1252") == (TEXT, "cp1252")
+
+
+def test_ascii_script_is_utf8():
+    assert decode_sql_bytes(b"SELECT 1\r\n") == ("SELECT 1\n", "utf-8")
+
+
+def test_stream_encoding_tolerates_a_head_cut_in_a_character():
+    head = SCRIPT.encode("utf-8")
+    cut = head[:head.index("é".encode("utf-8")) + 1]
+
+    assert detect_stream_encoding(cut) == ("utf-8", 0)
+    assert detect_stream_encoding(codecs.BOM_UTF8 + head) == ("utf-8", 3)
@@ -0,0 +1,45 @@
+from dapper.sql_lexer import tokenize, split_top_level, tokens_to_text, WORD, VARIABLE, STRING, IDENTIFIER, NUMBER, \
+    PUNCT, COMMENT, GO
+
+
+def kinds_and_values(text: str) -> list[tuple[str, str]]:
+    return [(token.kind, token.value) for token in tokenize(text)]
+
+
+def test_tokens_have_their_kind():
+    assert kinds_and_values("SELECT [alert id], @site_name, N'it''s', 1.5e3 FROM dbo.tblAlert") == [
+        (WORD, "SELECT"), (IDENTIFIER, "[alert id]"), (PUNCT, ","), (VARIABLE, "@site_name"), (PUNCT, ","),
+        (STRING, "N'it''s'"), (PUNCT, ","), (NUMBER, "1.5e3"), (WORD, "FROM"), (WORD, "dbo"), (PUNCT, "."),
+        (WORD, "tblAlert")]
+
+
+def test_keywords_in_strings_and_comments_are_not_words():
+    tokens = tokenize("SELECT 'FROM x' -- SELECT y\n/* outer /* nested */ still a comment */ AS title")
+
+    assert [token.kind for token in tokens] == [WORD, STRING, COMMENT, COMMENT, WORD, WORD]
+    assert tokens[3].value == "/* outer /* nested */ still a comment */"
+
+
+def test_go_on_its_own_line_starts_a_batch():
+    tokens = tokenize("SELECT 1\nGO\nSELECT go_live FROM t\n  go 2 -- twice\nSELECT 2")
+
+    assert [token.value for token in tokens if token.kind == GO] == ["GO", "go 2 -- twice"]
+    assert [token.batch for token in tokens if token.kind == WORD and token.is_word("SELECT")] == [0, 1, 2]
+    # GO inside a line is a word
+    assert any(token.kind == WORD and token.value == "go_live" for token in tokens)
+
+
+def test_names_are_read_without_brackets_or_quotes():
+    names = [token.name() for token in tokenize("[dbo] \"user id\" N'total'")]
+
+    assert names == ["dbo", "user id", "total"]
+
+
+def test_split_top_level_ignores_nested_separators():
+    parts = split_top_level(tokenize("alert_id, ISNULL(title, ''), COUNT(*)"))
+
+    assert [tokens_to_text(part) for part in parts] == ["alert_id", "ISNULL(title, '')", "COUNT(*)"]
+
+
+def test_tokens_to_text_joins_names_and_calls():
+    assert tokens_to_text(tokenize("dbo . tblAlert ( alert_id , title ) -- dropped")) == "dbo.tblAlert(alert_id, title)"
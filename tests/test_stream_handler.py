@@ -0,0 +1,43 @@
+from dapper.dapper_file_generator import DapperFileGenerator
+
+SP_TEXT = """-- @dapper:stream
+CREATE PROCEDURE dbo.usp_get_report_rows
+    @site_id INT
+AS
+SELECT id, name FROM dbo.report_rows WHERE site_id = @site_id
+"""
+
+
+def render(sp_text, **options):
+    return {path.rsplit("/", 1)[-1]: content
+            for path, content in DapperFileGenerator.render_text(sp_text, "Sp", "App", **options)}
+
+
+def test_stream_annotation_generates_a_stream_query():
+    outputs = render(SP_TEXT)
+
+    assert "public record GetReportRowsQuery : IStreamQuery<GetReportRowsResult>" in outputs["GetReportRowsQuery.cs"]
+    handler = outputs["GetReportRowsHandler.cs"]
+    assert ": IStreamQueryHandler<GetReportRowsQuery, GetReportRowsResult>" in handler
+    assert "public async IAsyncEnumerable<GetReportRowsResult> Handle(GetReportRowsQuery request, " \
+           "[EnumeratorCancellation] CancellationToken cancellationToken)" in handler
+    assert "connection.QueryUnbufferedAsync<GetReportRowsResult>(" in handler
+    assert '"[dbo].[usp_get_report_rows]"' in handler
+    assert "rows.WithCancellation(cancellationToken)" in handler
+    assert "ToList()" not in handler
+
+
+def test_stream_annotation_pattern():
+    outputs = render(SP_TEXT.replace("-- @dapper:stream\n", ""), annotation_patterns={"usp_get_report_*": "stream"})
+
+    assert "QueryUnbufferedAsync" in outputs["GetReportRowsHandler.cs"]
+
+
+def test_single_row_query_and_command_ignore_the_annotation():
+    single_row = render(SP_TEXT.replace("SELECT id", "SELECT TOP 1 id"))
+    command = render(SP_TEXT.replace("usp_get_report_rows", "usp_delete_report_rows")
+                     .replace("SELECT id, name FROM", "DELETE FROM"))
+
+    assert "IStreamQuery" not in single_row["GetReportRowsQuery.cs"]
+    assert "QueryFirstOrDefaultAsync<GetReportRowsResult>" in single_row["GetReportRowsHandler.cs"]
+    assert not any("IStream" in content for content in command.values())
@@ -0,0 +1,24 @@
+import pytest
+from dapper.procedure_ir import ParamIR
+from dapper.table_valued_param import TableValuedParam
+
+
+def table_valued_param(table_type: str) -> TableValuedParam:
+    return TableValuedParam(ParamIR("tblLocationIds", table_type.upper(), table_type=table_type))
+
+
+@pytest.mark.parametrize("table_type, sql_type", [
+    ("tpIntTable", "INT"),
+    ("tpBigIntTable", "BIGINT"),
+    ("dbo.tpStringTable", "NVARCHAR"),
+    ("tp_guid_list", "UNIQUEIDENTIFIER"),
+    ("tpDateTimeTable", "DATETIME2"),
+])
+def test_column_is_guessed_from_the_words_of_the_type_name(table_type, sql_type):
+    assert table_valued_param(table_type).columns[0][1].sql_type == sql_type
+
+
+@pytest.mark.parametrize("table_type", ["tpPointTable", "PrintJobList", "tpHintTable"])
+def test_type_name_containing_a_type_inside_a_word_is_refused(table_type):
+    with pytest.raises(ValueError, match=table_type):
+        table_valued_param(table_type)
@@ -0,0 +1,65 @@
+import io
+import pytest
+from dapper.dapper_file_generator import DapperFileGenerator
+from dapper.template_engine import Template, Templates
+
+SP_TEXT = """CREATE PROCEDURE dbo.usp_get_user
+    @id INT
+AS
+SELECT id, name FROM dbo.users WHERE id = @id
+"""
+
+
+def test_template_is_compiled_into_literals_and_fields():
+    template = Template("greeting", "Hello {{ name }}, {{count}} new{{count}}")
+
+    assert template.literals == ["Hello ", ", ", " new", ""]
+    assert template.fields == ["name", "count", "count"]
+    assert template.render(name="Ada", count=2) == "Hello Ada, 2 new2"
+
+
+def test_render_to_writes_the_same_text():
+    template = Template("greeting", "Hello {{name}}!")
+    stream = io.StringIO()
+
+    template.render_to(stream, name="Ada")
+
+    assert stream.getvalue() == template.render(name="Ada")
+
+
+def test_missing_field_is_an_error():
+    with pytest.raises(ValueError, match="greeting.*{{name}}"):
+        Template("greeting", "Hello {{name}}").render(count=1)
+
+
+def test_render_each_joins_the_contexts():
+    templates = Templates()
+
+    properties = templates.render_each("property", [{"type": "int", "name": "Id"}, {"type": "string", "name": "Name"}])
+
+    assert properties == templates.get("property").render(type="int", name="Id") \
+        + templates.get("property").render(type="string", name="Name")
+
+
+def test_template_folder_overrides_a_default(tmp_path):
+    defaults = Templates()
+    (tmp_path / "property.cs.template").write_text("    public {{type}} {{name}} { get; set; }\n", encoding="utf-8")
+
+    templates = Templates(str(tmp_path))
+
+    assert templates.get("property").render(type="int", name="Id") == "    public int Id { get; set; }\n"
+    # the other templates are the defaults and the hash tells the outputs apart
+    assert templates.get("handler").literals == defaults.get("handler").literals
+    assert templates.source_hash != defaults.source_hash
+    assert Templates(str(tmp_path)).source_hash == templates.source_hash
+
+
+def test_override_changes_the_generated_classes(tmp_path):
+    (tmp_path / "property.cs.template").write_text("    public {{type}} {{name}} { get; set; }\n", encoding="utf-8")
+
+    default_outputs = dict(DapperFileGenerator.render_text(SP_TEXT, "Sp", "App"))
+    outputs = dict(DapperFileGenerator.render_text(SP_TEXT, "Sp", "App", template_folder=str(tmp_path)))
+
+    assert outputs.keys() == default_outputs.keys()
+    assert any("{ get; set; }" in content for content in outputs.values())
+    assert not any("{ get; set; }" in content for content in default_outputs.values())